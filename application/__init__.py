@@ -4,19 +4,33 @@ import os
 import redis
 from flask import Flask
 from flask_compress import Compress
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from dotenv import load_dotenv
 
 # Load the environment variables from the .env file
 load_dotenv()
 
-from application.constants.app_constants import DATABASE_CONFIG_KEY, METRICS_CONFIG_KEY, USERS_CONFIG_KEY
+from application.commands.cli_commands import CLI_BLUEPRINT
+from application.constants.app_constants import (
+    DATABASE_CONFIG_KEY,
+    METRICS_CONFIG_KEY,
+    PRICE_DROPS_CONFIG_KEY,
+    RATE_LIMITER_CONFIG_KEY,
+    REDIS_POOL_TIMEOUT_SECONDS,
+    USERS_CONFIG_KEY,
+)
+from application.data.connection_pools import get_pool_size
 from application.data.custom_json_encoder import CustomJsonEncoder
 from application.data.dao import ApplicationDao
 from application.data.metrics import Metrics
+from application.data.price_drops import PriceDrops
+from application.data.price_export import EXPORT_FORMATS
+from application.data.rate_limiter import RateLimiter
 from application.data.users import Users
 from application.routes.api_routes import API_BLUEPRINT
 from application.routes.html_routes import HTML_BLUEPRINT
+from application.routes.request_tracing import init_request_tracing
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("engineio.server").setLevel(logging.WARNING)
@@ -31,8 +45,18 @@ def create_flask_app() -> Flask:
     # Create the flask app
     app = Flask(__name__)
 
-    # Enable gzip compression for requests
-    COMPRESS.init_app(app)
+    # Enable gzip compression for requests, including streamed price exports, and trace how long each request takes
+    app.config["COMPRESS_MIMETYPES"] = [
+        "text/html",
+        "text/css",
+        "text/xml",
+        "application/json",
+        "application/javascript",
+        *EXPORT_FORMATS.values(),
+    ]
+    # Streamed responses are compressed a chunk at a time, with gzip too for clients which accept nothing better
+    app.config["COMPRESS_ALGORITHM_STREAMING"] = ["zstd", "br", "gzip", "deflate"]
+    init_request_tracing(app, COMPRESS)
 
     # Set custom JSON encoder to handle MongoDB ObjectID
     app.json_encoder = CustomJsonEncoder
@@ -43,7 +67,11 @@ def create_flask_app() -> Flask:
 
     redis_url = os.environ.get("REDIS_DATA_URL")
     if redis_url:
-        cache = redis.Redis.from_url(redis_url)
+        # Requests wait briefly for a free connection rather than failing when every connection is in use
+        connection_pool = redis.BlockingConnectionPool.from_url(
+            redis_url, max_connections=get_pool_size("REDIS"), timeout=REDIS_POOL_TIMEOUT_SECONDS
+        )
+        cache = redis.Redis(connection_pool=connection_pool)
         cache.ping()
         LOG.info("Using Redis cache for data")
     else:
@@ -55,11 +83,20 @@ def create_flask_app() -> Flask:
     users = Users(dao=dao)
     app.config[USERS_CONFIG_KEY] = users
 
+    app.config[RATE_LIMITER_CONFIG_KEY] = RateLimiter(cache=dao.cache.client)
+    app.config[PRICE_DROPS_CONFIG_KEY] = PriceDrops(dao=dao)
+
+    # When behind proxies, trust them to give the client address so clients can be rate limited separately
+    trusted_proxies = int(os.environ.get("TRUSTED_PROXIES", 0))
+    if trusted_proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies)
+
     # This must be set in the environment as a secret
     app.secret_key = os.environ["SECRET_KEY"]
 
     # Register blueprints to add routes to the app
     app.register_blueprint(HTML_BLUEPRINT)
     app.register_blueprint(API_BLUEPRINT)
+    app.register_blueprint(CLI_BLUEPRINT)
 
     return app
@@ -0,0 +1,204 @@
+import datetime
+import gzip
+import logging
+import sys
+import time
+
+import click
+from flask import Blueprint, current_app
+
+from application.constants.app_constants import (
+    DATABASE_CONFIG_KEY,
+    EXPORT_BATCH_SIZE,
+    FAVORITES_DIGEST_BATCH_SIZE,
+    FAVORITES_DIGEST_DEFAULT_DAYS,
+    PRICE_DROPS_BATCH_SIZE,
+    PRICE_DROPS_CONFIG_KEY,
+    PRERENDER_BATCH_SIZE,
+    PRICE_STATS_BATCH_SIZE,
+    USERS_CONFIG_KEY,
+)
+from application.data.cache import OTHER_FAMILY_NAME
+from application.data.dao import ApplicationDao
+from application.data.price_drops import PriceDrops
+from application.data.price_export import EXPORT_FORMATS, iter_export_chunks
+from application.data.users import Users
+from application.routes.prerender import prerender
+
+LOG = logging.getLogger(__name__)
+
+# Commands are registered at the top level of the flask CLI, e.g. `flask --app application export-prices`
+CLI_BLUEPRINT = Blueprint("commands", __name__, cli_group=None)
+
+
+@CLI_BLUEPRINT.cli.command("export-prices")
+@click.option("--format", "export_format", type=click.Choice(list(EXPORT_FORMATS)), default="ndjson")
+@click.option("--category-id", type=int, default=None, help="Only export products in this category.")
+@click.option("--product-id", "product_ids", type=int, multiple=True, help="Only export these products.")
+@click.option("--output", type=click.Path(dir_okay=False), default="-", help="File to write, gzipped if ending .gz.")
+@click.option("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Documents fetched per database round trip.")
+def export_prices_command(export_format: str, category_id: int, product_ids: tuple, output: str, batch_size: int):
+    """Export price histories as NDJSON or CSV."""
+    counter = _CountingIterator(
+        _get_dao().iter_price_documents(
+            product_ids=list(product_ids) if product_ids else None, category_id=category_id, batch_size=batch_size
+        )
+    )
+
+    if output == "-":
+        output_file = sys.stdout
+    elif output.endswith(".gz"):
+        output_file = gzip.open(output, "wt", encoding="utf8", newline="")
+    else:
+        output_file = open(output, "w", encoding="utf8", newline="")
+
+    start = time.perf_counter()
+    try:
+        for chunk in iter_export_chunks(counter, export_format):
+            output_file.write(chunk)
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+    duration = time.perf_counter() - start
+
+    rows_per_second = counter.count / duration if duration else 0.0
+    click.echo(f"Exported {counter.count:,} rows in {duration:.1f} s ({rows_per_second:,.0f} rows/s)", err=True)
+
+
+@CLI_BLUEPRINT.cli.command("cache-report")
+def cache_report_command():
+    """Show the memory used and hit rate of each family of cache keys."""
+    cache = _get_dao().cache
+    stats = cache.get_stats()
+    usage = cache.get_memory_usage()
+
+    total_hits = sum(x["hits"] for x in stats.values())
+    total_bytes = sum(x["bytes"] for x in usage.values())
+
+    rows = [(x.prefix, x.name, x.max_entries) for x in sorted(cache.families, key=lambda x: x.priority)]
+    rows.append((OTHER_FAMILY_NAME, "keys outside any family", None))
+
+    click.echo(
+        f"{'prefix':<12}{'family':<24}{'keys':>10}{'budget':>10}{'bytes':>14}{'% memory':>10}"
+        f"{'hits':>12}{'misses':>12}{'hit rate':>10}{'% hits':>8}"
+    )
+    for prefix, name, max_entries in rows:
+        family_usage = usage.get(prefix, {"keys": 0, "bytes": 0})
+        family_stats = stats.get(prefix, {"hits": 0, "misses": 0})
+        lookups = family_stats["hits"] + family_stats["misses"]
+        click.echo(
+            f"{prefix:<12}{name:<24}{family_usage['keys']:>10,}{max_entries or '-':>10}{family_usage['bytes']:>14,}"
+            f"{_percent(family_usage['bytes'], total_bytes):>10}{family_stats['hits']:>12,}"
+            f"{family_stats['misses']:>12,}{_percent(family_stats['hits'], lookups):>10}"
+            f"{_percent(family_stats['hits'], total_hits):>8}"
+        )
+    click.echo(f"Total: {sum(x['keys'] for x in usage.values()):,} keys using {total_bytes:,} bytes")
+
+
+@CLI_BLUEPRINT.cli.command("mark-data-changed")
+def mark_data_changed_command():
+    """Change the data version so cached data is refreshed, to be run after editing products or prices in place."""
+    data_version = _get_dao().mark_data_changed()
+    click.echo(f"Data version is now {data_version}", err=True)
+
+
+@CLI_BLUEPRINT.cli.command("compute-price-stats")
+@click.option("--batch-size", type=int, default=PRICE_STATS_BATCH_SIZE, help="Products saved at a time.")
+def compute_price_stats_command(batch_size: int):
+    """Precompute the price stats of every product, to be run after each scrape."""
+    start = time.perf_counter()
+    num_products = _get_dao().materialize_price_stats(batch_size=batch_size)
+    duration = time.perf_counter() - start
+
+    products_per_second = num_products / duration if duration else 0.0
+    click.echo(
+        f"Computed price stats for {num_products:,} products in {duration:.1f} s "
+        f"({products_per_second:,.0f} products/s)",
+        err=True,
+    )
+
+
+@CLI_BLUEPRINT.cli.command("update-price-drops")
+@click.option("--batch-size", type=int, default=PRICE_DROPS_BATCH_SIZE, help="New prices processed at a time.")
+def update_price_drops_command(batch_size: int):
+    """Update the biggest price drops from the prices added since the last update, to be run after each scrape."""
+    start = time.perf_counter()
+    try:
+        num_prices = _get_price_drops().update(batch_size=batch_size)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    duration = time.perf_counter() - start
+
+    click.echo(f"Processed {num_prices:,} new prices in {duration:.1f} s", err=True)
+
+
+@CLI_BLUEPRINT.cli.command("favorites-digest")
+@click.option(
+    "--since",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    default=None,
+    help=f"Find price changes after this date. Defaults to {FAVORITES_DIGEST_DEFAULT_DAYS} days ago.",
+)
+@click.option("--batch-size", type=int, default=FAVORITES_DIGEST_BATCH_SIZE, help="Products checked per price query.")
+def favorites_digest_command(since: datetime.datetime, batch_size: int):
+    """Find which favorites of every user changed price, shown on each user's profile page."""
+    if since is None:
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        since = today - datetime.timedelta(days=FAVORITES_DIGEST_DEFAULT_DAYS)
+
+    start = time.perf_counter()
+    num_products, num_users = _get_users().compute_favorites_digests(since, batch_size=batch_size)
+    duration = time.perf_counter() - start
+
+    click.echo(
+        f"Checked {num_products:,} favorited products and saved digests for {num_users:,} users in {duration:.1f} s",
+        err=True,
+    )
+
+
+@CLI_BLUEPRINT.cli.command("prerender")
+@click.option("--output", type=click.Path(file_okay=False), required=True, help="Folder to write the pages to.")
+@click.option("--processes", type=int, default=None, help="Render processes, defaulting to the number of CPUs.")
+@click.option("--batch-size", type=int, default=PRERENDER_BATCH_SIZE, help="Pages gathered before rendering.")
+@click.option("--force", is_flag=True, help="Render every page, even if its data hasn't changed.")
+def prerender_command(output: str, processes: int, batch_size: int, force: bool):
+    """Render the category and price history pages to static files, to be run after each scrape."""
+    start = time.perf_counter()
+    num_pages, num_rendered = prerender(_get_dao(), output, processes=processes, batch_size=batch_size, force=force)
+    duration = time.perf_counter() - start
+
+    pages_per_second = num_rendered / duration if duration else 0.0
+    click.echo(
+        f"Rendered {num_rendered:,} of {num_pages:,} pages in {duration:.1f} s ({pages_per_second:,.0f} pages/s)",
+        err=True,
+    )
+
+
+def _percent(numerator: int, denominator: int) -> str:
+    return f"{100 * numerator / denominator:.1f}%" if denominator else "-"
+
+
+class _CountingIterator:
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self.iterator)
+        self.count += 1
+        return item
+
+
+def _get_dao() -> ApplicationDao:
+    return current_app.config[DATABASE_CONFIG_KEY]
+
+
+def _get_price_drops() -> PriceDrops:
+    return current_app.config[PRICE_DROPS_CONFIG_KEY]
+
+
+def _get_users() -> Users:
+    return current_app.config[USERS_CONFIG_KEY]
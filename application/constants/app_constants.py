@@ -2,6 +2,8 @@
 DATABASE_CONFIG_KEY = "DB"
 METRICS_CONFIG_KEY = "METRICS"
 USERS_CONFIG_KEY = "USERS"
+RATE_LIMITER_CONFIG_KEY = "RATE_LIMITER"
+PRICE_DROPS_CONFIG_KEY = "PRICE_DROPS"
 
 # Session key names
 SESSION_USER_ID_KEY = "user_id"
@@ -12,20 +14,110 @@ SESSION_USER_NAME_KEY = "user_name"
 REDIS_VERSION = 6
 PRODUCT_DISPLAY_NAME_CACHE_PREFIX = "pdn_"
 PRODUCT_PRICE_HISTORY_CACHE_PREFIX = "pph_"
-PRODUCT_SEARCH_CACHE_PREFIX = "ps_"
+PRODUCT_SEARCH_CACHE_PREFIX = "psb_"
+PRODUCT_SEARCH_NUM_RESULTS_CACHE_PREFIX = "psn_"
 PRODUCT_IDS_SEARCH_CACHE_PREFIX = "pis_"
-CATEGORY_PRODUCTS_CACHE_KEY = "cpd_"
+CATEGORY_PRODUCTS_CACHE_KEY = "cpb_"
+CATEGORY_NUM_PRODUCTS_CACHE_PREFIX = "cnp_"
 CATEGORIES_CACHE_KEY = "categories"
 CATEGORY_NAME_CACHE_KEY = "cn_"
 NUM_PRODUCTS_CACHE_KEY = "np"
 NUM_PRICES_CACHE_KEY = "npr"
 EXTREMES_PRICE_DATE_CACHE_PREFIX = "epd_"
 MOST_PRICES_PRODUCT_CACHE_KEY = "mpp"
+PRODUCT_PRICE_STATS_CACHE_PREFIX = "pst_"
+PRICE_DROPS_CACHE_PREFIX = "drp_"
+DATA_VERSION_CACHE_KEY = "dv"
+DATA_VERSION_LAST_CACHE_KEY = "dvl"
+DATA_VERSION_PREVIOUS_CACHE_KEY = "dvp"
+CACHE_STATS_CACHE_KEY = "cs"
+CACHE_INDEX_KEY_PREFIX = "ci_"
+RATE_LIMIT_CACHE_PREFIX = "rl_"
+CONCURRENCY_CACHE_PREFIX = "cc_"
+
+# Free text longer than this is hashed before being used in a cache key
+MAX_CACHE_KEY_PART_LENGTH = 100
+CACHE_STATS_FLUSH_SECONDS = 10
+CACHE_MEMORY_CHECK_SECONDS = 30
 
 DATE_FORMAT_STRING = "%Y-%m-%d"
 
+# Periods price histories can be resampled to, as $dateTrunc units
+PRICE_HISTORY_RESOLUTIONS = ("day", "week", "month")
+
+# Limits for comparing the price histories of several products at once
+MAX_COMPARED_PRODUCTS = 20
+PRICE_HISTORY_MAX_WORKERS = 8
+
+# Number of products whose stats are written to the database and cache at a time
+PRICE_STATS_BATCH_SIZE = 1000
+
+# Price drops older than this are dropped from the deals leaderboards
+PRICE_DROP_MAX_AGE_DAYS = 14
+# Number of new prices processed at a time when updating the deals leaderboards
+PRICE_DROPS_BATCH_SIZE = 1000
+DEFAULT_NUM_DEALS = 50
+MAX_NUM_DEALS = 200
+# Number of favorited products whose price changes are checked by each query of the favorites digest job
+FAVORITES_DIGEST_BATCH_SIZE = 1000
+FAVORITES_DIGEST_DEFAULT_DAYS = 7
+# Number of pages whose data is gathered before they are handed to the render processes
+PRERENDER_BATCH_SIZE = 1000
+
+# Number of products fetched from the database or cache at a time when streaming listings
+LISTING_BATCH_SIZE = 500
+# Number of cached batches of a listing read per round trip to the cache
+CACHED_BATCHES_PER_READ = 4
+
+# Number of price documents fetched per round trip and encoded per chunk when exporting
+EXPORT_BATCH_SIZE = 10000
+EXPORT_CHUNK_ROWS = 1000
+
+# Limits on expensive endpoints, per client
+SEARCH_RATE_LIMIT_PER_MINUTE = 20
+SEARCH_RATE_LIMIT_BURST = 10
+LOGIN_RATE_LIMIT_PER_MINUTE = 5
+LOGIN_RATE_LIMIT_BURST = 5
+EXPORT_RATE_LIMIT_PER_MINUTE = 2
+EXPORT_RATE_LIMIT_BURST = 2
+
+# Limit on searches which miss the cache running at once, across all processes
+MAX_CONCURRENT_SEARCHES = 4
+CONCURRENCY_SLOT_TIMEOUT_SECONDS = 60
+# Limit on exports running at once, across all processes, whose slots last as long as an export's query may run
+MAX_CONCURRENT_EXPORTS = 2
+EXPORT_CONCURRENCY_SLOT_TIMEOUT_SECONDS = 10 * 60
+
+# Time budgets for database calls, so slow databases can't tie up every worker
+MONGO_CONNECT_TIMEOUT_MS = 5000
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000
+MONGO_SOCKET_TIMEOUT_MS = 10000
+# How long a request waits for a free connection when every pooled connection is in use
+MONGO_WAIT_QUEUE_TIMEOUT_MS = 2000
+REDIS_POOL_TIMEOUT_SECONDS = 2
+QUERY_TIME_BUDGET_MS = 5000
+USERS_QUERY_TIME_BUDGET_MS = 3000
+EXPORT_QUERY_TIME_BUDGET_MS = 10 * 60 * 1000
+JOB_QUERY_TIME_BUDGET_MS = 60 * 60 * 1000
+METRICS_TIMEOUT_MS = 1000
+
+# Consecutive failures after which calls to a database are stopped, and for how long
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_RESET_SECONDS = 30
+
+# Requests slower than this have their trace logged, unless overridden by SLOW_REQUEST_MS
+SLOW_REQUEST_THRESHOLD_MS = 1000
+
 MAX_METRICS_SIZE = 1048576
 MAX_METRICS_DOCUMENTS = 100
 
 ONE_HOUR_IN_SECONDS = 60 * 60
 ONE_DAY_IN_SECONDS = 24 * 60 * 60
+ONE_WEEK_IN_SECONDS = 7 * ONE_DAY_IN_SECONDS
+
+# Cached data is namespaced by the data version, so it can be kept for a long time
+CACHE_TTL_SECONDS = ONE_WEEK_IN_SECONDS
+DATA_VERSION_POLL_SECONDS = 60
+DATA_VERSION_LENGTH = 12
+# ID of the document in the data_changes collection whose counter is bumped after data is edited in place
+DATA_CHANGES_ID = "data_version"
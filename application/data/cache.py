@@ -0,0 +1,302 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import redis
+
+from application.constants.app_constants import (
+    CACHE_INDEX_KEY_PREFIX,
+    CACHE_MEMORY_CHECK_SECONDS,
+    CACHE_STATS_CACHE_KEY,
+    CACHE_STATS_FLUSH_SECONDS,
+    CATEGORIES_CACHE_KEY,
+    CATEGORY_NAME_CACHE_KEY,
+    CATEGORY_NUM_PRODUCTS_CACHE_PREFIX,
+    CATEGORY_PRODUCTS_CACHE_KEY,
+    EXTREMES_PRICE_DATE_CACHE_PREFIX,
+    MAX_CACHE_KEY_PART_LENGTH,
+    MOST_PRICES_PRODUCT_CACHE_KEY,
+    NUM_PRICES_CACHE_KEY,
+    NUM_PRODUCTS_CACHE_KEY,
+    PRODUCT_DISPLAY_NAME_CACHE_PREFIX,
+    PRODUCT_IDS_SEARCH_CACHE_PREFIX,
+    PRODUCT_PRICE_HISTORY_CACHE_PREFIX,
+    PRODUCT_PRICE_STATS_CACHE_PREFIX,
+    PRODUCT_SEARCH_CACHE_PREFIX,
+    PRODUCT_SEARCH_NUM_RESULTS_CACHE_PREFIX,
+)
+from application.data import tracing
+
+LOG = logging.getLogger(__name__)
+
+# Keys which do not belong to any family are reported under this name
+OTHER_FAMILY_NAME = "other"
+
+
+@dataclass
+class CacheFamily:
+    prefix: str
+    name: str
+    # The most entries kept at once, the oldest are evicted first
+    max_entries: int
+    # When the cache is over its memory budget, families with the lowest priority are trimmed first
+    priority: int
+
+
+CACHE_FAMILIES = (
+    CacheFamily(PRODUCT_SEARCH_CACHE_PREFIX, "product search results", max_entries=10000, priority=0),
+    CacheFamily(PRODUCT_SEARCH_NUM_RESULTS_CACHE_PREFIX, "product search counts", max_entries=10000, priority=0),
+    CacheFamily(PRODUCT_IDS_SEARCH_CACHE_PREFIX, "products from IDs", max_entries=10000, priority=1),
+    CacheFamily(PRODUCT_PRICE_HISTORY_CACHE_PREFIX, "price histories", max_entries=50000, priority=2),
+    CacheFamily(PRODUCT_DISPLAY_NAME_CACHE_PREFIX, "product names", max_entries=100000, priority=3),
+    CacheFamily(PRODUCT_PRICE_STATS_CACHE_PREFIX, "price stats", max_entries=100000, priority=3),
+    CacheFamily(CATEGORY_PRODUCTS_CACHE_KEY, "category products", max_entries=2000, priority=3),
+    CacheFamily(CATEGORY_NUM_PRODUCTS_CACHE_PREFIX, "category counts", max_entries=2000, priority=4),
+    CacheFamily(CATEGORY_NAME_CACHE_KEY, "category names", max_entries=2000, priority=4),
+    CacheFamily(CATEGORIES_CACHE_KEY, "categories", max_entries=10, priority=5),
+    CacheFamily(NUM_PRODUCTS_CACHE_KEY, "number of products", max_entries=10, priority=5),
+    CacheFamily(NUM_PRICES_CACHE_KEY, "number of prices", max_entries=10, priority=5),
+    CacheFamily(EXTREMES_PRICE_DATE_CACHE_PREFIX, "oldest/newest price", max_entries=20, priority=5),
+    CacheFamily(MOST_PRICES_PRODUCT_CACHE_KEY, "most prices product", max_entries=10, priority=5),
+)
+
+
+def normalize_key_part(value: str) -> str:
+    """
+    Normalizes free text used as part of a cache key, so variants in case and spacing share one entry.
+    Long values are hashed to bound the size of the key.
+
+    Args:
+        value: the free text, such as a search query
+
+    Returns:
+        The normalized text
+    """
+    value = " ".join(value.lower().split())
+    if len(value) > MAX_CACHE_KEY_PART_LENGTH:
+        value = hashlib.sha1(value.encode("utf8")).hexdigest()
+    return value
+
+
+class Cache:
+    """
+    Wraps a Redis client to keep each family of cache keys within an entry budget and to count hits and misses.
+    Commands not overridden here are passed straight through to the Redis client.
+    """
+
+    def __init__(self, client: redis.Redis, families: Iterable[CacheFamily] = CACHE_FAMILIES):
+        self.client = client
+        # Longest prefixes first, so a key is matched to the most specific family
+        self.families = sorted(families, key=lambda x: len(x.prefix), reverse=True)
+
+        max_memory_mb = os.environ.get("CACHE_MAX_MEMORY_MB")
+        self.max_memory_bytes = int(max_memory_mb) * 1024 * 1024 if max_memory_mb else None
+        self.memory_check_time = 0.0
+        # Held while checking the memory, so requests running at once don't each evict half of a family
+        self.memory_check_lock = threading.Lock()
+
+        self.stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+        self.stats_flush_time = time.monotonic()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        def traced(*args, **kwargs):
+            with tracing.span(f"cache.{name}"):
+                return attribute(*args, **kwargs)
+
+        return traced
+
+    def get_family(self, cache_key: str) -> Optional[CacheFamily]:
+        for family in self.families:
+            if cache_key.startswith(family.prefix):
+                return family
+        return None
+
+    def get(self, cache_key: str) -> Optional[bytes]:
+        with tracing.span("cache.get"):
+            result = self.client.get(cache_key)
+        self._record(cache_key, result is not None)
+        return result
+
+    def mget(self, cache_keys: List[str]) -> List[Optional[bytes]]:
+        with tracing.span("cache.mget"):
+            results = self.client.mget(cache_keys) if cache_keys else []
+        for cache_key, result in zip(cache_keys, results):
+            self._record(cache_key, result is not None)
+        return results
+
+    def exists(self, cache_key: str) -> bool:
+        with tracing.span("cache.exists"):
+            result = bool(self.client.exists(cache_key))
+        self._record(cache_key, result)
+        return result
+
+    def set(self, cache_key: str, value, ex: int = None):
+        with tracing.span("cache.set"):
+            result = self.client.set(cache_key, value, ex=ex)
+            self.track([cache_key])
+        return result
+
+    def pipeline(self, *args, **kwargs):
+        pipeline = self.client.pipeline(*args, **kwargs)
+        execute = pipeline.execute
+
+        # Commands in a pipeline are only sent when it is executed, so that is what's timed
+        def traced_execute(*execute_args, **execute_kwargs):
+            with tracing.span("cache.pipeline"):
+                return execute(*execute_args, **execute_kwargs)
+
+        pipeline.execute = traced_execute
+        return pipeline
+
+    def track(self, cache_keys: List[str]):
+        """
+        Adds newly cached keys to the index of their family, evicting the oldest entries of any family over budget.
+
+        Args:
+            cache_keys: the keys which have just been cached
+        """
+        with tracing.span("cache.track"):
+            self._track(cache_keys)
+
+    def _track(self, cache_keys: List[str]):
+        now = time.time()
+        keys_by_family: Dict[str, List[str]] = {}
+        for cache_key in cache_keys:
+            family = self.get_family(cache_key)
+            if family:
+                keys_by_family.setdefault(family.prefix, []).append(cache_key)
+
+        for family in self.families:
+            if family.prefix not in keys_by_family:
+                continue
+
+            index_key = f"{CACHE_INDEX_KEY_PREFIX}{family.prefix}"
+            pipeline = self.client.pipeline()
+            pipeline.zadd(index_key, {x: now for x in keys_by_family[family.prefix]})
+            pipeline.zcard(index_key)
+            num_entries = pipeline.execute()[-1]
+            if num_entries > family.max_entries:
+                self._evict(index_key, num_entries - family.max_entries)
+
+        self._check_memory()
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Gets the hits and misses of each family, summed over every process using the cache.
+
+        Returns:
+            The hits and misses keyed by family prefix
+        """
+        self.flush_stats()
+        stats = {}
+        for field, value in self.client.hgetall(CACHE_STATS_CACHE_KEY).items():
+            prefix, _, outcome = field.decode().rpartition(":")
+            stats.setdefault(prefix, {"hits": 0, "misses": 0})[outcome] = int(value)
+        return stats
+
+    def get_memory_usage(self, scan_count: int = 1000) -> Dict[str, Dict[str, int]]:
+        """
+        Scans every key in the cache to total the number of keys and bytes used by each family.
+        This is slow for a large cache, so is only meant for reports.
+
+        Args:
+            scan_count: the number of keys to scan and size at a time
+
+        Returns:
+            The number of keys and bytes keyed by family prefix
+        """
+        usage: Dict[str, Dict[str, int]] = {}
+        cache_keys = []
+
+        def size_keys():
+            pipeline = self.client.pipeline()
+            for cache_key in cache_keys:
+                pipeline.memory_usage(cache_key)
+            try:
+                sizes = pipeline.execute()
+            except redis.ResponseError:
+                # Not every Redis implementation supports MEMORY USAGE, so fall back to the serialized size
+                sizes = [len(self.client.dump(x) or b"") for x in cache_keys]
+
+            for cache_key, size in zip(cache_keys, sizes):
+                family = self.get_family(cache_key.decode())
+                family_usage = usage.setdefault(family.prefix if family else OTHER_FAMILY_NAME, {"keys": 0, "bytes": 0})
+                family_usage["keys"] += 1
+                family_usage["bytes"] += size or 0
+            cache_keys.clear()
+
+        for cache_key in self.client.scan_iter(count=scan_count):
+            cache_keys.append(cache_key)
+            if len(cache_keys) >= scan_count:
+                size_keys()
+        size_keys()
+
+        return usage
+
+    def flush_stats(self):
+        with self.stats_lock:
+            stats = self.stats
+            self.stats = {}
+            self.stats_flush_time = time.monotonic()
+
+        if stats:
+            pipeline = self.client.pipeline()
+            for field, value in stats.items():
+                pipeline.hincrby(CACHE_STATS_CACHE_KEY, field, value)
+            pipeline.execute()
+
+    def _record(self, cache_key: str, hit: bool):
+        family = self.get_family(cache_key)
+        prefix = family.prefix if family else OTHER_FAMILY_NAME
+        field = f"{prefix}:{'hits' if hit else 'misses'}"
+        with self.stats_lock:
+            self.stats[field] = self.stats.get(field, 0) + 1
+            flush = time.monotonic() - self.stats_flush_time >= CACHE_STATS_FLUSH_SECONDS
+
+        # Counts are kept in memory and only written to the cache every so often, to keep hits cheap
+        if flush:
+            self.flush_stats()
+
+    def _evict(self, index_key: str, num_entries: int):
+        evicted = [x for x, _ in self.client.zpopmin(index_key, num_entries)]
+        if evicted:
+            self.client.delete(*evicted)
+
+    def _check_memory(self):
+        if (self.max_memory_bytes is None) or (time.monotonic() - self.memory_check_time < CACHE_MEMORY_CHECK_SECONDS):
+            return
+        # Another request is already checking, so this one doesn't need to wait for it
+        if not self.memory_check_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self.memory_check_time >= CACHE_MEMORY_CHECK_SECONDS:
+                self.memory_check_time = time.monotonic()
+                self._evict_over_budget()
+        finally:
+            self.memory_check_lock.release()
+
+    def _evict_over_budget(self):
+        used_memory = self.client.info("memory")["used_memory"]
+        if used_memory <= self.max_memory_bytes:
+            return
+
+        # Halve the lowest priority family which still has entries, the next check will trim further if needed
+        for family in sorted(self.families, key=lambda x: x.priority):
+            index_key = f"{CACHE_INDEX_KEY_PREFIX}{family.prefix}"
+            num_entries = self.client.zcard(index_key)
+            if num_entries:
+                LOG.warning(
+                    f"Cache using {used_memory:,} bytes, over budget of {self.max_memory_bytes:,} bytes. "
+                    f"Evicting {(num_entries + 1) // 2:,} entries of {family.name}."
+                )
+                self._evict(index_key, (num_entries + 1) // 2)
+                return
@@ -0,0 +1,233 @@
+import itertools
+import math
+import struct
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from typing import List, Optional
+
+from flask import json
+
+from application.data.category import Category
+from application.data.price_history import PriceHistory
+from application.data.price_stats import PriceStats
+from application.data.products_search import Product
+
+# Number of items, then the current, minimum and maximum prices and the minimum and maximum price dates
+PRICE_HISTORY_HEADER = struct.Struct("<Iddd10s10s")
+DATE_LENGTH = 10
+NO_DATE = b" " * DATE_LENGTH
+
+# Product ID, the current, minimum, maximum and low prices and percent off the high, then the number of price changes
+# and the date the current price started
+PRICE_STATS_STRUCT = struct.Struct("<q7dI10s")
+
+
+class CacheCodec(ABC):
+    """
+    Converts DAO objects to and from the bytes stored in the cache.
+    """
+
+    # Included in cache keys, so objects encoded by different codecs never get mixed up
+    name: str = None
+
+    @abstractmethod
+    def encode_products(self, products: List[Product]) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode_products(self, data: bytes) -> List[Product]:
+        pass
+
+    @abstractmethod
+    def encode_categories(self, categories: List[Category]) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode_categories(self, data: bytes) -> List[Category]:
+        pass
+
+    @abstractmethod
+    def encode_price_history(self, price_history: PriceHistory) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode_price_history(self, data: bytes) -> PriceHistory:
+        pass
+
+    @abstractmethod
+    def encode_price_stats(self, price_stats: PriceStats) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode_price_stats(self, data: bytes) -> PriceStats:
+        pass
+
+
+class JsonCacheCodec(CacheCodec):
+    """
+    Encodes objects as JSON, which is easy to read when debugging the cache.
+    """
+
+    name = "json"
+
+    def encode_products(self, products: List[Product]) -> bytes:
+        return json.dumps(products).encode()
+
+    def decode_products(self, data: bytes) -> List[Product]:
+        return [Product(**x) for x in json.loads(data.decode())]
+
+    def encode_categories(self, categories: List[Category]) -> bytes:
+        return json.dumps(categories).encode()
+
+    def decode_categories(self, data: bytes) -> List[Category]:
+        return [Category(**x) for x in json.loads(data.decode())]
+
+    def encode_price_history(self, price_history: PriceHistory) -> bytes:
+        return json.dumps(price_history).encode()
+
+    def decode_price_history(self, data: bytes) -> PriceHistory:
+        return PriceHistory(**json.loads(data.decode()))
+
+    def encode_price_stats(self, price_stats: PriceStats) -> bytes:
+        return json.dumps(price_stats).encode()
+
+    def decode_price_stats(self, data: bytes) -> PriceStats:
+        return PriceStats(**json.loads(data.decode()))
+
+
+class BinaryCacheCodec(CacheCodec):
+    """
+    Encodes objects as packed arrays, so decoding a list is a few bulk copies rather than parsing every item.
+    IDs are stored as an array of 64 bit integers followed by the length of each display name and then the names,
+    so names may contain any character.
+    Price histories are stored as a fixed header followed by an array of doubles and the fixed width dates.
+    Price stats are stored as one fixed width record.
+    """
+
+    name = "binary"
+
+    def encode_products(self, products: List[Product]) -> bytes:
+        return self._encode_id_names([x.id for x in products], [x.display_name for x in products])
+
+    def decode_products(self, data: bytes) -> List[Product]:
+        return list(map(Product, *self._decode_id_names(data)))
+
+    def encode_categories(self, categories: List[Category]) -> bytes:
+        return self._encode_id_names([x.id for x in categories], [x.display_name for x in categories])
+
+    def decode_categories(self, data: bytes) -> List[Category]:
+        return list(map(Category, *self._decode_id_names(data)))
+
+    def encode_price_history(self, price_history: PriceHistory) -> bytes:
+        header = PRICE_HISTORY_HEADER.pack(
+            len(price_history.prices),
+            _none_to_nan(price_history.current_price),
+            _none_to_nan(price_history.minimum_price),
+            _none_to_nan(price_history.maximum_price),
+            (price_history.minimum_price_date or "").encode().ljust(DATE_LENGTH),
+            (price_history.maximum_price_date or "").encode().ljust(DATE_LENGTH),
+        )
+        prices = _to_little_endian(array("d", price_history.prices))
+        return header + prices.tobytes() + "".join(price_history.dates).encode()
+
+    def decode_price_history(self, data: bytes) -> PriceHistory:
+        num_prices, current_price, minimum_price, maximum_price, minimum_date, maximum_date = (
+            PRICE_HISTORY_HEADER.unpack_from(data)
+        )
+        prices_start = PRICE_HISTORY_HEADER.size
+        prices_end = prices_start + 8 * num_prices
+        prices = array("d")
+        prices.frombytes(data[prices_start:prices_end])
+        num_dates = (len(data) - prices_end) // DATE_LENGTH
+        dates = struct.unpack_from(f"{DATE_LENGTH}s" * num_dates, data, prices_end)
+
+        return PriceHistory(
+            dates=[x.decode() for x in dates],
+            prices=_to_little_endian(prices).tolist(),
+            current_price=_nan_to_none(current_price),
+            minimum_price=_nan_to_none(minimum_price),
+            maximum_price=_nan_to_none(maximum_price),
+            minimum_price_date=None if minimum_date == NO_DATE else minimum_date.decode(),
+            maximum_price_date=None if maximum_date == NO_DATE else maximum_date.decode(),
+        )
+
+    def encode_price_stats(self, price_stats: PriceStats) -> bytes:
+        return PRICE_STATS_STRUCT.pack(
+            price_stats.product_id,
+            price_stats.current_price,
+            price_stats.minimum_price,
+            price_stats.maximum_price,
+            price_stats.low_30_days,
+            price_stats.low_90_days,
+            price_stats.low_365_days,
+            price_stats.percent_off_high,
+            price_stats.num_price_changes,
+            price_stats.current_price_date.encode(),
+        )
+
+    def decode_price_stats(self, data: bytes) -> PriceStats:
+        (
+            product_id,
+            current_price,
+            minimum_price,
+            maximum_price,
+            low_30_days,
+            low_90_days,
+            low_365_days,
+            percent_off_high,
+            num_price_changes,
+            current_price_date,
+        ) = PRICE_STATS_STRUCT.unpack(data)
+        return PriceStats(
+            product_id=product_id,
+            current_price=current_price,
+            current_price_date=current_price_date.decode(),
+            minimum_price=minimum_price,
+            maximum_price=maximum_price,
+            low_30_days=low_30_days,
+            low_90_days=low_90_days,
+            low_365_days=low_365_days,
+            num_price_changes=num_price_changes,
+            percent_off_high=percent_off_high,
+        )
+
+    @staticmethod
+    def _encode_id_names(ids: List[int], names: List[str]) -> bytes:
+        ids = _to_little_endian(array("q", ids))
+        # Lengths are counted in characters, so the names can be decoded in one go and then sliced apart
+        lengths = struct.pack(f"<{len(names)}I", *map(len, names))
+        return struct.pack("<I", len(ids)) + ids.tobytes() + lengths + "".join(names).encode()
+
+    @staticmethod
+    def _decode_id_names(data: bytes) -> tuple:
+        (num_items,) = struct.unpack_from("<I", data)
+        if num_items == 0:
+            return [], []
+
+        ids_end = 4 + 8 * num_items
+        ids = array("q")
+        ids.frombytes(data[4:ids_end])
+        lengths = struct.unpack_from(f"<{num_items}I", data, ids_end)
+        names_start = ids_end + 4 * num_items
+        names = data[names_start:].decode()
+        bounds = list(itertools.accumulate(lengths, initial=0))
+        return _to_little_endian(ids).tolist(), [names[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+CACHE_CODECS = {codec.name: codec for codec in (JsonCacheCodec(), BinaryCacheCodec())}
+
+
+def _to_little_endian(values: array) -> array:
+    # Cached data may be shared between machines, so always store it little endian
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _none_to_nan(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+def _nan_to_none(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
@@ -3,5 +3,7 @@ from dataclasses import dataclass
 
 @dataclass
 class Category:
+    __slots__ = ("id", "display_name")
+
     id: int
     display_name: str
@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+
+from pymongo.collection import Collection
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, WaitQueueTimeoutError
+
+from application.constants.app_constants import CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_SECONDS
+from application.data import tracing
+from application.data.tracing import Span
+
+LOG = logging.getLogger(__name__)
+
+# Errors which mean the database is unavailable or too slow, rather than that the request was wrong
+FAILURE_EXCEPTIONS = (ConnectionFailure, ExecutionTimeout)
+
+# Collection methods which take the time budget as a keyword argument, and the name of that argument
+TIME_BUDGET_ARGUMENTS = {
+    "find": "max_time_ms",
+    "find_one": "max_time_ms",
+    "aggregate": "maxTimeMS",
+    "count_documents": "maxTimeMS",
+    "estimated_document_count": "maxTimeMS",
+    "distinct": "maxTimeMS",
+}
+
+
+class DatabaseUnavailableError(Exception):
+    """
+    Raised when a database call fails because the database is unavailable or too slow.
+    """
+
+
+class CircuitOpenError(DatabaseUnavailableError):
+    """
+    Raised instead of calling a database which has recently been failing.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend after several consecutive failures, so requests fail fast instead of piling up.
+    Once the reset time has passed, one call is let through to test the backend, closing the circuit if it works.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_BREAKER_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    @property
+    def is_open(self) -> bool:
+        with self.lock:
+            return (self.opened_at is not None) and (time.monotonic() - self.opened_at < self.reset_seconds)
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls a function which uses the backend, unless the circuit is open.
+
+        Args:
+            function: the function to call
+            *args: positional arguments for the function
+            **kwargs: keyword arguments for the function
+
+        Returns:
+            The result of the function
+
+        Raises:
+            CircuitOpenError: if the circuit is open.
+            DatabaseUnavailableError: if the call fails because the backend is unavailable.
+        """
+        is_trial = False
+        with self.lock:
+            if self.opened_at is not None:
+                if (time.monotonic() - self.opened_at < self.reset_seconds) or self.trial_in_progress:
+                    raise CircuitOpenError(f"The {self.name} database is unavailable")
+                # Let this call through as a trial of whether the backend has recovered
+                self.trial_in_progress = True
+                is_trial = True
+
+        try:
+            result = function(*args, **kwargs)
+        except WaitQueueTimeoutError as e:
+            # Every pooled connection of this process is busy, which says nothing about whether the backend is up
+            raise DatabaseUnavailableError(f"No connection to the {self.name} database is free: {e}") from e
+        except FAILURE_EXCEPTIONS as e:
+            self._record_failure()
+            raise DatabaseUnavailableError(f"The {self.name} database is unavailable: {e}") from e
+        except Exception:
+            # Other errors mean the backend answered, so it's available
+            self._record_success()
+            raise
+        else:
+            self._record_success()
+            return result
+        finally:
+            # A trial ended without an answer, such as by a gevent timeout or a busy pool, lets the next call try
+            if is_trial:
+                with self.lock:
+                    self.trial_in_progress = False
+
+    def _record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if (self.opened_at is not None) or (self.consecutive_failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    LOG.error(
+                        f"Opening circuit for the {self.name} database after {self.consecutive_failures} failures"
+                    )
+                self.opened_at = time.monotonic()
+
+    def _record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                LOG.info(f"Closing circuit for the {self.name} database")
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+
+class GuardedCollection:
+    """
+    Wraps a collection so every call, and every fetch of more results by a cursor, goes through a circuit breaker
+    and is limited to a time budget in the database.
+    Calls are traced, with the time spent iterating a cursor added to the span of the call which made it.
+    """
+
+    def __init__(self, collection: Collection, breaker: CircuitBreaker, time_budget_ms: int):
+        self.collection = collection
+        self.breaker = breaker
+        self.time_budget_ms = time_budget_ms
+
+    def __getattr__(self, name):
+        attribute = getattr(self.collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def guarded(*args, **kwargs):
+            if name in TIME_BUDGET_ARGUMENTS:
+                kwargs.setdefault(TIME_BUDGET_ARGUMENTS[name], self.time_budget_ms)
+
+            span = tracing.open_span(_span_name(self.collection, name, args, kwargs))
+            with tracing.resume(span):
+                result = self.breaker.call(attribute, *args, **kwargs)
+            # Cursors only query the database as they are iterated, so their iteration must be guarded too
+            if hasattr(result, "__next__"):
+                return GuardedCursor(result, self.breaker, span)
+            return result
+
+        return guarded
+
+
+class GuardedCursor:
+    def __init__(self, cursor, breaker: CircuitBreaker, span: Span = None):
+        self.cursor = cursor
+        self.breaker = breaker
+        self.span = span
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.span is None:
+            return self.breaker.call(next, self.cursor)
+
+        # Timed inline rather than with a span for each document, as a cursor may return millions of them
+        start = time.perf_counter_ns()
+        try:
+            return self.breaker.call(next, self.cursor)
+        finally:
+            self.span.duration_ns += time.perf_counter_ns() - start
+
+    def next(self):
+        return self.__next__()
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def _span_name(collection: Collection, method: str, args: tuple, kwargs: dict) -> str:
+    # Atlas Search queries run on separate search nodes, so they are traced apart from other queries
+    pipeline = args[0] if args else kwargs.get("pipeline")
+    if method == "aggregate" and pipeline and "$search" in pipeline[0]:
+        return f"search.{collection.name}"
+    return f"mongo.{collection.name}.{method}"
@@ -0,0 +1,23 @@
+import os
+
+from application.constants.app_constants import PRICE_HISTORY_MAX_WORKERS
+
+
+def get_pool_size(client_name: str) -> int:
+    """
+    Gets the number of connections a database or cache client of a worker process may open.
+    By default this is the number of requests the worker serves at once, set in WORKER_CONCURRENCY by the gunicorn
+    config, plus room for the threads every request of the worker shares for fetching several price histories at once.
+    Setting <client name>_MAX_POOL_SIZE overrides it, so a client can be kept within its server's connection limit,
+    with requests waiting for a free connection instead.
+
+    Args:
+        client_name: the prefix of the client's environment variables, such as MONGO or USERS
+
+    Returns:
+        The maximum pool size
+    """
+    max_pool_size = os.environ.get(f"{client_name}_MAX_POOL_SIZE")
+    if max_pool_size:
+        return int(max_pool_size)
+    return int(os.environ.get("WORKER_CONCURRENCY", 1)) + PRICE_HISTORY_MAX_WORKERS
@@ -1,27 +1,53 @@
+import contextvars
 import datetime
+import functools
+import hashlib
+import inspect
+import itertools
 import logging
 import operator
 import os
+import threading
 import time
-from typing import List
-from flask import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Generator, Iterable, Iterator, List, Optional, Tuple, Union
 
 import fakeredis
 import pymongo
 import redis
-from pymongo import MongoClient
-from pymongo.collection import Collection
+from pymongo import MongoClient, ReplaceOne
 from pymongo.database import Database
 
 from application.constants.app_constants import (
     DATE_FORMAT_STRING,
     PRODUCT_DISPLAY_NAME_CACHE_PREFIX,
-    ONE_DAY_IN_SECONDS,
+    CACHE_TTL_SECONDS,
+    DATA_CHANGES_ID,
+    DATA_VERSION_CACHE_KEY,
+    DATA_VERSION_LAST_CACHE_KEY,
+    DATA_VERSION_PREVIOUS_CACHE_KEY,
+    EXPORT_QUERY_TIME_BUDGET_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    QUERY_TIME_BUDGET_MS,
+    DATA_VERSION_LENGTH,
+    DATA_VERSION_POLL_SECONDS,
     REDIS_VERSION,
     PRODUCT_PRICE_HISTORY_CACHE_PREFIX,
     PRODUCT_SEARCH_CACHE_PREFIX,
     CATEGORIES_CACHE_KEY,
     CATEGORY_PRODUCTS_CACHE_KEY,
+    CATEGORY_NUM_PRODUCTS_CACHE_PREFIX,
+    PRODUCT_SEARCH_NUM_RESULTS_CACHE_PREFIX,
+    LISTING_BATCH_SIZE,
+    CACHED_BATCHES_PER_READ,
+    EXPORT_BATCH_SIZE,
+    PRICE_HISTORY_MAX_WORKERS,
     PRODUCT_IDS_SEARCH_CACHE_PREFIX,
     CATEGORY_NAME_CACHE_KEY,
     NUM_PRODUCTS_CACHE_KEY,
@@ -29,26 +55,92 @@ from application.constants.app_constants import (
     ONE_HOUR_IN_SECONDS,
     EXTREMES_PRICE_DATE_CACHE_PREFIX,
     MOST_PRICES_PRODUCT_CACHE_KEY,
+    JOB_QUERY_TIME_BUDGET_MS,
+    PRICE_STATS_BATCH_SIZE,
+    FAVORITES_DIGEST_BATCH_SIZE,
+    PRODUCT_PRICE_STATS_CACHE_PREFIX,
 )
+from application.data.cache import Cache, normalize_key_part
+from application.data.cache_codec import CACHE_CODECS, BinaryCacheCodec, CacheCodec
 from application.data.category import Category
+from application.data.circuit_breaker import CircuitBreaker, DatabaseUnavailableError, GuardedCollection
+from application.data.connection_pools import get_pool_size
 from application.data.metrics import Metrics
-from application.data.price_history import PriceHistory
+from application.data.price_change import PriceChange
+from application.data.price_history import PriceHistory, build_price_history
+from application.data.price_stats import LOW_WINDOW_DAYS, PriceStats
 from application.data.products_search import Product
 
 DATABASE_NAME = "price_history"
 
 LOG = logging.getLogger(__name__)
 
+_NO_ITEM = object()
+
+# Cached for products with no price stats, so they aren't looked up in the database every time
+_NO_PRICE_STATS = b""
+
+
+def _serve_stale_on_failure(function):
+    """
+    Decorates a DAO method which reads through the cache, so that if the database is unavailable the method is tried
+    again with data cached for the previous data version.
+    """
+    if inspect.isgeneratorfunction(function):
+
+        @functools.wraps(function)
+        def generator_wrapper(self, *args, **kwargs):
+            # The cache is only read when the first item is requested
+            iterator = function(self, *args, **kwargs)
+            try:
+                first_item = next(iterator, _NO_ITEM)
+            except DatabaseUnavailableError:
+                previous_data_version = self._get_previous_data_version()
+                if previous_data_version is None:
+                    raise
+                with self._stale_data_version(previous_data_version):
+                    iterator = function(self, *args, **kwargs)
+                    first_item = next(iterator, _NO_ITEM)
+
+            if first_item is not _NO_ITEM:
+                yield first_item
+                yield from iterator
+
+        return generator_wrapper
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return function(self, *args, **kwargs)
+        except DatabaseUnavailableError:
+            previous_data_version = self._get_previous_data_version()
+            if previous_data_version is None:
+                raise
+            with self._stale_data_version(previous_data_version):
+                return function(self, *args, **kwargs)
+
+    return wrapper
+
 
 class ApplicationDao:
-    def __init__(self, database: Database = None, metrics: Metrics = None, cache: redis.Redis = None):
+    def __init__(
+        self,
+        database: Database = None,
+        metrics: Metrics = None,
+        cache: Union[redis.Redis, Cache] = None,
+        codec: CacheCodec = None,
+    ):
         self.metrics = metrics
 
+        # Objects are cached in a compact binary encoding unless another codec is chosen
+        if codec is None:
+            codec = CACHE_CODECS[os.environ.get("CACHE_CODEC", BinaryCacheCodec.name)]
+        self.codec = codec
+
         # If no cache is given, spin up a fake one
         if cache is None:
-            self.cache = fakeredis.FakeStrictRedis(version=REDIS_VERSION)
-        else:
-            self.cache = cache
+            cache = fakeredis.FakeStrictRedis(version=REDIS_VERSION)
+        self.cache = cache if isinstance(cache, Cache) else Cache(cache)
 
         # If no database provided, connect to one
         if database is None:
@@ -56,85 +148,466 @@ class ApplicationDao:
             password = os.environ.get("MONGO_PASSWORD")
             host = os.environ.get("MONGO_HOST")
             self.client = MongoClient(
-                f"mongodb+srv://{username}:{password}@{host}/{DATABASE_NAME}?retryWrites=true&w=majority"
+                f"mongodb+srv://{username}:{password}@{host}/{DATABASE_NAME}?retryWrites=true&w=majority",
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                maxPoolSize=get_pool_size("MONGO"),
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
             )
 
             database: Database = self.client["price_history"]
 
+        self.data_version = None
+        self.data_version_expiry = 0.0
+        # Shared by every request of the process, so however many requests fetch price histories at once, they use
+        # at most this many extra connections, which the connection pools have room for
+        self.price_history_executor = ThreadPoolExecutor(
+            max_workers=PRICE_HISTORY_MAX_WORKERS, thread_name_prefix="price_history"
+        )
+        # Only one request of a process refreshes the data version at a time, the rest wait for it
+        self.data_version_lock = threading.Lock()
+        # Set while falling back to data cached for the previous data version.
+        # A context variable rather than a thread local, so the threads a request fans out to see it too
+        self.stale_data_version: ContextVar[Optional[str]] = ContextVar("stale_data_version", default=None)
+
+        # Products and categories live together, so they share a circuit breaker
+        self.products_breaker = CircuitBreaker("products")
+        self.prices_breaker = CircuitBreaker("prices")
+
         # Set up database and collection variables
         self.database = database
-        self.products_collection: Collection = self.database["products"]
-        self.categories_collection: Collection = self.database["categories"]
-        self.prices_collection: Collection = self.database["prices"]
+        self.products_collection = GuardedCollection(
+            self.database["products"], self.products_breaker, QUERY_TIME_BUDGET_MS
+        )
+        self.categories_collection = GuardedCollection(
+            self.database["categories"], self.products_breaker, QUERY_TIME_BUDGET_MS
+        )
+        self.prices_collection = GuardedCollection(self.database["prices"], self.prices_breaker, QUERY_TIME_BUDGET_MS)
+        # Holds a counter bumped after data is edited in place, which the data version can't otherwise see
+        self.data_changes_collection = GuardedCollection(
+            self.database["data_changes"], self.products_breaker, QUERY_TIME_BUDGET_MS
+        )
+        # Computed from the prices by a batch job, so it shares their circuit breaker
+        self.price_stats_collection = GuardedCollection(
+            self.database["price_stats"], self.prices_breaker, QUERY_TIME_BUDGET_MS
+        )
 
         LOG.info(f"Database collections: {self.database.list_collection_names()}")
 
-    def get_product_price_history(self, product_id: int) -> PriceHistory:
+    def get_data_version(self) -> str:
+        """
+        Gets a watermark which changes whenever new data is written to the database, such as after a scrape.
+        Cached data is namespaced by this version, so new data is served as soon as the version changes.
+        The version is shared through the cache, so only one process polls the database each interval.
+        Edits to existing documents don't change it unless they're followed by a call to mark_data_changed.
+
+        Returns:
+            The data version
+        """
+        if (self.data_version is not None) and (time.monotonic() < self.data_version_expiry):
+            return self.data_version
+
+        with self.data_version_lock:
+            # Another request may have refreshed the version while this one waited
+            now = time.monotonic()
+            if (self.data_version is not None) and (now < self.data_version_expiry):
+                return self.data_version
+
+            result = self.cache.get(DATA_VERSION_CACHE_KEY)
+            if result:
+                data_version = result.decode()
+            else:
+                last_data_version = self.cache.client.get(DATA_VERSION_LAST_CACHE_KEY)
+                last_data_version = last_data_version.decode() if last_data_version else None
+                try:
+                    data_version = self._compute_data_version()
+                except DatabaseUnavailableError:
+                    # Keep serving data cached for the last known version until the database is back
+                    data_version = self.data_version or last_data_version
+                    if data_version is None:
+                        raise
+                    LOG.warning(f"Could not check the data version, still using {data_version}")
+                else:
+                    pipeline = self.cache.client.pipeline()
+                    pipeline.set(DATA_VERSION_CACHE_KEY, data_version, ex=DATA_VERSION_POLL_SECONDS)
+                    pipeline.set(DATA_VERSION_LAST_CACHE_KEY, data_version, ex=CACHE_TTL_SECONDS)
+                    if last_data_version and (last_data_version != data_version):
+                        pipeline.set(DATA_VERSION_PREVIOUS_CACHE_KEY, last_data_version, ex=CACHE_TTL_SECONDS)
+                    pipeline.execute()
+                    LOG.info(f"Data version is {data_version}")
+
+            self.data_version = data_version
+            self.data_version_expiry = now + DATA_VERSION_POLL_SECONDS
+
+        return self.data_version
+
+    def mark_data_changed(self) -> str:
+        """
+        Changes the data version after existing documents have been edited in place, such as renaming a product or
+        overwriting a price, which don't change the newest documents or counts the version is otherwise based on.
+
+        Returns:
+            The new data version
+        """
+        self.data_changes_collection.update_one({"_id": DATA_CHANGES_ID}, {"$inc": {"changes": 1}}, upsert=True)
+
+        # Forget the current version, so every process picks up the new one at its next poll rather than the next
+        # time the shared version expires
+        self.cache.client.delete(DATA_VERSION_CACHE_KEY)
+        with self.data_version_lock:
+            self.data_version = None
+        return self.get_data_version()
+
+    @_serve_stale_on_failure
+    def get_product_price_history(
+        self,
+        product_id: int,
+        start_date: Optional[datetime.datetime] = None,
+        end_date: Optional[datetime.datetime] = None,
+        resolution: Optional[str] = None,
+    ) -> PriceHistory:
+        """
+        Gets the price history of a product, optionally limited to a date range and resampled to a resolution.
+
+        Args:
+            product_id: the product ID
+            start_date: only include prices from this date onwards
+            end_date: only include prices up to this date
+            resolution: one of PRICE_HISTORY_RESOLUTIONS to give one price per period, or None for every price change
+
+        Returns:
+            The price history
+        """
         start = time.perf_counter_ns()
 
-        cache_key = f"{PRODUCT_PRICE_HISTORY_CACHE_PREFIX}_{product_id}"
+        cache_key = self._versioned(_price_history_cache_key(product_id, start_date, end_date, resolution))
         result = self.cache.get(cache_key)
         if result:
-            price_history = PriceHistory(**json.loads(result.decode()))
+            price_history = self.codec.decode_price_history(result)
         else:
-            dates: List[datetime] = []
+            dates: List[datetime.datetime] = []
             prices: List[float] = []
 
-            documents = self.prices_collection.find(
-                filter={"product_id": product_id}, sort=[("start_date", pymongo.ASCENDING)]
-            )
+            price_filter = {"product_id": product_id}
+            start_date_filter = {}
+            if start_date is not None:
+                # The price in effect at the start of the range comes from the last change before it
+                document = self.prices_collection.find_one(
+                    filter={"product_id": product_id, "start_date": {"$lte": start_date}},
+                    sort=[("start_date", pymongo.DESCENDING)],
+                )
+                if document:
+                    dates.append(start_date)
+                    prices.append(float(document["price_cents"]) / 100.0)
+                start_date_filter["$gt"] = start_date
+            if end_date is not None:
+                start_date_filter["$lte"] = end_date
+            if start_date_filter:
+                price_filter["start_date"] = start_date_filter
+
+            if resolution is None:
+                documents = self.prices_collection.find(filter=price_filter, sort=[("start_date", pymongo.ASCENDING)])
+            else:
+                # Resample inside the database, keeping the last price of each period
+                documents = self.prices_collection.aggregate(
+                    [
+                        {"$match": price_filter},
+                        {"$sort": {"start_date": pymongo.ASCENDING}},
+                        {
+                            "$group": {
+                                "_id": {"$dateTrunc": {"date": "$start_date", "unit": resolution}},
+                                "price_cents": {"$last": "$price_cents"},
+                            }
+                        },
+                        {"$sort": {"_id": pymongo.ASCENDING}},
+                        {"$project": {"_id": 0, "start_date": "$_id", "price_cents": 1}},
+                    ]
+                )
 
             for document in documents:
-                dates.append(document["start_date"])
+                # A period which began before the start of the range is shown from the start of the range
+                date = max(document["start_date"], start_date) if start_date else document["start_date"]
+                if start_date and dates and dates[-1] == date:
+                    dates.pop()
+                    prices.pop()
+                dates.append(date)
                 prices.append(float(document["price_cents"]) / 100.0)
 
-            # Ensure we add a data point for today based on the most recent data point
-            current_price = None
-            todays_date = datetime.datetime.today()
-            if dates:
-                dates.append(todays_date)
-                prices.append(prices[-1])
-                current_price = prices[-1]
-
-            minimum_price = None
-            maximum_price = None
-            minimum_price_date = None
-            maximum_price_date = None
-            for i in range(len(prices)):
-                price = prices[i]
-                if (minimum_price is None) or (minimum_price >= price):
-                    minimum_price = price
-                    if i < len(dates) - 1:
-                        minimum_price_date = dates[i + 1] - datetime.timedelta(days=1)
-                    else:
-                        minimum_price_date = todays_date
-                if (maximum_price is None) or (maximum_price <= price):
-                    maximum_price = price
-                    if i < len(dates) - 1:
-                        maximum_price_date = dates[i + 1] - datetime.timedelta(days=1)
-                    else:
-                        maximum_price_date = todays_date
-
-            price_history = PriceHistory(
-                dates=[x.strftime(DATE_FORMAT_STRING) for x in dates],
-                prices=prices,
-                current_price=current_price,
-                minimum_price=minimum_price,
-                maximum_price=maximum_price,
-                minimum_price_date=minimum_price_date.strftime(DATE_FORMAT_STRING),
-                maximum_price_date=maximum_price_date.strftime(DATE_FORMAT_STRING),
-            )
-            self.cache.set(cache_key, json.dumps(price_history), ex=ONE_DAY_IN_SECONDS)
+            price_history = build_price_history(dates, prices, end_date=end_date)
+            self.cache.set(cache_key, self.codec.encode_price_history(price_history), ex=CACHE_TTL_SECONDS)
 
         duration_ms = (time.perf_counter_ns() - start) // 1000000
-        print(f"Price history for product {product_id!r} took {duration_ms} ms")
+        LOG.debug(f"Price history for product {product_id!r} took {duration_ms} ms")
         if self.metrics:
             self.metrics.log_products_price_history_time(time_ms=duration_ms, product_id=product_id)
 
         return price_history
 
+    def get_products_price_histories(
+        self,
+        product_ids: List[int],
+        start_date: Optional[datetime.datetime] = None,
+        end_date: Optional[datetime.datetime] = None,
+        resolution: Optional[str] = None,
+    ) -> Dict[int, PriceHistory]:
+        """
+        Gets the price histories of several products together.
+        Cached histories are read in one round trip and the rest are fetched concurrently.
+
+        Args:
+            product_ids: the product IDs
+            start_date: only include prices from this date onwards
+            end_date: only include prices up to this date
+            resolution: one of PRICE_HISTORY_RESOLUTIONS to give one price per period, or None for every price change
+
+        Returns:
+            The price history of each product, keyed by product ID
+        """
+        cache_keys = [
+            self._versioned(_price_history_cache_key(x, start_date, end_date, resolution)) for x in product_ids
+        ]
+        price_histories = {}
+        missing_product_ids = []
+        for product_id, result in zip(product_ids, self.cache.mget(cache_keys)):
+            if result:
+                price_histories[product_id] = self.codec.decode_price_history(result)
+            else:
+                missing_product_ids.append(product_id)
+
+        if missing_product_ids:
+            # Each task runs in a copy of this context, so its cache and database calls are added to the trace
+            futures = {
+                product_id: self.price_history_executor.submit(
+                    contextvars.copy_context().run,
+                    self.get_product_price_history,
+                    product_id,
+                    start_date,
+                    end_date,
+                    resolution,
+                )
+                for product_id in missing_product_ids
+            }
+            for product_id, future in futures.items():
+                price_histories[product_id] = future.result()
+
+        return price_histories
+
+    def iter_price_documents(
+        self,
+        product_ids: Optional[List[int]] = None,
+        category_id: Optional[int] = None,
+        batch_size: int = EXPORT_BATCH_SIZE,
+    ) -> Iterator[dict]:
+        """
+        Reads price documents through a single cursor sorted by product and date.
+        With no product IDs or category, every price document is read.
+
+        Args:
+            product_ids: only read prices for these products
+            category_id: only read prices for products in this category
+            batch_size: the number of documents fetched per round trip to the database
+
+        Returns:
+            An iterator of price documents
+        """
+        price_filter = {}
+        if category_id is not None:
+            category_product_ids = self.products_collection.distinct("id", filter={"category": category_id})
+            if product_ids is not None:
+                category_product_ids = sorted(set(category_product_ids).intersection(product_ids))
+            product_ids = category_product_ids
+        if product_ids is not None:
+            price_filter["product_id"] = {"$in": product_ids}
+
+        return self.prices_collection.find(
+            filter=price_filter,
+            projection={"_id": 0, "product_id": 1, "start_date": 1, "price_cents": 1},
+            sort=[("product_id", pymongo.ASCENDING), ("start_date", pymongo.ASCENDING)],
+            batch_size=batch_size,
+            max_time_ms=EXPORT_QUERY_TIME_BUDGET_MS,
+        )
+
+    def materialize_price_stats(self, batch_size: int = PRICE_STATS_BATCH_SIZE) -> int:
+        """
+        Computes the price stats of every product in one pass over the prices, saving them to the price stats
+        collection and the cache so they can be read without scanning price histories.
+        This is meant to be run as a batch job after each scrape.
+
+        Args:
+            batch_size: the number of products fetched per round trip and saved at a time
+
+        Returns:
+            The number of products with price stats
+        """
+        as_of = datetime.datetime.today()
+        window_starts = {name: as_of - datetime.timedelta(days=days) for name, days in LOW_WINDOW_DAYS.items()}
+
+        group = {
+            "_id": "$product_id",
+            # Documents are compared field by field, so the greatest is the price with the latest start date
+            "current": {"$max": {"start_date": "$start_date", "price_cents": "$price_cents"}},
+            "minimum_price_cents": {"$min": "$price_cents"},
+            "maximum_price_cents": {"$max": "$price_cents"},
+            "num_prices": {"$sum": 1},
+        }
+        for name, window_start in window_starts.items():
+            # The low of a window is the lowest of the prices starting in it and the price in effect when it began.
+            # Nulls are ignored by $min and $max, so each only considers the prices on its side of the window start.
+            starts_in_window = {"$gte": ["$start_date", window_start]}
+            group[f"{name}_within"] = {"$min": {"$cond": [starts_in_window, "$price_cents", None]}}
+            group[f"{name}_before"] = {
+                "$max": {
+                    "$cond": [starts_in_window, None, {"start_date": "$start_date", "price_cents": "$price_cents"}]
+                }
+            }
+
+        documents = self.prices_collection.aggregate(
+            [{"$group": group}], allowDiskUse=True, batchSize=batch_size, maxTimeMS=JOB_QUERY_TIME_BUDGET_MS
+        )
+
+        num_products = 0
+        batch: List[PriceStats] = []
+        for document in documents:
+            batch.append(_price_stats_from_group(document))
+            if len(batch) >= batch_size:
+                self._save_price_stats(batch, as_of)
+                num_products += len(batch)
+                batch = []
+        if batch:
+            self._save_price_stats(batch, as_of)
+            num_products += len(batch)
+
+        # Stats not replaced by this run belong to products which no longer have prices
+        self.price_stats_collection.delete_many({"computed": {"$lt": as_of}})
+        self.price_stats_collection.create_index([("percent_off_high", pymongo.DESCENDING)])
+
+        return num_products
+
+    def get_price_changes_since(
+        self, product_ids: Iterable[int], since: datetime.datetime, batch_size: int = FAVORITES_DIGEST_BATCH_SIZE
+    ) -> Dict[int, PriceChange]:
+        """
+        Finds which products changed price after a date, with one aggregation for each batch of products.
+
+        Args:
+            product_ids: the product IDs
+            since: only count price changes after this date
+            batch_size: the number of products checked by each aggregation
+
+        Returns:
+            The price change of each product which changed price, keyed by product ID
+        """
+        product_ids = list(product_ids)
+        changes: Dict[int, dict] = {}
+        for batch_start in range(0, len(product_ids), batch_size):
+            batch_end = batch_start + batch_size
+            batch_product_ids = product_ids[batch_start:batch_end]
+            documents = self.prices_collection.aggregate(
+                [
+                    {"$match": {"product_id": {"$in": batch_product_ids}}},
+                    {
+                        "$group": {
+                            "_id": "$product_id",
+                            # Documents are compared field by field, so the greatest is the latest price
+                            "current": {"$max": {"start_date": "$start_date", "price_cents": "$price_cents"}},
+                            "previous": {
+                                "$max": {
+                                    "$cond": [
+                                        {"$lte": ["$start_date", since]},
+                                        {"start_date": "$start_date", "price_cents": "$price_cents"},
+                                        None,
+                                    ]
+                                }
+                            },
+                            "num_changes": {"$sum": {"$cond": [{"$gt": ["$start_date", since]}, 1, 0]}},
+                        }
+                    },
+                    {"$match": {"num_changes": {"$gt": 0}}},
+                ],
+                maxTimeMS=JOB_QUERY_TIME_BUDGET_MS,
+            )
+            for document in documents:
+                changes[document["_id"]] = document
+
+        display_names = self.get_product_display_names(list(changes))
+        return {
+            product_id: PriceChange(
+                product_id=product_id,
+                display_name=display_names[product_id],
+                previous_price=(
+                    float(document["previous"]["price_cents"]) / 100.0 if document["previous"] is not None else None
+                ),
+                price=float(document["current"]["price_cents"]) / 100.0,
+                num_changes=document["num_changes"],
+                date=document["current"]["start_date"].strftime(DATE_FORMAT_STRING),
+            )
+            for product_id, document in changes.items()
+        }
+
+    def get_product_price_stats(self, product_id: int) -> Optional[PriceStats]:
+        return self.get_products_price_stats([product_id]).get(product_id)
+
+    @_serve_stale_on_failure
+    def get_products_price_stats(self, product_ids: List[int]) -> Dict[int, PriceStats]:
+        """
+        Gets the precomputed price stats of several products, reading the cache in one round trip.
+
+        Args:
+            product_ids: the product IDs
+
+        Returns:
+            The price stats keyed by product ID, without products which have none
+        """
+        cache_keys = [self._versioned(f"{PRODUCT_PRICE_STATS_CACHE_PREFIX}_{x}") for x in product_ids]
+        price_stats = {}
+        missing_product_ids = []
+        for product_id, result in zip(product_ids, self.cache.mget(cache_keys)):
+            if result is None:
+                missing_product_ids.append(product_id)
+            elif result != _NO_PRICE_STATS:
+                price_stats[product_id] = self.codec.decode_price_stats(result)
+
+        if missing_product_ids:
+            found_price_stats = {}
+            for document in self.price_stats_collection.find(filter={"_id": {"$in": missing_product_ids}}):
+                found_price_stats[document["_id"]] = _price_stats_from_document(document)
+
+            new_cache_keys = []
+            pipeline = self.cache.pipeline()
+            for product_id in missing_product_ids:
+                cache_key = self._versioned(f"{PRODUCT_PRICE_STATS_CACHE_PREFIX}_{product_id}")
+                if product_id in found_price_stats:
+                    value = self.codec.encode_price_stats(found_price_stats[product_id])
+                else:
+                    value = _NO_PRICE_STATS
+                pipeline.set(cache_key, value, ex=CACHE_TTL_SECONDS)
+                new_cache_keys.append(cache_key)
+            pipeline.execute()
+            self.cache.track(new_cache_keys)
+            price_stats.update(found_price_stats)
+
+        return price_stats
+
+    def iter_all_price_stats(self, batch_size: int = PRICE_STATS_BATCH_SIZE) -> Iterator[PriceStats]:
+        """
+        Reads the precomputed price stats of every product through a single cursor, bypassing the cache.
+
+        Args:
+            batch_size: the number of documents fetched per round trip to the database
+
+        Returns:
+            An iterator of price stats
+        """
+        documents = self.price_stats_collection.find(
+            filter={}, batch_size=batch_size, max_time_ms=JOB_QUERY_TIME_BUDGET_MS
+        )
+        for document in documents:
+            yield _price_stats_from_document(document)
+
+    @_serve_stale_on_failure
     def get_product_display_name(self, product_id: int) -> str:
-        cache_key = f"{PRODUCT_DISPLAY_NAME_CACHE_PREFIX}_{product_id}"
+        cache_key = self._versioned(f"{PRODUCT_DISPLAY_NAME_CACHE_PREFIX}_{product_id}")
         result = self.cache.get(cache_key)
         if result:
             return result.decode()
@@ -143,48 +616,119 @@ class ApplicationDao:
 
         if document:
             display_name = document["display_name"]
-            self.cache.set(cache_key, display_name, ex=ONE_DAY_IN_SECONDS)
+            self.cache.set(cache_key, display_name, ex=CACHE_TTL_SECONDS)
             return display_name
         else:
             return "UNKNOWN"
 
+    @_serve_stale_on_failure
+    def get_product_display_names(self, product_ids: List[int]) -> Dict[int, str]:
+        cache_keys = [self._versioned(f"{PRODUCT_DISPLAY_NAME_CACHE_PREFIX}_{x}") for x in product_ids]
+        display_names = {}
+        for product_id, result in zip(product_ids, self.cache.mget(cache_keys)):
+            if result:
+                display_names[product_id] = result.decode()
+
+        missing_product_ids = [x for x in product_ids if x not in display_names]
+        if missing_product_ids:
+            documents = self.products_collection.find(
+                filter={"id": {"$in": missing_product_ids}}, projection={"_id": 0, "id": 1, "display_name": 1}
+            )
+            new_cache_keys = []
+            pipeline = self.cache.pipeline()
+            for document in documents:
+                display_names[document["id"]] = document["display_name"]
+                cache_key = self._versioned(f"{PRODUCT_DISPLAY_NAME_CACHE_PREFIX}_{document['id']}")
+                pipeline.set(cache_key, document["display_name"], ex=CACHE_TTL_SECONDS)
+                new_cache_keys.append(cache_key)
+            pipeline.execute()
+            self.cache.track(new_cache_keys)
+
+        return {x: display_names.get(x, "UNKNOWN") for x in product_ids}
+
     def get_products(self, search_query: str) -> List[Product]:
+        return [product for batch in self.iter_products(search_query) for product in batch]
+
+    def is_product_search_cached(self, search_query: str) -> bool:
+        search_key = normalize_key_part(search_query)
+        num_results_cache_key = self._versioned(f"{PRODUCT_SEARCH_NUM_RESULTS_CACHE_PREFIX}_{search_key}")
+        cache_key = self._versioned(f"{PRODUCT_SEARCH_CACHE_PREFIX}_{search_key}")
+        # Checked on the client directly, as this is not a lookup which should count towards the hit rate
+        return self.cache.client.exists(num_results_cache_key, cache_key) == 2
+
+    @_serve_stale_on_failure
+    def search_products(
+        self, search_query: str, batch_size: int = LISTING_BATCH_SIZE
+    ) -> Tuple[int, Iterator[List[Product]]]:
+        """
+        Searches for products, giving the number found and the products in batches sorted by display name.
+        The number found comes with the first products of the search, so a page can show it and then stream the
+        products from the same search.
+
+        Args:
+            search_query: the words that must appear in the product display names
+            batch_size: the number of products to fetch and yield at a time
+
+        Returns:
+            The number of products found, and an iterator of product batches
+        """
         start = time.perf_counter_ns()
+        search_key = normalize_key_part(search_query)
+        cache_key = self._versioned(f"{PRODUCT_SEARCH_CACHE_PREFIX}_{search_key}")
+        num_results_cache_key = self._versioned(f"{PRODUCT_SEARCH_NUM_RESULTS_CACHE_PREFIX}_{search_key}")
 
-        cache_key = f"{PRODUCT_SEARCH_CACHE_PREFIX}_{search_query}"
-        result = self.cache.get(cache_key)
-        if result:
-            json_data = json.loads(result.decode())
-            products = [Product(**x) for x in json_data]
+        result = self.cache.get(num_results_cache_key)
+        if (result is not None) and self.cache.exists(cache_key):
+            num_results = int(result)
+            batches = self._iter_cached_product_batches(cache_key)
         else:
-            products = []
+            # We can only do searches in an aggregation pipeline, and the total found is only in the search metadata
+            documents = self.products_collection.aggregate(
+                [
+                    {"$search": {"compound": _search_compound(search_query), "count": {"type": "total"}}},
+                    {"$project": {"_id": 0, "id": 1, "display_name": 1, "meta": "$$SEARCH_META"}},
+                    {"$sort": {"display_name": pymongo.ASCENDING}},
+                ],
+                batchSize=batch_size,
+            )
+            first_document = next(documents, None)
+            if first_document is None:
+                num_results = 0
+            else:
+                num_results = first_document["meta"]["count"]["total"]
+                documents = itertools.chain([first_document], documents)
+            batches = self._cache_product_batches(cache_key, num_results_cache_key, documents, batch_size)
 
-            # We want to make sure each word appears in the product name, so use a compound search
-            word_searches = []
-            for word in search_query.split():
-                word_searches.append({"autocomplete": {"query": word, "path": "display_name"}})
+        return num_results, self._logged_search_batches(search_query, batches, time.perf_counter_ns() - start)
 
-            # We can only do searches in an aggregation pipeline
-            documents = self.products_collection.aggregate([{"$search": {"compound": {"must": word_searches}}}])
-            for document in documents:
-                product = Product(id=document["id"], display_name=document["display_name"])
-                products.append(product)
+    def iter_products(self, search_query: str, batch_size: int = LISTING_BATCH_SIZE) -> Iterator[List[Product]]:
+        """
+        Searches for products, yielding them in batches sorted by display name.
 
-            products.sort(key=operator.attrgetter("display_name"))
-            self.cache.set(cache_key, json.dumps(products), ex=ONE_DAY_IN_SECONDS)
+        Args:
+            search_query: the words that must appear in the product display names
+            batch_size: the number of products to fetch and yield at a time
 
-        duration_ms = (time.perf_counter_ns() - start) // 1000000
-        print(f"Products search {search_query!r} took {duration_ms} ms")
+        Returns:
+            An iterator of product batches
+        """
+        _, batches = self.search_products(search_query, batch_size=batch_size)
+        yield from batches
+
+    def _logged_search_batches(
+        self, search_query: str, batches: Iterator[List[Product]], start_duration_ns: int
+    ) -> Iterator[List[Product]]:
+        duration_ms = yield from self._timed_batches(batches, start_duration_ns)
+        LOG.debug(f"Products search {search_query!r} took {duration_ms} ms")
         if self.metrics:
             self.metrics.log_products_search_time(search_time_ms=duration_ms, query=search_query)
 
-        return products
-
+    @_serve_stale_on_failure
     def get_categories(self) -> List[Category]:
-        result = self.cache.get(CATEGORIES_CACHE_KEY)
+        cache_key = self._versioned(CATEGORIES_CACHE_KEY)
+        result = self.cache.get(cache_key)
         if result:
-            json_data = json.loads(result.decode())
-            categories = [Category(**x) for x in json_data]
+            categories = self.codec.decode_categories(result)
         else:
             categories = []
             documents = self.categories_collection.find({})
@@ -193,12 +737,13 @@ class ApplicationDao:
                 categories.append(category)
 
             categories.sort(key=operator.attrgetter("display_name"))
-            self.cache.set(CATEGORIES_CACHE_KEY, json.dumps(categories))
+            self.cache.set(cache_key, self.codec.encode_categories(categories), ex=CACHE_TTL_SECONDS)
 
         return categories
 
+    @_serve_stale_on_failure
     def get_category_display_name(self, category_id: int) -> str:
-        cache_key = f"{CATEGORY_NAME_CACHE_KEY}_{category_id}"
+        cache_key = self._versioned(f"{CATEGORY_NAME_CACHE_KEY}_{category_id}")
         result = self.cache.get(cache_key)
         if result:
             return result.decode()
@@ -207,72 +752,97 @@ class ApplicationDao:
 
         if document:
             category_display_name = document["display_name"]
-            self.cache.set(cache_key, category_display_name)
+            self.cache.set(cache_key, category_display_name, ex=CACHE_TTL_SECONDS)
             return category_display_name
         else:
             return "UNKNOWN"
 
     def get_category_products(self, category_id: int) -> List[Product]:
-        start = time.perf_counter_ns()
+        return [product for batch in self.iter_category_products(category_id) for product in batch]
 
-        cache_key = f"{CATEGORY_PRODUCTS_CACHE_KEY}_{category_id}"
+    @_serve_stale_on_failure
+    def get_category_num_products(self, category_id: int) -> int:
+        cache_key = self._versioned(f"{CATEGORY_NUM_PRODUCTS_CACHE_PREFIX}_{category_id}")
         result = self.cache.get(cache_key)
-        if result:
-            json_data = json.loads(result.decode())
-            products = [Product(**x) for x in json_data]
-        else:
-            products = []
-            documents = self.products_collection.find(filter={"category": category_id})
-            for document in documents:
-                product = Product(id=document["id"], display_name=document["display_name"])
-                products.append(product)
+        if result is not None:
+            return int(result)
 
-            products.sort(key=operator.attrgetter("display_name"))
-            self.cache.set(cache_key, json.dumps(products), ex=ONE_DAY_IN_SECONDS)
+        num_products = self.products_collection.count_documents(filter={"category": category_id})
+        self.cache.set(cache_key, num_products, ex=CACHE_TTL_SECONDS)
+        return num_products
 
-        duration_ms = (time.perf_counter_ns() - start) // 1000000
-        print(f"Category products {category_id!r} took {duration_ms} ms")
+    @_serve_stale_on_failure
+    def iter_category_products(self, category_id: int, batch_size: int = LISTING_BATCH_SIZE) -> Iterator[List[Product]]:
+        """
+        Gets the products in a category, yielding them in batches sorted by display name.
+
+        Args:
+            category_id: the category ID
+            batch_size: the number of products to fetch and yield at a time
+
+        Returns:
+            An iterator of product batches
+        """
+        cache_key = self._versioned(f"{CATEGORY_PRODUCTS_CACHE_KEY}_{category_id}")
+        if self.cache.exists(cache_key):
+            batches = self._iter_cached_product_batches(cache_key)
+        else:
+            documents = self.products_collection.find(
+                filter={"category": category_id},
+                projection={"_id": 0, "id": 1, "display_name": 1},
+                sort=[("display_name", pymongo.ASCENDING)],
+                batch_size=batch_size,
+            )
+            num_products_cache_key = self._versioned(f"{CATEGORY_NUM_PRODUCTS_CACHE_PREFIX}_{category_id}")
+            batches = self._cache_product_batches(cache_key, num_products_cache_key, documents, batch_size)
+
+        duration_ms = yield from self._timed_batches(batches)
+        LOG.debug(f"Category products {category_id!r} took {duration_ms} ms")
         if self.metrics:
             self.metrics.log_category_products_time(time_ms=duration_ms, category_id=category_id)
 
-        return products
-
+    @_serve_stale_on_failure
     def get_products_from_ids(self, product_ids: List[int]) -> List[Product]:
-        cache_key = f"{PRODUCT_IDS_SEARCH_CACHE_PREFIX}_{json.dumps(product_ids)}"
+        # The products are sorted by name, so the order and repeats of the IDs don't change the result
+        unique_product_ids = sorted(set(product_ids))
+        cache_key = self._versioned(f"{PRODUCT_IDS_SEARCH_CACHE_PREFIX}_{','.join(map(str, unique_product_ids))}")
         result = self.cache.get(cache_key)
         if result:
-            json_data = json.loads(result.decode())
-            products = [Product(**x) for x in json_data]
+            products = self.codec.decode_products(result)
         else:
-            documents = self.products_collection.find({"id": {"$in": product_ids}})
+            documents = self.products_collection.find({"id": {"$in": unique_product_ids}})
             products = []
             for document in documents:
                 products.append(Product(id=document["id"], display_name=document["display_name"]))
 
             products.sort(key=operator.attrgetter("display_name"))
-            self.cache.set(cache_key, json.dumps(products), ex=ONE_DAY_IN_SECONDS)
+            self.cache.set(cache_key, self.codec.encode_products(products), ex=CACHE_TTL_SECONDS)
 
-        if len(products) != len(product_ids):
+        if len(products) != len(unique_product_ids):
             LOG.warning(f"Could not find all products from ID list {product_ids}. Could only find {products}.")
 
         return products
 
+    @_serve_stale_on_failure
     def get_num_products(self) -> int:
-        result = self.cache.get(NUM_PRODUCTS_CACHE_KEY)
+        cache_key = self._versioned(NUM_PRODUCTS_CACHE_KEY)
+        result = self.cache.get(cache_key)
         if result:
             return int(result)
 
         num_documents = self.products_collection.count_documents(filter={})
-        self.cache.set(NUM_PRODUCTS_CACHE_KEY, num_documents, ex=ONE_DAY_IN_SECONDS)
+        self.cache.set(cache_key, num_documents, ex=CACHE_TTL_SECONDS)
         return num_documents
 
+    @_serve_stale_on_failure
     def get_num_prices(self) -> int:
-        result = self.cache.get(NUM_PRICES_CACHE_KEY)
+        cache_key = self._versioned(NUM_PRICES_CACHE_KEY)
+        result = self.cache.get(cache_key)
         if result:
             return int(result)
 
         num_documents = self.prices_collection.count_documents(filter={})
-        self.cache.set(NUM_PRICES_CACHE_KEY, num_documents, ex=ONE_DAY_IN_SECONDS)
+        self.cache.set(cache_key, num_documents, ex=CACHE_TTL_SECONDS)
         return num_documents
 
     def get_oldest_price_document_date(self) -> str:
@@ -281,8 +851,9 @@ class ApplicationDao:
     def get_newest_price_document_date(self) -> str:
         return self._get_extreme_price_document_date(pymongo.DESCENDING)
 
+    @_serve_stale_on_failure
     def _get_extreme_price_document_date(self, sort_order: int) -> str:
-        cache_key = f"{EXTREMES_PRICE_DATE_CACHE_PREFIX}_{sort_order}"
+        cache_key = self._versioned(f"{EXTREMES_PRICE_DATE_CACHE_PREFIX}_{sort_order}")
         result = self.cache.get(cache_key)
         if result:
             return result.decode()
@@ -290,16 +861,213 @@ class ApplicationDao:
         document = self.prices_collection.find_one(sort=[("start_date", sort_order)])
         date: datetime.datetime = document["start_date"]
         date_string = date.date().isoformat()
-        self.cache.set(cache_key, date_string, ex=ONE_HOUR_IN_SECONDS)
+        self.cache.set(cache_key, date_string, ex=CACHE_TTL_SECONDS)
         return date_string
 
+    @_serve_stale_on_failure
     def get_product_with_most_price_documents(self) -> int:
-        result = self.cache.get(MOST_PRICES_PRODUCT_CACHE_KEY)
+        cache_key = self._versioned(MOST_PRICES_PRODUCT_CACHE_KEY)
+        result = self.cache.get(cache_key)
         if result:
             return int(result)
 
         result = self.prices_collection.aggregate([{"$sortByCount": "$product_id"}, {"$limit": 1}])
         document = result.next()
         product_id = document["_id"]
-        self.cache.set(MOST_PRICES_PRODUCT_CACHE_KEY, product_id, ex=ONE_DAY_IN_SECONDS)
+        self.cache.set(cache_key, product_id, ex=CACHE_TTL_SECONDS)
         return product_id
+
+    def _compute_data_version(self) -> str:
+        markers = []
+
+        # Prices are only ever added by scrapes, so the newest price is the main marker
+        document = self.prices_collection.find_one(
+            sort=[("start_date", pymongo.DESCENDING)], projection={"start_date": 1}
+        )
+        markers.append(document["start_date"].isoformat() if document else "")
+
+        # Newest document and count of each collection catch products and categories being added or removed,
+        # and multiple scrapes on the same day
+        for collection in (self.prices_collection, self.products_collection, self.categories_collection):
+            document = collection.find_one(sort=[("_id", pymongo.DESCENDING)], projection={"_id": 1})
+            markers.append(str(document["_id"]) if document else "")
+            markers.append(str(collection.estimated_document_count()))
+
+        # Edits in place change none of the above, so whatever makes them bumps a counter instead
+        document = self.data_changes_collection.find_one({"_id": DATA_CHANGES_ID})
+        markers.append(str(document["changes"]) if document else "")
+
+        return hashlib.sha1("|".join(markers).encode()).hexdigest()[:DATA_VERSION_LENGTH]
+
+    def _get_previous_data_version(self) -> Optional[str]:
+        result = self.cache.client.get(DATA_VERSION_PREVIOUS_CACHE_KEY)
+        return result.decode() if result else None
+
+    @contextmanager
+    def _stale_data_version(self, data_version: str):
+        LOG.warning(f"Database unavailable, serving stale data from version {data_version}")
+        token = self.stale_data_version.set(data_version)
+        try:
+            yield
+        finally:
+            self.stale_data_version.reset(token)
+
+    def _versioned(self, cache_key: str) -> str:
+        data_version = self.stale_data_version.get() or self.get_data_version()
+        return f"{cache_key}:{data_version}:{self.codec.name}"
+
+    def _iter_cached_product_batches(self, cache_key: str) -> Iterator[List[Product]]:
+        # Each element of the cached list is one encoded batch of products, read a few batches per round trip
+        start = 0
+        while True:
+            results = self.cache.lrange(cache_key, start, start + CACHED_BATCHES_PER_READ - 1)
+            for result in results:
+                yield self.codec.decode_products(result)
+            # A short read is the end of the listing, or it expired part way through so there is nothing more to give
+            if len(results) < CACHED_BATCHES_PER_READ:
+                return
+            start += CACHED_BATCHES_PER_READ
+
+    def _cache_product_batches(
+        self, cache_key: str, count_cache_key: str, documents: Iterable[dict], batch_size: int
+    ) -> Iterator[List[Product]]:
+        # Batches are pushed to a temporary key which is only renamed into place once the listing is complete,
+        # so a listing that is abandoned part way through is never served from the cache
+        building_cache_key = f"{cache_key}_{uuid.uuid4().hex}"
+        num_products = 0
+        batch: List[Product] = []
+        try:
+            for document in documents:
+                batch.append(Product(id=document["id"], display_name=document["display_name"]))
+                if len(batch) >= batch_size:
+                    self.cache.rpush(building_cache_key, self.codec.encode_products(batch))
+                    self.cache.expire(building_cache_key, ONE_HOUR_IN_SECONDS)
+                    num_products += len(batch)
+                    yield batch
+                    batch = []
+
+            # Always push the final batch, even when empty, so empty listings are cached too
+            self.cache.rpush(building_cache_key, self.codec.encode_products(batch))
+            num_products += len(batch)
+            yield batch
+        except GeneratorExit:
+            self.cache.delete(building_cache_key)
+            raise
+
+        pipeline = self.cache.pipeline()
+        pipeline.rename(building_cache_key, cache_key)
+        pipeline.expire(cache_key, CACHE_TTL_SECONDS)
+        pipeline.set(count_cache_key, num_products, ex=CACHE_TTL_SECONDS)
+        pipeline.execute()
+        self.cache.track([cache_key, count_cache_key])
+
+    def _save_price_stats(self, batch: List[PriceStats], as_of: datetime.datetime):
+        self.price_stats_collection.bulk_write(
+            [ReplaceOne({"_id": x.product_id}, _price_stats_document(x, as_of), upsert=True) for x in batch],
+            ordered=False,
+        )
+
+        cache_keys = []
+        pipeline = self.cache.pipeline()
+        for price_stats in batch:
+            cache_key = self._versioned(f"{PRODUCT_PRICE_STATS_CACHE_PREFIX}_{price_stats.product_id}")
+            pipeline.set(cache_key, self.codec.encode_price_stats(price_stats), ex=CACHE_TTL_SECONDS)
+            cache_keys.append(cache_key)
+        pipeline.execute()
+        self.cache.track(cache_keys)
+
+    @staticmethod
+    def _timed_batches(batches: Iterator[List[Product]], duration_ns: int = 0) -> Generator[List[Product], None, int]:
+        # Only count the time spent producing batches, not the time the consumer spends on them
+        while True:
+            start = time.perf_counter_ns()
+            batch = next(batches, None)
+            duration_ns += time.perf_counter_ns() - start
+            if batch is None:
+                return duration_ns // 1000000
+            yield batch
+
+
+def _price_history_cache_key(
+    product_id: int,
+    start_date: Optional[datetime.datetime],
+    end_date: Optional[datetime.datetime],
+    resolution: Optional[str],
+) -> str:
+    cache_key = f"{PRODUCT_PRICE_HISTORY_CACHE_PREFIX}_{product_id}"
+    if (start_date is not None) or (end_date is not None) or (resolution is not None):
+        cache_key += f"_{resolution}_{_format_optional_date(start_date)}_{_format_optional_date(end_date)}"
+    if end_date is None:
+        # Histories run up to today, so they change every day even without new data
+        cache_key += f"_{datetime.date.today().isoformat()}"
+    return cache_key
+
+
+def _search_compound(search_query: str) -> dict:
+    # We want to make sure each word appears in the product name, so use a compound search
+    word_searches = []
+    for word in search_query.split():
+        word_searches.append({"autocomplete": {"query": word, "path": "display_name"}})
+    return {"must": word_searches}
+
+
+def _format_optional_date(date: Optional[datetime.datetime]) -> Optional[str]:
+    return None if date is None else date.strftime(DATE_FORMAT_STRING)
+
+
+def _price_stats_from_group(document: dict) -> PriceStats:
+    current_price_cents = document["current"]["price_cents"]
+    maximum_price_cents = document["maximum_price_cents"]
+
+    low_prices = {}
+    for name in LOW_WINDOW_DAYS:
+        prices_cents = [document[f"{name}_within"]]
+        if document[f"{name}_before"] is not None:
+            prices_cents.append(document[f"{name}_before"]["price_cents"])
+        low_prices[name] = float(min(x for x in prices_cents if x is not None)) / 100.0
+
+    if maximum_price_cents:
+        percent_off_high = round(100.0 * (maximum_price_cents - current_price_cents) / maximum_price_cents, 1)
+    else:
+        percent_off_high = 0.0
+
+    return PriceStats(
+        product_id=document["_id"],
+        current_price=float(current_price_cents) / 100.0,
+        current_price_date=document["current"]["start_date"].strftime(DATE_FORMAT_STRING),
+        minimum_price=float(document["minimum_price_cents"]) / 100.0,
+        maximum_price=float(maximum_price_cents) / 100.0,
+        num_price_changes=document["num_prices"] - 1,
+        percent_off_high=percent_off_high,
+        **low_prices,
+    )
+
+
+def _price_stats_document(price_stats: PriceStats, as_of: datetime.datetime) -> dict:
+    # Prices are stored in cents, as in the prices collection, to keep the documents small
+    document = {
+        "_id": price_stats.product_id,
+        "current_price_cents": round(price_stats.current_price * 100),
+        "current_price_date": price_stats.current_price_date,
+        "minimum_price_cents": round(price_stats.minimum_price * 100),
+        "maximum_price_cents": round(price_stats.maximum_price * 100),
+        "num_price_changes": price_stats.num_price_changes,
+        "percent_off_high": price_stats.percent_off_high,
+        "computed": as_of,
+    }
+    for name in LOW_WINDOW_DAYS:
+        document[f"{name}_cents"] = round(getattr(price_stats, name) * 100)
+    return document
+
+
+def _price_stats_from_document(document: dict) -> PriceStats:
+    return PriceStats(
+        product_id=document["_id"],
+        current_price=float(document["current_price_cents"]) / 100.0,
+        current_price_date=document["current_price_date"],
+        minimum_price=float(document["minimum_price_cents"]) / 100.0,
+        maximum_price=float(document["maximum_price_cents"]) / 100.0,
+        num_price_changes=document["num_price_changes"],
+        percent_off_high=document["percent_off_high"],
+        **{name: float(document[f"{name}_cents"]) / 100.0 for name in LOW_WINDOW_DAYS},
+    )
@@ -1,11 +1,22 @@
+import logging
 import os
 from typing import Iterable
 
 from pymongo import MongoClient
-from pymongo.collection import Collection
 from pymongo.database import Database
 
-from application.constants.app_constants import MAX_METRICS_DOCUMENTS, MAX_METRICS_SIZE
+from application.constants.app_constants import (
+    MAX_METRICS_DOCUMENTS,
+    MAX_METRICS_SIZE,
+    METRICS_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+)
+from application.data.circuit_breaker import CircuitBreaker, DatabaseUnavailableError, GuardedCollection
+from application.data.connection_pools import get_pool_size
+
+LOG = logging.getLogger(__name__)
 
 DATABASE_NAME = "price_history_metrics"
 
@@ -25,8 +36,14 @@ class Metrics:
             else:
                 self.disabled = False
 
+            # Metrics are best effort, so never hold up a request for long waiting on them
             self.client = MongoClient(
-                f"mongodb+srv://{username}:{password}@{host}/{DATABASE_NAME}?retryWrites=true&w=majority"
+                f"mongodb+srv://{username}:{password}@{host}/{DATABASE_NAME}?retryWrites=true&w=majority",
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=METRICS_TIMEOUT_MS,
+                maxPoolSize=get_pool_size("METRICS"),
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
             )
 
             database: Database = self.client[DATABASE_NAME]
@@ -40,27 +57,35 @@ class Metrics:
         self._create_capped_collection_if_not_exists("products_price_history_time", list_of_collections)
         self._create_capped_collection_if_not_exists("category_products_time", list_of_collections)
 
-        self.products_search_time_collection: Collection = self.database["products_search_time"]
-        self.products_price_history_time: Collection = self.database["products_price_history_time"]
-        self.category_products_time: Collection = self.database["category_products_time"]
+        self.breaker = CircuitBreaker("metrics")
+        self.products_search_time_collection = GuardedCollection(
+            self.database["products_search_time"], self.breaker, METRICS_TIMEOUT_MS
+        )
+        self.products_price_history_time = GuardedCollection(
+            self.database["products_price_history_time"], self.breaker, METRICS_TIMEOUT_MS
+        )
+        self.category_products_time = GuardedCollection(
+            self.database["category_products_time"], self.breaker, METRICS_TIMEOUT_MS
+        )
 
     def log_products_search_time(self, search_time_ms: int, query: str):
-        if self.disabled:
-            return
-
-        self.products_search_time_collection.insert_one({"search_time_ms": search_time_ms, "query": query})
+        self._insert(self.products_search_time_collection, {"search_time_ms": search_time_ms, "query": query})
 
     def log_products_price_history_time(self, time_ms: int, product_id: int):
-        if self.disabled:
-            return
-
-        self.products_price_history_time.insert_one({"time_ms": time_ms, "product_id": product_id})
+        self._insert(self.products_price_history_time, {"time_ms": time_ms, "product_id": product_id})
 
     def log_category_products_time(self, time_ms: int, category_id: int):
-        if self.disabled:
+        self._insert(self.category_products_time, {"time_ms": time_ms, "category_id": category_id})
+
+    def _insert(self, collection: GuardedCollection, document: dict):
+        # Losing some metrics is better than failing or slowing down the request being measured
+        if self.disabled or self.breaker.is_open:
             return
 
-        self.category_products_time.insert_one({"time_ms": time_ms, "category_id": category_id})
+        try:
+            collection.insert_one(document)
+        except DatabaseUnavailableError as e:
+            LOG.warning(f"Failed to log metrics: {e}")
 
     def _create_capped_collection_if_not_exists(self, collection_name: str, collection_names: Iterable[str]):
         if collection_name not in collection_names:
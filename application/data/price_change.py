@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class PriceChange:
+    product_id: int
+    display_name: str
+    # The price in effect at the start of the period, or None if the product had no price yet
+    previous_price: Optional[float]
+    price: float
+    num_changes: int
+    # The date the current price started
+    date: str
@@ -0,0 +1,48 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from application.data.price_history import PriceHistory
+
+
+@dataclass
+class ComparedProduct:
+    id: int
+    display_name: str
+    prices: List[Optional[float]]
+
+
+@dataclass
+class PriceComparison:
+    dates: List[str]
+    products: List[ComparedProduct]
+
+
+def compare_price_histories(price_histories: Dict[int, PriceHistory], display_names: Dict[int, str]) -> PriceComparison:
+    """
+    Aligns several price histories on one shared date axis.
+    Prices are step functions, so each product's price on a date is its most recent price on or before that date,
+    or None if the product had no price yet.
+
+    Args:
+        price_histories: the price history of each product, keyed by product ID
+        display_names: the display name of each product, keyed by product ID
+
+    Returns:
+        The aligned price histories
+    """
+    # Dates are formatted as YYYY-MM-DD, so they sort chronologically as strings
+    dates = sorted({date for price_history in price_histories.values() for date in price_history.dates})
+
+    products = []
+    for product_id, price_history in price_histories.items():
+        prices: List[Optional[float]] = []
+        index = 0
+        price = None
+        for date in dates:
+            while (index < len(price_history.dates)) and (price_history.dates[index] <= date):
+                price = price_history.prices[index]
+                index += 1
+            prices.append(price)
+        products.append(ComparedProduct(id=product_id, display_name=display_names[product_id], prices=prices))
+
+    return PriceComparison(dates=dates, products=products)
@@ -0,0 +1,259 @@
+import datetime
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import pymongo
+from bson import ObjectId
+
+from application.constants.app_constants import (
+    DATE_FORMAT_STRING,
+    JOB_QUERY_TIME_BUDGET_MS,
+    ONE_HOUR_IN_SECONDS,
+    PRICE_DROP_MAX_AGE_DAYS,
+    PRICE_DROPS_BATCH_SIZE,
+    PRICE_DROPS_CACHE_PREFIX,
+)
+from application.data.dao import ApplicationDao
+
+LOG = logging.getLogger(__name__)
+
+# Every drop, scored by percent off the previous price
+ALL_DROPS_KEY = f"{PRICE_DROPS_CACHE_PREFIX}all"
+# The drops of each category, scored by percent off the previous price
+CATEGORY_DROPS_KEY_PREFIX = f"{PRICE_DROPS_CACHE_PREFIX}c_"
+# Every drop, scored by when it happened so old drops can be trimmed
+DROP_TIMES_KEY = f"{PRICE_DROPS_CACHE_PREFIX}t"
+# The category, prices and date of each drop, keyed by product ID
+DROP_DETAILS_KEY = f"{PRICE_DROPS_CACHE_PREFIX}d"
+# The start date and ID of the newest price which has been processed, as "<start date>|<ID>"
+WATERMARK_KEY = f"{PRICE_DROPS_CACHE_PREFIX}w"
+LOCK_KEY = f"{PRICE_DROPS_CACHE_PREFIX}lock"
+
+
+@dataclass
+class PriceDrop:
+    product_id: int
+    display_name: str
+    category_id: Optional[int]
+    previous_price: float
+    price: float
+    percent_drop: float
+    # The date the dropped price started
+    date: str
+
+
+class PriceDrops:
+    """
+    Keeps leaderboards of the biggest recent price drops, overall and for each category, in Redis sorted sets.
+    The leaderboards are updated incrementally from prices newer than the last one processed, so reading the top
+    drops never needs a scan over the prices.
+    """
+
+    def __init__(self, dao: ApplicationDao):
+        self.dao = dao
+        self.cache = dao.cache
+
+    def get_top_drops(self, limit: int, category_id: Optional[int] = None) -> List[PriceDrop]:
+        """
+        Gets the biggest recent price drops, with the biggest first.
+
+        Args:
+            limit: the number of drops to get
+            category_id: only get drops of products in this category
+
+        Returns:
+            The price drops
+        """
+        key = ALL_DROPS_KEY if category_id is None else f"{CATEGORY_DROPS_KEY_PREFIX}{category_id}"
+        product_ids = [int(x) for x in self.cache.zrevrange(key, 0, limit - 1)]
+        if not product_ids:
+            return []
+
+        details = self.cache.hmget(DROP_DETAILS_KEY, product_ids)
+        display_names = self.dao.get_product_display_names(product_ids)
+
+        drops = []
+        for product_id, detail in zip(product_ids, details):
+            # A drop trimmed between reading the leaderboard and its details is skipped
+            if detail is None:
+                continue
+            category_id, previous_price_cents, price_cents, date = detail.decode().split(":")
+            drops.append(
+                PriceDrop(
+                    product_id=product_id,
+                    display_name=display_names[product_id],
+                    category_id=int(category_id) if category_id else None,
+                    previous_price=float(previous_price_cents) / 100.0,
+                    price=float(price_cents) / 100.0,
+                    percent_drop=_percent_drop(int(previous_price_cents), int(price_cents)),
+                    date=date,
+                )
+            )
+        return drops
+
+    def update(self, batch_size: int = PRICE_DROPS_BATCH_SIZE) -> int:
+        """
+        Updates the leaderboards from the prices which started after the newest one already processed, then trims
+        drops older than PRICE_DROP_MAX_AGE_DAYS.
+        The first update only processes prices from within that age.
+        This is meant to be run as a batch job after each scrape.
+
+        Args:
+            batch_size: the number of prices processed at a time
+
+        Returns:
+            The number of prices processed
+
+        Raises:
+            RuntimeError: if another update is already running.
+        """
+        # Only one update may run at a time, or drops could be processed twice or out of order
+        lock_token = uuid.uuid4().hex
+        if not self.cache.client.set(LOCK_KEY, lock_token, nx=True, ex=ONE_HOUR_IN_SECONDS):
+            raise RuntimeError("The price drops are already being updated")
+
+        try:
+            return self._update(batch_size)
+        finally:
+            if self.cache.client.get(LOCK_KEY) == lock_token.encode():
+                self.cache.client.delete(LOCK_KEY)
+
+    def _update(self, batch_size: int) -> int:
+        oldest_date = datetime.datetime.today() - datetime.timedelta(days=PRICE_DROP_MAX_AGE_DAYS)
+        watermark = _parse_watermark(self.cache.client.get(WATERMARK_KEY))
+        if (watermark is None) or (watermark[0] < oldest_date):
+            watermark = (oldest_date, None)
+
+        documents = self.dao.prices_collection.find(
+            filter=_after_watermark_filter(watermark),
+            projection={"_id": 1, "product_id": 1, "start_date": 1, "price_cents": 1},
+            # Prices with the same start date are ordered by ID, so a watermark inside a date resumes after it
+            sort=[("start_date", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+            batch_size=batch_size,
+            max_time_ms=JOB_QUERY_TIME_BUDGET_MS,
+        )
+
+        # The latest price seen for each product, so prices of the same product in later batches are compared to it
+        last_prices_cents: Dict[int, int] = {}
+        categories: Dict[int, Optional[int]] = {}
+        num_prices = 0
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                self._process_batch(batch, watermark, last_prices_cents, categories)
+                num_prices += len(batch)
+                batch = []
+        if batch:
+            self._process_batch(batch, watermark, last_prices_cents, categories)
+            num_prices += len(batch)
+
+        self._trim(oldest_date)
+        return num_prices
+
+    def _process_batch(
+        self,
+        documents: List[dict],
+        watermark: Tuple[datetime.datetime, Optional[ObjectId]],
+        last_prices_cents: Dict[int, int],
+        categories: Dict[int, Optional[int]],
+    ):
+        new_product_ids = list({x["product_id"] for x in documents if x["product_id"] not in last_prices_cents})
+        if new_product_ids:
+            last_prices_cents.update(self._get_prices_before(new_product_ids, watermark))
+            categories.update(self._get_categories(new_product_ids))
+
+        pipeline = self.cache.pipeline()
+        for document in documents:
+            product_id = document["product_id"]
+            category_id = categories.get(product_id)
+            category_key = f"{CATEGORY_DROPS_KEY_PREFIX}{category_id}"
+            previous_price_cents = last_prices_cents.get(product_id)
+            price_cents = document["price_cents"]
+            last_prices_cents[product_id] = price_cents
+
+            if (previous_price_cents is not None) and (price_cents < previous_price_cents):
+                percent_drop = _percent_drop(previous_price_cents, price_cents)
+                date = document["start_date"]
+                pipeline.zadd(ALL_DROPS_KEY, {product_id: percent_drop})
+                pipeline.zadd(category_key, {product_id: percent_drop})
+                pipeline.zadd(DROP_TIMES_KEY, {product_id: date.timestamp()})
+                pipeline.hset(
+                    DROP_DETAILS_KEY,
+                    product_id,
+                    f"{'' if category_id is None else category_id}:{previous_price_cents}:{price_cents}:"
+                    f"{date.strftime(DATE_FORMAT_STRING)}",
+                )
+            else:
+                # The product's latest change isn't a drop, so it no longer has a deal
+                pipeline.zrem(ALL_DROPS_KEY, product_id)
+                pipeline.zrem(category_key, product_id)
+                pipeline.zrem(DROP_TIMES_KEY, product_id)
+                pipeline.hdel(DROP_DETAILS_KEY, product_id)
+
+        # Saved with the batch, so an interrupted update carries on from where it stopped
+        pipeline.set(WATERMARK_KEY, f"{documents[-1]['start_date'].isoformat()}|{documents[-1]['_id']}")
+        pipeline.execute()
+
+    def _get_prices_before(
+        self, product_ids: List[int], watermark: Tuple[datetime.datetime, Optional[ObjectId]]
+    ) -> Dict[int, int]:
+        # One query finds the price each product had up to the watermark, using the product and start date index
+        date, last_id = watermark
+        if last_id is None:
+            before_filter = {"start_date": {"$lte": date}}
+        else:
+            before_filter = {"$or": [{"start_date": {"$lt": date}}, {"start_date": date, "_id": {"$lte": last_id}}]}
+        documents = self.dao.prices_collection.aggregate(
+            [
+                {"$match": {"product_id": {"$in": product_ids}, **before_filter}},
+                {"$sort": {"product_id": pymongo.ASCENDING, "start_date": pymongo.ASCENDING, "_id": pymongo.ASCENDING}},
+                {"$group": {"_id": "$product_id", "price_cents": {"$last": "$price_cents"}}},
+            ],
+            maxTimeMS=JOB_QUERY_TIME_BUDGET_MS,
+        )
+        return {x["_id"]: x["price_cents"] for x in documents}
+
+    def _get_categories(self, product_ids: List[int]) -> Dict[int, Optional[int]]:
+        documents = self.dao.products_collection.find(
+            filter={"id": {"$in": product_ids}}, projection={"_id": 0, "id": 1, "category": 1}
+        )
+        return {x["id"]: x.get("category") for x in documents}
+
+    def _trim(self, oldest_date: datetime.datetime):
+        product_ids = self.cache.zrangebyscore(DROP_TIMES_KEY, "-inf", oldest_date.timestamp())
+        if not product_ids:
+            return
+
+        details = self.cache.hmget(DROP_DETAILS_KEY, product_ids)
+        pipeline = self.cache.pipeline()
+        for product_id, detail in zip(product_ids, details):
+            if detail is not None:
+                category_id = detail.decode().split(":")[0] or None
+                pipeline.zrem(f"{CATEGORY_DROPS_KEY_PREFIX}{category_id}", product_id)
+        pipeline.zrem(ALL_DROPS_KEY, *product_ids)
+        pipeline.zrem(DROP_TIMES_KEY, *product_ids)
+        pipeline.hdel(DROP_DETAILS_KEY, *product_ids)
+        pipeline.execute()
+        LOG.info(f"Trimmed {len(product_ids):,} price drops from before {oldest_date:%Y-%m-%d}")
+
+
+def _parse_watermark(value: Optional[bytes]) -> Optional[Tuple[datetime.datetime, Optional[ObjectId]]]:
+    if not value:
+        return None
+    date, _, last_id = value.decode().partition("|")
+    return datetime.datetime.fromisoformat(date), ObjectId(last_id)
+
+
+def _after_watermark_filter(watermark: Tuple[datetime.datetime, Optional[ObjectId]]) -> dict:
+    date, last_id = watermark
+    if last_id is None:
+        return {"start_date": {"$gt": date}}
+    # Several prices can share a start date, such as from two scrapes on one day, so resume after the last ID
+    return {"$or": [{"start_date": {"$gt": date}}, {"start_date": date, "_id": {"$gt": last_id}}]}
+
+
+def _percent_drop(previous_price_cents: int, price_cents: int) -> float:
+    return round(100.0 * (previous_price_cents - price_cents) / previous_price_cents, 1)
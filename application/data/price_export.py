@@ -0,0 +1,67 @@
+import csv
+import datetime
+import io
+import json
+from typing import Iterable, Iterator
+
+from application.constants.app_constants import EXPORT_CHUNK_ROWS
+
+# Export formats mapped to the mimetype of the response
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_FIELDS = ("product_id", "start_date", "price_cents")
+
+
+def iter_export_chunks(
+    documents: Iterable[dict], export_format: str, chunk_rows: int = EXPORT_CHUNK_ROWS
+) -> Iterator[str]:
+    """
+    Encodes price documents in the given format, yielding the output in chunks of rows.
+    Only one chunk is held in memory at a time.
+
+    Args:
+        documents: the price documents to export
+        export_format: one of the keys of EXPORT_FORMATS
+        chunk_rows: the number of rows to encode before yielding a chunk
+
+    Returns:
+        An iterator of encoded chunks
+
+    Raises:
+        ValueError: if the export format is not supported.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {export_format!r}!")
+
+    buffer = io.StringIO()
+    if export_format == "csv":
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(EXPORT_FIELDS)
+        write_row = writer.writerow
+    else:
+        encoder = json.JSONEncoder(separators=(",", ":"))
+
+        def write_row(row):
+            buffer.write(encoder.encode(dict(zip(EXPORT_FIELDS, row))))
+            buffer.write("\n")
+
+    num_rows = 0
+    for document in documents:
+        write_row(_document_to_row(document))
+        num_rows += 1
+        if num_rows % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    remaining = buffer.getvalue()
+    if remaining:
+        yield remaining
+
+
+def _document_to_row(document: dict) -> tuple:
+    start_date: datetime.datetime = document["start_date"]
+    return document["product_id"], start_date.isoformat(), document["price_cents"]
@@ -1,13 +1,88 @@
+import datetime
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
+
+from application.constants.app_constants import DATE_FORMAT_STRING
 
 
 @dataclass
 class PriceHistory:
+    # Slots can't be combined with field defaults, so every field must be given
+    __slots__ = (
+        "dates",
+        "prices",
+        "current_price",
+        "minimum_price",
+        "maximum_price",
+        "minimum_price_date",
+        "maximum_price_date",
+    )
+
     dates: List[str]
     prices: List[float]
     current_price: float
     minimum_price: float
     maximum_price: float
-    minimum_price_date: str = None
-    maximum_price_date: str = None
+    minimum_price_date: Optional[str]
+    maximum_price_date: Optional[str]
+
+
+def build_price_history(
+    dates: List[datetime.datetime],
+    prices: List[float],
+    end_date: Optional[datetime.datetime] = None,
+    extend_to_end: bool = True,
+) -> PriceHistory:
+    """
+    Builds a price history from the dates a product's price changed and the prices it changed to.
+
+    Args:
+        dates: the dates of the price changes, oldest first
+        prices: the price from each date
+        end_date: the end of the range, or None to run up to today
+        extend_to_end: whether to add a point for the end of the range with the last price. Without it, the dates of
+            a minimum or maximum price which is still current are None.
+
+    Returns:
+        The price history
+    """
+    dates = list(dates)
+    prices = list(prices)
+
+    # Ensure we add a data point for the end of the range based on the most recent data point
+    current_price = prices[-1] if prices else None
+    todays_date = datetime.datetime.today()
+    if (end_date is not None) and (end_date < todays_date):
+        todays_date = end_date
+    if dates and extend_to_end:
+        dates.append(todays_date)
+        prices.append(prices[-1])
+
+    minimum_price = None
+    maximum_price = None
+    minimum_price_date = None
+    maximum_price_date = None
+    for i in range(len(prices)):
+        price = prices[i]
+        if (minimum_price is None) or (minimum_price >= price):
+            minimum_price = price
+            if i < len(dates) - 1:
+                minimum_price_date = dates[i + 1] - datetime.timedelta(days=1)
+            else:
+                minimum_price_date = todays_date if extend_to_end else None
+        if (maximum_price is None) or (maximum_price <= price):
+            maximum_price = price
+            if i < len(dates) - 1:
+                maximum_price_date = dates[i + 1] - datetime.timedelta(days=1)
+            else:
+                maximum_price_date = todays_date if extend_to_end else None
+
+    return PriceHistory(
+        dates=[x.strftime(DATE_FORMAT_STRING) for x in dates],
+        prices=prices,
+        current_price=current_price,
+        minimum_price=minimum_price,
+        maximum_price=maximum_price,
+        minimum_price_date=None if minimum_price_date is None else minimum_price_date.strftime(DATE_FORMAT_STRING),
+        maximum_price_date=None if maximum_price_date is None else maximum_price_date.strftime(DATE_FORMAT_STRING),
+    )
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+
+# The fields holding the lowest price over a window, and the number of days in the window
+LOW_WINDOW_DAYS = {"low_30_days": 30, "low_90_days": 90, "low_365_days": 365}
+
+
+@dataclass
+class PriceStats:
+    # Stats are read for every product in a listing, so slots keep them small like products
+    __slots__ = (
+        "product_id",
+        "current_price",
+        "current_price_date",
+        "minimum_price",
+        "maximum_price",
+        "low_30_days",
+        "low_90_days",
+        "low_365_days",
+        "num_price_changes",
+        "percent_off_high",
+    )
+
+    product_id: int
+    current_price: float
+    # The date the current price started
+    current_price_date: str
+    minimum_price: float
+    maximum_price: float
+    # The lowest price in effect at any time over the last 30, 90 and 365 days
+    low_30_days: float
+    low_90_days: float
+    low_365_days: float
+    num_price_changes: int
+    percent_off_high: float
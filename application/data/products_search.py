@@ -3,5 +3,8 @@ from dataclasses import dataclass
 
 @dataclass
 class Product:
+    # Slots make each product smaller and faster to create, which matters for listings of thousands of products
+    __slots__ = ("id", "display_name")
+
     id: int
     display_name: str
@@ -0,0 +1,103 @@
+import logging
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator
+
+import redis
+
+from application.constants.app_constants import CONCURRENCY_CACHE_PREFIX, RATE_LIMIT_CACHE_PREFIX
+
+LOG = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Limits how often clients may call expensive endpoints, and how many expensive operations run at once.
+    State is kept in Redis so limits are shared by every process.
+    """
+
+    def __init__(self, cache: redis.Redis):
+        self.cache = cache
+
+    def allow(self, endpoint: str, client_id: str, per_minute: float, burst: int) -> bool:
+        """
+        Takes a token from the client's bucket for an endpoint.
+        Buckets hold up to `burst` tokens and refill at `per_minute` tokens a minute.
+
+        Args:
+            endpoint: the name of the endpoint being called
+            client_id: identifies the client, such as its IP address
+            per_minute: the sustained number of calls allowed a minute
+            burst: the number of calls allowed at once
+
+        Returns:
+            True if the call is allowed, False if the client is over its limit
+        """
+        cache_key = f"{RATE_LIMIT_CACHE_PREFIX}{endpoint}_{client_id}"
+        rate_per_second = per_minute / 60.0
+
+        def take_token(pipeline) -> bool:
+            tokens, updated = pipeline.hmget(cache_key, "tokens", "updated")
+            now = time.time()
+            if tokens is None:
+                tokens = float(burst)
+            else:
+                tokens = min(float(burst), float(tokens) + (now - float(updated)) * rate_per_second)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            pipeline.multi()
+            pipeline.hset(cache_key, mapping={"tokens": tokens, "updated": now})
+            # A bucket which has been idle long enough to refill is the same as no bucket
+            pipeline.expire(cache_key, math.ceil(burst / rate_per_second) + 1)
+            return allowed
+
+        allowed = self.cache.transaction(take_token, cache_key, value_from_callable=True)
+        if not allowed:
+            LOG.warning(f"Client {client_id} is over the rate limit for {endpoint}")
+        return allowed
+
+    @staticmethod
+    def retry_after_seconds(per_minute: float) -> int:
+        return math.ceil(60.0 / per_minute)
+
+    @contextmanager
+    def concurrency_slot(self, name: str, max_concurrent: int, timeout_seconds: int) -> Iterator[bool]:
+        """
+        Tries to take one of a limited number of slots for running an expensive operation.
+        Slots are released when the context exits, or after the timeout if the process holding one dies.
+
+        Args:
+            name: the name of the operation
+            max_concurrent: the number of operations allowed to run at once across every process
+            timeout_seconds: how long a slot can be held before it is assumed to be abandoned
+
+        Returns:
+            A context which gives True if a slot was taken, False if all slots are in use
+        """
+        cache_key = f"{CONCURRENCY_CACHE_PREFIX}{name}"
+        token = uuid.uuid4().hex
+        now = time.time()
+
+        pipeline = self.cache.pipeline()
+        pipeline.zremrangebyscore(cache_key, "-inf", now - timeout_seconds)
+        pipeline.zadd(cache_key, {token: now})
+        # Counted rather than ranked, as slots taken at the same time rank in the random order of their tokens
+        pipeline.zcard(cache_key)
+        pipeline.expire(cache_key, timeout_seconds)
+        num_slots = pipeline.execute()[2]
+
+        acquired = num_slots <= max_concurrent
+        if not acquired:
+            LOG.warning(f"All {max_concurrent} slots for {name} are in use")
+            self.cache.zrem(cache_key, token)
+
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.cache.zrem(cache_key, token)
@@ -0,0 +1,182 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+
+class Span:
+    """
+    A timed step of a request, such as one cache or database call, with the steps it made while running.
+    """
+
+    __slots__ = ("name", "duration_ns", "count", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.duration_ns = 0
+        # The number of times the step was resumed, such as the number of batches fetched by a cursor
+        self.count = 0
+        self.children: List["Span"] = []
+
+    @property
+    def category(self) -> str:
+        return self.name.partition(".")[0]
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration_ns / 1000000
+
+
+# The span of the step running in this thread, or None if no request is being traced
+_CURRENT_SPAN: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def start_trace(name: str) -> Span:
+    """
+    Starts tracing the steps of a request run in this thread.
+
+    Args:
+        name: the name of the request
+
+    Returns:
+        The root span of the trace
+    """
+    root = Span(name)
+    root.count = 1
+    _CURRENT_SPAN.set(root)
+    return root
+
+
+def end_trace():
+    _CURRENT_SPAN.set(None)
+
+
+def current_span() -> Optional[Span]:
+    return _CURRENT_SPAN.get()
+
+
+def set_current_span(span: Optional[Span]):
+    _CURRENT_SPAN.set(span)
+
+
+def open_span(name: str) -> Optional[Span]:
+    """
+    Adds a span to the current span, without starting to time it.
+    This is for steps which run a bit at a time, such as a cursor fetching batches, which are timed with `resume`.
+
+    Args:
+        name: the name of the step, starting with its category such as "cache." or "mongo."
+
+    Returns:
+        The span, or None if no request is being traced
+    """
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        return None
+
+    span = Span(name)
+    parent.children.append(span)
+    return span
+
+
+@contextmanager
+def resume(span: Optional[Span]) -> Iterator[Optional[Span]]:
+    """
+    Times a step, making it the current span so the steps it makes are added to it.
+
+    Args:
+        span: the span opened for the step, which may be None if no request is being traced
+
+    Returns:
+        A context which gives the span
+    """
+    if span is None:
+        yield None
+        return
+
+    parent = _CURRENT_SPAN.get()
+    _CURRENT_SPAN.set(span)
+    start = time.perf_counter_ns()
+    try:
+        yield span
+    finally:
+        span.duration_ns += time.perf_counter_ns() - start
+        span.count += 1
+        # Restore the parent rather than resetting a token, as a streamed response may resume a step in another context
+        _CURRENT_SPAN.set(parent)
+
+
+def span(name: str):
+    """
+    Times a step of the current request.
+
+    Args:
+        name: the name of the step, starting with its category such as "cache." or "mongo."
+
+    Returns:
+        A context which gives the span, or None if no request is being traced
+    """
+    return resume(open_span(name))
+
+
+def summarize(root: Span) -> Dict[str, Span]:
+    """
+    Totals the time spent in each category of step, such as cache or Mongo calls.
+    Only the time a step spends outside of its child steps is counted, so the categories add up to the request time
+    and rendering a template doesn't include the queries it makes.
+
+    Args:
+        root: the root span of a trace
+
+    Returns:
+        A span for each category, holding the total duration and number of calls
+    """
+    totals: Dict[str, Span] = {}
+    pending = [(root, None)]
+    while pending:
+        span, parent_category = pending.pop()
+        total = totals.setdefault(span.category, Span(span.category))
+        # Children run in parallel threads can add up to more than their parent, so don't count negative time
+        total.duration_ns += max(0, span.duration_ns - sum(x.duration_ns for x in span.children))
+        # Steps inside a step of the same category, such as the eviction done by a cache write, are one call
+        if span.category != parent_category:
+            total.count += span.count
+        pending.extend((x, span.category) for x in span.children)
+    return totals
+
+
+def format_server_timing(root: Span) -> str:
+    """
+    Formats the time spent in each category of step as a Server-Timing header.
+
+    Args:
+        root: the root span of a trace
+
+    Returns:
+        The value of the header
+    """
+    metrics = [
+        f'{name};dur={total.duration_ms:.1f};desc="{total.count} calls"'
+        for name, total in sorted(summarize(root).items())
+    ]
+    return ", ".join(metrics)
+
+
+def format_span_tree(root: Span) -> str:
+    """
+    Formats a trace as an indented tree, with the duration and count of each step.
+
+    Args:
+        root: the root span of a trace
+
+    Returns:
+        The formatted tree
+    """
+    lines = []
+    pending = [(root, 0)]
+    while pending:
+        span, depth = pending.pop()
+        count = f" x{span.count}" if span.count > 1 else ""
+        lines.append(f"{'  ' * depth}{span.name} {span.duration_ms:.1f} ms{count}")
+        pending.extend((x, depth + 1) for x in reversed(span.children))
+    return "\n".join(lines)
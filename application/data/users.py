@@ -1,18 +1,39 @@
+import datetime
 import logging
 import os
 import uuid
+from dataclasses import asdict
 from email.utils import parseaddr
-from typing import Optional, List
+from typing import Dict, List, Optional, Tuple
 
 import bcrypt
 import pymongo
-from pymongo import MongoClient
-from pymongo.collection import Collection
+from pymongo import MongoClient, ReplaceOne
 from pymongo.database import Database
 
-from application import ApplicationDao
+from application.constants.app_constants import (
+    DATE_FORMAT_STRING,
+    FAVORITES_DIGEST_BATCH_SIZE,
+    JOB_QUERY_TIME_BUDGET_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    USERS_QUERY_TIME_BUDGET_MS,
+)
+from application.data import tracing
+from application.data.circuit_breaker import CircuitBreaker, GuardedCollection
+from application.data.connection_pools import get_pool_size
+from application.data.dao import ApplicationDao
+from application.data.price_change import PriceChange
 from application.data.products_search import Product
 
+try:
+    from gevent import get_hub
+    from gevent.monkey import is_module_patched
+except ImportError:
+    get_hub = None
+
 LOG = logging.getLogger(__name__)
 
 DATABASE_NAME = "price_history_users"
@@ -27,6 +48,12 @@ USER_PASSWORD_FIELD = "password"
 FAVORITES_USER_ID_FIELD = "user_id"
 FAVORITES_PRODUCT_ID_FIELD = "product_id"
 
+# Favorites digests collection fields
+DIGEST_USER_ID_FIELD = "_id"
+DIGEST_SINCE_FIELD = "since"
+DIGEST_COMPUTED_FIELD = "computed"
+DIGEST_CHANGES_FIELD = "changes"
+
 
 class Users:
     def __init__(self, dao: ApplicationDao, database: Database = None):
@@ -38,25 +65,38 @@ class Users:
             password = os.environ.get("USERS_PASSWORD")
             host = os.environ.get("MONGO_HOST")
             self.client = MongoClient(
-                f"mongodb+srv://{username}:{password}@{host}/{DATABASE_NAME}" f"?retryWrites=true&w=majority"
+                f"mongodb+srv://{username}:{password}@{host}/{DATABASE_NAME}" f"?retryWrites=true&w=majority",
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                maxPoolSize=get_pool_size("USERS"),
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
             )
 
             database: Database = self.client[DATABASE_NAME]
 
         # Set up database and collection variables
         self.database = database
+        self.breaker = CircuitBreaker("users")
 
         # Users collection
-        self.users_collection: Collection = self.database["users"]
+        self.users_collection = GuardedCollection(self.database["users"], self.breaker, USERS_QUERY_TIME_BUDGET_MS)
         self.users_collection.create_index([(USER_ID_FIELD, pymongo.ASCENDING)], unique=True)
         self.users_collection.create_index([(USER_EMAIL_FIELD, pymongo.ASCENDING)], unique=True)
 
         # Favorites collection
-        self.favorites_collection: Collection = self.database["favorites"]
+        self.favorites_collection = GuardedCollection(
+            self.database["favorites"], self.breaker, USERS_QUERY_TIME_BUDGET_MS
+        )
         self.favorites_collection.create_index(
             [(FAVORITES_USER_ID_FIELD, pymongo.ASCENDING), (FAVORITES_PRODUCT_ID_FIELD, pymongo.ASCENDING)], unique=True
         )
 
+        # Favorites digests collection, holding the favorites of each user which changed price, keyed by user ID
+        self.favorites_digests_collection = GuardedCollection(
+            self.database["favorites_digests"], self.breaker, USERS_QUERY_TIME_BUDGET_MS
+        )
+
     def get_user_name(self, user_email: str) -> Optional[str]:
         if user_email is None:
             return None
@@ -208,6 +248,83 @@ class Users:
             self.favorites_collection.insert_one(favorite_dict)
             return True
 
+    def get_favorites_digest(self, user_id: str) -> Optional[Tuple[str, List[PriceChange]]]:
+        """
+        Gets the favorites of a user which changed price, as of the last run of the favorites digest job.
+
+        Args:
+            user_id: The user ID
+
+        Returns:
+            The date the changes are since and the changes, biggest number of changes first,
+            or None if the job hasn't been run or none of the user's favorites changed price
+        """
+        document = self.favorites_digests_collection.find_one({DIGEST_USER_ID_FIELD: user_id})
+        if document is None:
+            return None
+
+        changes = [PriceChange(**x) for x in document[DIGEST_CHANGES_FIELD]]
+        return document[DIGEST_SINCE_FIELD].strftime(DATE_FORMAT_STRING), changes
+
+    def compute_favorites_digests(
+        self, since: datetime.datetime, batch_size: int = FAVORITES_DIGEST_BATCH_SIZE
+    ) -> Tuple[int, int]:
+        """
+        Finds the favorites of every user which changed price since a date, and saves them as each user's digest.
+        The price changes of each distinct favorited product are found once, in batches, then fanned out to the users
+        who favorited it, so the cost grows with the number of favorited products rather than with the number of
+        favorites.
+        Digests of users with no changed favorites are removed.
+
+        Args:
+            since: find price changes after this date
+            batch_size: the number of products checked by each price query
+
+        Returns:
+            The number of distinct favorited products and the number of users with a digest
+        """
+        computed = datetime.datetime.now()
+        product_ids = self.favorites_collection.distinct(FAVORITES_PRODUCT_ID_FIELD, maxTimeMS=JOB_QUERY_TIME_BUDGET_MS)
+        changes = self.dao.get_price_changes_since(product_ids, since, batch_size=batch_size)
+
+        # Only the favorites of changed products are read, grouped by user in one pass
+        user_changes: Dict[str, List[PriceChange]] = {}
+        documents = self.favorites_collection.find(
+            filter={FAVORITES_PRODUCT_ID_FIELD: {"$in": list(changes)}},
+            projection={"_id": 0, FAVORITES_USER_ID_FIELD: 1, FAVORITES_PRODUCT_ID_FIELD: 1},
+            batch_size=batch_size,
+            max_time_ms=JOB_QUERY_TIME_BUDGET_MS,
+        )
+        for document in documents:
+            user_changes.setdefault(document[FAVORITES_USER_ID_FIELD], []).append(
+                changes[document[FAVORITES_PRODUCT_ID_FIELD]]
+            )
+
+        requests = []
+        for user_id, price_changes in user_changes.items():
+            price_changes.sort(key=lambda x: (-x.num_changes, x.display_name))
+            requests.append(
+                ReplaceOne(
+                    {DIGEST_USER_ID_FIELD: user_id},
+                    {
+                        DIGEST_USER_ID_FIELD: user_id,
+                        DIGEST_SINCE_FIELD: since,
+                        DIGEST_COMPUTED_FIELD: computed,
+                        DIGEST_CHANGES_FIELD: [asdict(x) for x in price_changes],
+                    },
+                    upsert=True,
+                )
+            )
+            if len(requests) >= batch_size:
+                self.favorites_digests_collection.bulk_write(requests, ordered=False)
+                requests = []
+        if requests:
+            self.favorites_digests_collection.bulk_write(requests, ordered=False)
+
+        # Digests which weren't replaced by this run are out of date
+        self.favorites_digests_collection.delete_many({DIGEST_COMPUTED_FIELD: {"$lt": computed}})
+        return len(product_ids), len(user_changes)
+
     def _user_exists(self, user_id: str) -> bool:
         user_document = self.users_collection.find_one(filter={USER_ID_FIELD: user_id})
         if user_document:
@@ -222,9 +339,19 @@ class Users:
     def _generate_user_password_hash(user_password: str) -> str:
         # Hash a password for the first time
         #   (Using bcrypt, the salt is saved into the hash itself)
-        return bcrypt.hashpw(user_password.encode("utf8"), bcrypt.gensalt()).decode("utf8")
+        with tracing.span("bcrypt.hash"):
+            return _run_blocking(bcrypt.hashpw, user_password.encode("utf8"), bcrypt.gensalt()).decode("utf8")
 
     @staticmethod
     def _password_is_correct(password_guess: str, user_password_hash: str) -> bool:
         # Check hashed password. Using bcrypt, the salt is saved into the hash itself
-        return bcrypt.checkpw(password_guess.encode("utf8"), user_password_hash.encode("utf8"))
+        with tracing.span("bcrypt.check"):
+            return _run_blocking(bcrypt.checkpw, password_guess.encode("utf8"), user_password_hash.encode("utf8"))
+
+
+def _run_blocking(function, *args):
+    # bcrypt is slow on purpose and never yields, so under gevent it would stall every other request of the worker.
+    # Running it in gevent's pool of real threads lets the other requests carry on, as bcrypt releases the GIL.
+    if (get_hub is not None) and is_module_patched("threading"):
+        return get_hub().threadpool.apply(function, args)
+    return function(*args)
@@ -1,15 +1,32 @@
+import dataclasses
 import logging
+from contextlib import ExitStack
 
-from flask import Blueprint, current_app, redirect, request, flash, session
+from flask import Blueprint, Response, current_app, redirect, request, flash, session, stream_with_context
 from flask_accept import accept
 
 from application.constants.app_constants import (
+    DATABASE_CONFIG_KEY,
+    EXPORT_CONCURRENCY_SLOT_TIMEOUT_SECONDS,
+    EXPORT_RATE_LIMIT_BURST,
+    EXPORT_RATE_LIMIT_PER_MINUTE,
+    LOGIN_RATE_LIMIT_BURST,
+    LOGIN_RATE_LIMIT_PER_MINUTE,
+    MAX_CONCURRENT_EXPORTS,
+    PRICE_DROPS_CONFIG_KEY,
+    RATE_LIMITER_CONFIG_KEY,
     USERS_CONFIG_KEY,
     SESSION_USER_NAME_KEY,
     SESSION_USER_EMAIL_KEY,
     SESSION_USER_ID_KEY,
 )
+from application.data.dao import ApplicationDao
+from application.data.price_comparison import compare_price_histories
+from application.data.price_drops import PriceDrops
+from application.data.price_export import EXPORT_FORMATS, iter_export_chunks
+from application.data.rate_limiter import RateLimiter
 from application.data.users import Users
+from application.routes.request_args import get_compared_product_ids, get_deals_args, get_price_history_args
 
 LOG = logging.getLogger(__name__)
 
@@ -55,6 +72,12 @@ def login_api():
     if (user_email is None) or (password is None):
         return "Did not supply user name and password!", 400
     else:
+        # Each attempt costs a password hash check, so limit how often each client can try
+        rate_limiter = _get_rate_limiter()
+        if not rate_limiter.allow("login", request.remote_addr, LOGIN_RATE_LIMIT_PER_MINUTE, LOGIN_RATE_LIMIT_BURST):
+            retry_after = rate_limiter.retry_after_seconds(LOGIN_RATE_LIMIT_PER_MINUTE)
+            return "Too many login attempts! Please try again later.", 429, {"Retry-After": str(retry_after)}
+
         users = _get_users()
         user_id = users.user_auth(user_email, password)
         if user_id:
@@ -82,5 +105,106 @@ def toggle_favorite(product_id: int):
     return {"is_favorite": is_favorite}, 201
 
 
+@API_BLUEPRINT.route("/export/prices", methods=["GET"])
+def export_prices():
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return f"Export format must be one of {', '.join(EXPORT_FORMATS)}!", 400
+
+    rate_limiter = _get_rate_limiter()
+    if not rate_limiter.allow("export", request.remote_addr, EXPORT_RATE_LIMIT_PER_MINUTE, EXPORT_RATE_LIMIT_BURST):
+        retry_after = rate_limiter.retry_after_seconds(EXPORT_RATE_LIMIT_PER_MINUTE)
+        return "Too many exports! Please try again later.", 429, {"Retry-After": str(retry_after)}
+
+    try:
+        # Parsed here rather than with type=int, which would quietly ignore a bad ID and export every price
+        category_id = request.args.get("category_id", None)
+        if category_id is not None:
+            category_id = int(category_id)
+        product_ids = request.args.get("product_ids", None)
+        if product_ids is not None:
+            product_ids = [int(x) for x in product_ids.split(",") if x]
+    except ValueError:
+        return "Product and category IDs must be integers!", 400
+
+    # Exports read every price they match, so limit how many run at once across every process too
+    with ExitStack() as stack:
+        if not stack.enter_context(
+            rate_limiter.concurrency_slot("export", MAX_CONCURRENT_EXPORTS, EXPORT_CONCURRENCY_SLOT_TIMEOUT_SECONDS)
+        ):
+            return "Too many exports in progress! Please try again later.", 429, {"Retry-After": "60"}
+        documents = _get_dao().iter_price_documents(product_ids=product_ids, category_id=category_id)
+        response = Response(
+            stream_with_context(iter_export_chunks(documents, export_format)), mimetype=EXPORT_FORMATS[export_format]
+        )
+        response.headers["Content-Disposition"] = f"attachment; filename=prices.{export_format}"
+        # The export runs as the response streams, so the slot is held until the response is closed, which happens
+        # whether or not the client stays to read it
+        response.call_on_close(stack.pop_all().close)
+    return response
+
+
+@API_BLUEPRINT.route("/price_history/<product_id>", methods=["GET"])
+def price_history_api(product_id: int):
+    product_id = int(product_id)
+
+    try:
+        start_date, end_date, resolution = get_price_history_args(request.args)
+    except ValueError as e:
+        return str(e), 400
+
+    price_history = _get_dao().get_product_price_history(
+        product_id, start_date=start_date, end_date=end_date, resolution=resolution
+    )
+    return dataclasses.asdict(price_history)
+
+
+@API_BLUEPRINT.route("/price_stats/<product_id>", methods=["GET"])
+def price_stats_api(product_id: int):
+    price_stats = _get_dao().get_product_price_stats(int(product_id))
+    if price_stats is None:
+        return f"No price stats for product {product_id}", 404
+    return dataclasses.asdict(price_stats)
+
+
+@API_BLUEPRINT.route("/compare", methods=["GET"])
+def compare_api():
+    try:
+        product_ids = get_compared_product_ids(request.args)
+        start_date, end_date, resolution = get_price_history_args(request.args)
+    except ValueError as e:
+        return str(e), 400
+
+    dao = _get_dao()
+    price_histories = dao.get_products_price_histories(
+        product_ids, start_date=start_date, end_date=end_date, resolution=resolution
+    )
+    display_names = dao.get_product_display_names(product_ids)
+    return dataclasses.asdict(compare_price_histories(price_histories, display_names))
+
+
+@API_BLUEPRINT.route("/deals", methods=["GET"])
+def deals_api():
+    try:
+        limit, category_id = get_deals_args(request.args)
+    except ValueError as e:
+        return str(e), 400
+
+    drops = _get_price_drops().get_top_drops(limit, category_id=category_id)
+    return {"deals": [dataclasses.asdict(x) for x in drops]}
+
+
+def _get_dao() -> ApplicationDao:
+    return current_app.config[DATABASE_CONFIG_KEY]
+
+
 def _get_users() -> Users:
     return current_app.config[USERS_CONFIG_KEY]
+
+
+def _get_rate_limiter() -> RateLimiter:
+    return current_app.config[RATE_LIMITER_CONFIG_KEY]
+
+
+def _get_price_drops() -> PriceDrops:
+    return current_app.config[PRICE_DROPS_CONFIG_KEY]
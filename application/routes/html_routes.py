@@ -1,7 +1,11 @@
+import datetime
 import logging
 import os
+from contextlib import ExitStack
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
 
-from flask import Blueprint, current_app, render_template, session, redirect
+from flask import Blueprint, current_app, render_template, session, redirect, stream_template, request, flash
 
 from application.constants.app_constants import (
     USERS_CONFIG_KEY,
@@ -9,9 +13,27 @@ from application.constants.app_constants import (
     SESSION_USER_EMAIL_KEY,
     SESSION_USER_NAME_KEY,
     SESSION_USER_ID_KEY,
+    DATE_FORMAT_STRING,
+    RATE_LIMITER_CONFIG_KEY,
+    SEARCH_RATE_LIMIT_PER_MINUTE,
+    SEARCH_RATE_LIMIT_BURST,
+    MAX_CONCURRENT_SEARCHES,
+    CONCURRENCY_SLOT_TIMEOUT_SECONDS,
+    CIRCUIT_BREAKER_RESET_SECONDS,
+    PRICE_DROPS_CONFIG_KEY,
+    PRICE_DROP_MAX_AGE_DAYS,
+    MAX_COMPARED_PRODUCTS,
 )
+from application.data.circuit_breaker import DatabaseUnavailableError
 from application.data.dao import ApplicationDao
+from application.data.price_comparison import compare_price_histories
+from application.data.price_drops import PriceDrops
+from application.data.price_history import PriceHistory
+from application.data.price_stats import PriceStats
+from application.data.products_search import Product
+from application.data.rate_limiter import RateLimiter
 from application.data.users import Users
+from application.routes.request_args import get_compared_product_ids, get_deals_args, get_price_history_args
 
 LOG = logging.getLogger(__name__)
 
@@ -19,6 +41,10 @@ HTML_BLUEPRINT = Blueprint("routes_html", __name__)
 
 PRODUCT_IMAGE_URL_PREFIX = os.environ.get("PRODUCT_IMAGE_URL_PREFIX")
 
+# Date ranges offered on the price history page, as the number of days before today
+PRICE_HISTORY_RANGES = {"All Time": None, "1 Year": 365, "90 Days": 90}
+PRICE_HISTORY_RESOLUTION_LABELS = {"Every Change": None, "Daily": "day", "Weekly": "week", "Monthly": "month"}
+
 
 @HTML_BLUEPRINT.route("/")
 def home_page():
@@ -33,17 +59,35 @@ def categories_page():
 
     if SESSION_USER_ID_KEY in session:
         user_id = session[SESSION_USER_ID_KEY]
-        favorites = _get_users().get_favorites(user_id=user_id)
+        try:
+            favorites = _get_users().get_favorites(user_id=user_id)
+        except DatabaseUnavailableError as e:
+            # Categories can still be browsed without favorites
+            LOG.warning(f"Not showing favorites: {e}")
+            favorites = []
     else:
         favorites = []
 
-    return render_template("categories.html", categories=categories, favorites=favorites)
+    # Only as many favorites as can be compared at once are linked to the comparison
+    return render_template(
+        "categories.html",
+        categories=categories,
+        favorites=favorites,
+        compared_favorites=favorites[:MAX_COMPARED_PRODUCTS],
+    )
 
 
 @HTML_BLUEPRINT.route("/profile")
 def profile_page():
     if _is_user_logged_in():
-        return render_template("profile.html")
+        try:
+            digest = _get_users().get_favorites_digest(user_id=session[SESSION_USER_ID_KEY])
+        except DatabaseUnavailableError as e:
+            LOG.warning(f"Not showing favorites digest: {e}")
+            digest = None
+
+        digest_since, digest_changes = digest if digest is not None else (None, [])
+        return render_template("profile.html", digest_since=digest_since, digest_changes=digest_changes)
     else:
         return redirect("/login_signup")
 
@@ -57,24 +101,97 @@ def login_signup_page():
 def price_history_page(product_id: int):
     product_id = int(product_id)
 
+    try:
+        start_date, end_date, resolution = get_price_history_args(request.args)
+    except ValueError as e:
+        flash(str(e))
+        return redirect(f"/price_history/{product_id}")
+
     dao = _get_dao()
-    price_history = dao.get_product_price_history(product_id)
+    price_history = dao.get_product_price_history(
+        product_id, start_date=start_date, end_date=end_date, resolution=resolution
+    )
     product_display_name = dao.get_product_display_name(product_id)
+    price_stats = dao.get_product_price_stats(product_id)
+
+    if SESSION_USER_ID_KEY in session:
+        user_id = session[SESSION_USER_ID_KEY]
+        try:
+            is_favorite = _get_users().is_favorite(user_id, product_id)
+        except DatabaseUnavailableError as e:
+            LOG.warning(f"Not showing favorite status: {e}")
+            is_favorite = False
+    else:
+        is_favorite = False
 
+    context = get_price_history_context(
+        product_id,
+        price_history,
+        product_display_name,
+        price_stats,
+        is_favorite=is_favorite,
+        start_date_arg=request.args.get("from") or None,
+        end_date_arg=request.args.get("to") or None,
+        resolution=resolution,
+    )
+    return render_template("price_history.html", **context)
+
+
+def get_price_history_context(
+    product_id: int,
+    price_history: PriceHistory,
+    product_display_name: str,
+    price_stats: Optional[PriceStats],
+    is_favorite: bool = False,
+    start_date_arg: Optional[str] = None,
+    end_date_arg: Optional[str] = None,
+    resolution: Optional[str] = None,
+    dated_in_browser: bool = False,
+) -> dict:
+    """
+    Gets the values the price history template is rendered with.
+    This is shared with pre-rendering, so pre-rendered pages match the ones served by the app.
+
+    Args:
+        product_id: the product ID
+        price_history: the price history of the product
+        product_display_name: the display name of the product
+        price_stats: the price stats of the product, if they have been computed
+        is_favorite: whether the logged-in user has favorited the product
+        start_date_arg: the start date the page was requested with, if any
+        end_date_arg: the end date the page was requested with, if any
+        resolution: the resolution of the price history, or None for every price change
+        dated_in_browser: leave the point for today, the dates of a current minimum or maximum price and the links to
+            ranges counted back from today for the browser to fill in, so the page doesn't change from day to day
+
+    Returns:
+        The template context
+    """
     if PRODUCT_IMAGE_URL_PREFIX:
         padded_product_id = str(product_id).zfill(9)
         product_image_url = f"{PRODUCT_IMAGE_URL_PREFIX.rstrip('/')}/{padded_product_id}.jpg"
     else:
         product_image_url = None
 
-    if SESSION_USER_ID_KEY in session:
-        user_id = session[SESSION_USER_ID_KEY]
-        is_favorite = _get_users().is_favorite(user_id, product_id)
-    else:
-        is_favorite = False
-
-    return render_template(
-        "price_history.html",
+    # Links to switch the date range keep the current resolution, and vice versa
+    today = datetime.date.today()
+    range_links = []
+    for label, days in PRICE_HISTORY_RANGES.items():
+        if (days is None) or dated_in_browser:
+            range_start = None
+        else:
+            range_start = (today - datetime.timedelta(days=days)).strftime(DATE_FORMAT_STRING)
+        url = _price_history_url(product_id, start_date=range_start, resolution=resolution)
+        is_active = (range_start == start_date_arg) and (end_date_arg is None) and not (days and dated_in_browser)
+        range_links.append((label, url, is_active, days))
+    resolution_links = []
+    for label, link_resolution in PRICE_HISTORY_RESOLUTION_LABELS.items():
+        url = _price_history_url(
+            product_id, start_date=start_date_arg, end_date=end_date_arg, resolution=link_resolution
+        )
+        resolution_links.append((label, url, link_resolution == resolution))
+
+    return dict(
         product_id=product_id,
         dates=price_history.dates,
         prices=price_history.prices,
@@ -86,16 +203,87 @@ def price_history_page(product_id: int):
         product_image_url=product_image_url,
         product_display_name=product_display_name,
         is_favorite=is_favorite,
+        price_stats=price_stats,
+        time_unit=resolution or "day",
+        range_links=range_links,
+        resolution_links=resolution_links,
+        dated_in_browser=dated_in_browser,
+    )
+
+
+@HTML_BLUEPRINT.route("/compare")
+def compare_page():
+    try:
+        product_ids = get_compared_product_ids(request.args)
+        start_date, end_date, resolution = get_price_history_args(request.args)
+    except ValueError as e:
+        flash(str(e))
+        return redirect("/categories")
+
+    dao = _get_dao()
+    price_histories = dao.get_products_price_histories(
+        product_ids, start_date=start_date, end_date=end_date, resolution=resolution
+    )
+    display_names = dao.get_product_display_names(product_ids)
+    comparison = compare_price_histories(price_histories, display_names)
+
+    return render_template(
+        "compare.html", dates=comparison.dates, products=comparison.products, time_unit=resolution or "day"
+    )
+
+
+@HTML_BLUEPRINT.route("/deals")
+def deals_page():
+    try:
+        limit, category_id = get_deals_args(request.args)
+    except ValueError as e:
+        flash(str(e))
+        return redirect("/deals")
+
+    dao = _get_dao()
+    drops = _get_price_drops().get_top_drops(limit, category_id=category_id)
+    categories = dao.get_categories()
+    category_names = {x.id: x.display_name for x in categories}
+
+    return render_template(
+        "deals.html",
+        drops=drops,
+        categories=categories,
+        category_names=category_names,
+        category_id=category_id,
+        max_age_days=PRICE_DROP_MAX_AGE_DAYS,
     )
 
 
 @HTML_BLUEPRINT.route("/products/<search_query>")
 def products_page(search_query: str):
     dao = _get_dao()
-    products = dao.get_products(search_query)
-    num_results = len(products)
 
-    return render_template("products.html", search_query=search_query, products=products, num_results=num_results)
+    with ExitStack() as stack:
+        # Searches which miss the cache are expensive, so limit how often each client and everyone can run them
+        if not dao.is_product_search_cached(search_query):
+            rate_limiter = _get_rate_limiter()
+            if not rate_limiter.allow(
+                "search", request.remote_addr, SEARCH_RATE_LIMIT_PER_MINUTE, SEARCH_RATE_LIMIT_BURST
+            ):
+                retry_after = rate_limiter.retry_after_seconds(SEARCH_RATE_LIMIT_PER_MINUTE)
+                return "Too many searches! Please try again later.", 429, {"Retry-After": str(retry_after)}
+            if not stack.enter_context(
+                rate_limiter.concurrency_slot("search", MAX_CONCURRENT_SEARCHES, CONCURRENCY_SLOT_TIMEOUT_SECONDS)
+            ):
+                return "Too many searches in progress! Please try again later.", 429, {"Retry-After": "1"}
+
+        num_results, product_batches = dao.search_products(search_query)
+        product_batches = _with_price_stats(dao, product_batches)
+        response = current_app.response_class(
+            stream_template(
+                "products.html", search_query=search_query, product_batches=product_batches, num_results=num_results
+            )
+        )
+        # The rest of the search is read as the page streams, so the slot is held until the response is closed,
+        # which happens whether or not the client stays to read it
+        response.call_on_close(stack.pop_all().close)
+    return response
 
 
 @HTML_BLUEPRINT.route("/category/<category_id>")
@@ -104,10 +292,12 @@ def category_page(category_id: int):
     dao = _get_dao()
 
     display_name = dao.get_category_display_name(category_id)
-    products = dao.get_category_products(category_id)
-    num_products = len(products)
+    num_products = dao.get_category_num_products(category_id)
+    product_batches = _with_price_stats(dao, dao.iter_category_products(category_id))
 
-    return render_template("category.html", display_name=display_name, products=products, num_products=num_products)
+    return stream_template(
+        "category.html", display_name=display_name, product_batches=product_batches, num_products=num_products
+    )
 
 
 @HTML_BLUEPRINT.route("/logout")
@@ -136,6 +326,32 @@ def about_page():
     )
 
 
+@HTML_BLUEPRINT.app_errorhandler(DatabaseUnavailableError)
+def database_unavailable(e: DatabaseUnavailableError):
+    # Nothing was cached to fall back to, so ask the client to come back once the circuit may have closed
+    LOG.error(f"Database unavailable: {e}")
+    return (
+        "The price database is unavailable! Please try again later.",
+        503,
+        {"Retry-After": str(CIRCUIT_BREAKER_RESET_SECONDS)},
+    )
+
+
+def _with_price_stats(
+    dao: ApplicationDao, product_batches: Iterator[List[Product]]
+) -> Iterator[List[Tuple[Product, Optional[PriceStats]]]]:
+    # Stats are fetched a batch at a time, so a streamed listing still makes one cache round trip per batch
+    for products in product_batches:
+        price_stats = dao.get_products_price_stats([x.id for x in products])
+        yield [(x, price_stats.get(x.id)) for x in products]
+
+
+def _price_history_url(product_id: int, **kwargs) -> str:
+    args = {"start_date": "from", "end_date": "to", "resolution": "resolution"}
+    query = urlencode({args[key]: value for key, value in kwargs.items() if value})
+    return f"/price_history/{product_id}?{query}" if query else f"/price_history/{product_id}"
+
+
 def _logout_user():
     if SESSION_USER_ID_KEY in session:
         LOG.info(f"Logging out user {session[SESSION_USER_ID_KEY]}")
@@ -164,3 +380,11 @@ def _get_dao() -> ApplicationDao:
 
 def _get_users() -> Users:
     return current_app.config[USERS_CONFIG_KEY]
+
+
+def _get_rate_limiter() -> RateLimiter:
+    return current_app.config[RATE_LIMITER_CONFIG_KEY]
+
+
+def _get_price_drops() -> PriceDrops:
+    return current_app.config[PRICE_DROPS_CONFIG_KEY]
@@ -0,0 +1,221 @@
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import operator
+import os
+import shutil
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pymongo
+from flask import Flask, render_template
+
+from application.constants.app_constants import JOB_QUERY_TIME_BUDGET_MS, PRERENDER_BATCH_SIZE
+from application.data.dao import ApplicationDao
+from application.data.price_history import build_price_history
+from application.data.price_stats import PriceStats
+from application.data.products_search import Product
+from application.routes.html_routes import PRODUCT_IMAGE_URL_PREFIX, get_price_history_context
+
+LOG = logging.getLogger(__name__)
+
+APPLICATION_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATES_FOLDER = os.path.join(APPLICATION_FOLDER, "templates")
+STATIC_FOLDER = os.path.join(APPLICATION_FOLDER, "static")
+
+# Each page is written as the index of a folder named after its URL, e.g. category/1/index.html
+PAGE_FILE_NAME = "index.html"
+# The digest of the data each page was last rendered from, keyed by page path
+MANIFEST_FILE_NAME = ".prerender_manifest.json"
+
+# A page to render: its path, template name, the data it is rendered from and the digest of that data
+PageTask = Tuple[str, str, tuple, str]
+
+# Set in each render process by _init_worker
+_RENDER_APP: Optional[Flask] = None
+_OUTPUT_FOLDER: Optional[str] = None
+
+
+def prerender(
+    dao: ApplicationDao,
+    output_folder: str,
+    processes: Optional[int] = None,
+    batch_size: int = PRERENDER_BATCH_SIZE,
+    force: bool = False,
+) -> Tuple[int, int]:
+    """
+    Renders the category and price history pages to static files, as an anonymous user sees them.
+    The data of every page is read in one pass over the products, price stats and prices, and the pages are rendered
+    by a pool of processes.
+    Only pages whose data or templates changed since the last run are rendered again, and pages of products which no
+    longer have prices are removed.
+    Price history pages leave the parts which depend on today, such as the point for today and links to ranges
+    counted back from it, to be filled in by the browser, so they don't need rendering again each day.
+
+    Args:
+        dao: the DAO to read the data with
+        output_folder: the folder to write the pages and static files to, which can be served by a static file server
+        processes: the number of render processes, or None for the number of CPUs
+        batch_size: the number of pages whose data is gathered before they are rendered
+        force: render every page, even if its data hasn't changed
+
+    Returns:
+        The number of pages and the number of them which were rendered
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    shutil.copytree(STATIC_FOLDER, os.path.join(output_folder, "static"), dirs_exist_ok=True)
+
+    manifest_path = os.path.join(output_folder, MANIFEST_FILE_NAME)
+    previous_manifest = {} if force else _read_manifest(manifest_path)
+    manifest = dict(previous_manifest)
+    templates_digest = _get_templates_digest()
+
+    processes = processes or os.cpu_count() or 1
+    paths = set()
+    num_rendered = 0
+    # Spawned rather than forked, so the render processes don't inherit the database and cache connections
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes, initializer=_init_worker, initargs=(output_folder,)) as pool:
+        try:
+            for batch in _batched(_iter_pages(dao, batch_size), batch_size):
+                tasks = []
+                for path, template_name, data in batch:
+                    paths.add(path)
+                    digest = _get_page_digest(template_name, data, templates_digest)
+                    page_file = os.path.join(output_folder, path, PAGE_FILE_NAME)
+                    if (previous_manifest.get(path) != digest) or not os.path.exists(page_file):
+                        tasks.append((path, template_name, data, digest))
+
+                chunk_size = max(1, len(tasks) // (4 * processes))
+                for path, digest in pool.imap_unordered(_render_page, tasks, chunksize=chunk_size):
+                    manifest[path] = digest
+                num_rendered += len(tasks)
+                LOG.info(f"Rendered {len(tasks):,} of {len(batch):,} pages")
+        finally:
+            # Saved even if rendering fails part way, so the next run doesn't render the finished pages again
+            _write_manifest(manifest_path, manifest)
+
+    for path in set(manifest) - paths:
+        LOG.info(f"Removing page {path}")
+        page_file = os.path.join(output_folder, path, PAGE_FILE_NAME)
+        if os.path.exists(page_file):
+            os.remove(page_file)
+            os.rmdir(os.path.dirname(page_file))
+        del manifest[path]
+    _write_manifest(manifest_path, manifest)
+
+    return len(paths), num_rendered
+
+
+def _iter_pages(dao: ApplicationDao, batch_size: int) -> Iterator[Tuple[str, str, tuple]]:
+    categories = dao.get_categories()
+    price_stats: Dict[int, PriceStats] = {x.product_id: x for x in dao.iter_all_price_stats(batch_size=batch_size)}
+
+    # Sorted by name, so each category lists its products in the same order as the app
+    display_names: Dict[int, str] = {}
+    category_products: Dict[int, List[Product]] = {x.id: [] for x in categories}
+    documents = dao.products_collection.find(
+        filter={},
+        projection={"_id": 0, "id": 1, "display_name": 1, "category": 1},
+        sort=[("display_name", pymongo.ASCENDING)],
+        batch_size=batch_size,
+        max_time_ms=JOB_QUERY_TIME_BUDGET_MS,
+    )
+    for document in documents:
+        display_names[document["id"]] = document["display_name"]
+        if document.get("category") in category_products:
+            category_products[document["category"]].append(
+                Product(id=document["id"], display_name=document["display_name"])
+            )
+
+    for category in categories:
+        products = [(x, price_stats.get(x.id)) for x in category_products.pop(category.id)]
+        yield f"category/{category.id}", "category.html", (category.display_name, products)
+
+    # Every price is read through one cursor sorted by product, so each product's prices arrive together
+    documents = dao.iter_price_documents(batch_size=batch_size)
+    for product_id, product_documents in itertools.groupby(documents, key=operator.itemgetter("product_id")):
+        dates = []
+        prices = []
+        for document in product_documents:
+            dates.append(document["start_date"])
+            prices.append(float(document["price_cents"]) / 100.0)
+        display_name = display_names.get(product_id, "UNKNOWN")
+        data = (product_id, display_name, dates, prices, price_stats.get(product_id))
+        yield f"price_history/{product_id}", "price_history.html", data
+
+
+def _category_page_context(display_name: str, products: List[Tuple[Product, Optional[PriceStats]]]) -> dict:
+    return dict(display_name=display_name, product_batches=[products], num_products=len(products))
+
+
+def _price_history_page_context(
+    product_id: int, display_name: str, dates: list, prices: List[float], price_stats: Optional[PriceStats]
+) -> dict:
+    price_history = build_price_history(dates, prices, extend_to_end=False)
+    return get_price_history_context(product_id, price_history, display_name, price_stats, dated_in_browser=True)
+
+
+# Builds the template context of each kind of page from its data
+PAGE_CONTEXTS = {"category.html": _category_page_context, "price_history.html": _price_history_page_context}
+
+
+def _init_worker(output_folder: str):
+    global _RENDER_APP, _OUTPUT_FOLDER
+    # Rendering only needs the templates and static files, not the database or cache
+    _RENDER_APP = Flask("application", root_path=APPLICATION_FOLDER)
+    _OUTPUT_FOLDER = output_folder
+
+
+def _render_page(task: PageTask) -> Tuple[str, str]:
+    path, template_name, data, digest = task
+    # Rendered in a request without a session, as an anonymous user sees the page
+    with _RENDER_APP.test_request_context(f"/{path}"):
+        html = render_template(template_name, **PAGE_CONTEXTS[template_name](*data))
+
+    page_folder = os.path.join(_OUTPUT_FOLDER, path)
+    os.makedirs(page_folder, exist_ok=True)
+    page_file = os.path.join(page_folder, PAGE_FILE_NAME)
+    # Written beside the page then moved over it, so the file server never sends a partly written page
+    temp_file = f"{page_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w", encoding="utf8") as file:
+        file.write(html)
+    os.replace(temp_file, page_file)
+    return path, digest
+
+
+def _get_page_digest(template_name: str, data: tuple, templates_digest: str) -> str:
+    # The data is made of numbers, strings, dates and dataclasses, whose representations are stable between runs
+    page_key = f"{templates_digest}:{template_name}:{data!r}"
+    return hashlib.sha256(page_key.encode()).hexdigest()
+
+
+def _get_templates_digest() -> str:
+    # Pages are rendered again when any template or the product image location changes
+    digest = hashlib.sha256((PRODUCT_IMAGE_URL_PREFIX or "").encode())
+    for name in sorted(os.listdir(TEMPLATES_FOLDER)):
+        digest.update(name.encode())
+        with open(os.path.join(TEMPLATES_FOLDER, name), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _read_manifest(manifest_path: str) -> Dict[str, str]:
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding="utf8") as file:
+        return json.load(file)
+
+
+def _write_manifest(manifest_path: str, manifest: Dict[str, str]):
+    temp_file = f"{manifest_path}.tmp"
+    with open(temp_file, "w", encoding="utf8") as file:
+        json.dump(manifest, file)
+    os.replace(temp_file, manifest_path)
+
+
+def _batched(iterable: Iterable, batch_size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
@@ -0,0 +1,104 @@
+import datetime
+from typing import List, Mapping, Optional, Tuple
+
+from application.constants.app_constants import (
+    DATE_FORMAT_STRING,
+    DEFAULT_NUM_DEALS,
+    MAX_COMPARED_PRODUCTS,
+    MAX_NUM_DEALS,
+    PRICE_HISTORY_RESOLUTIONS,
+)
+
+
+def get_price_history_args(
+    args: Mapping[str, str],
+) -> Tuple[Optional[datetime.datetime], Optional[datetime.datetime], Optional[str]]:
+    """
+    Gets the date range and resolution of a price history request from its query parameters.
+
+    Args:
+        args: the request query parameters, which may contain `from`, `to` and `resolution`
+
+    Returns:
+        The start date, end date and resolution, each None if not given
+
+    Raises:
+        ValueError: if any of the parameters are invalid.
+    """
+    start_date = _parse_date(args.get("from"))
+    if (start_date is not None) and (start_date > datetime.datetime.today()):
+        raise ValueError("The start of the date range must not be in the future!")
+    end_date = _parse_date(args.get("to"))
+    if end_date is not None:
+        # Include every price change on the last day of the range
+        end_date += datetime.timedelta(days=1) - datetime.timedelta(microseconds=1)
+    if (start_date is not None) and (end_date is not None) and (start_date > end_date):
+        raise ValueError("The start of the date range must not be after the end!")
+
+    resolution = args.get("resolution") or None
+    if (resolution is not None) and (resolution not in PRICE_HISTORY_RESOLUTIONS):
+        raise ValueError(f"Resolution must be one of {', '.join(PRICE_HISTORY_RESOLUTIONS)}!")
+
+    return start_date, end_date, resolution
+
+
+def get_compared_product_ids(args: Mapping[str, str]) -> List[int]:
+    """
+    Gets the IDs of the products to compare from the `product_ids` query parameter, a comma separated list.
+
+    Args:
+        args: the request query parameters
+
+    Returns:
+        The unique product IDs in the order given
+
+    Raises:
+        ValueError: if the product IDs are missing, invalid or too many.
+    """
+    try:
+        product_ids = [int(x) for x in args.get("product_ids", "").split(",") if x.strip()]
+    except ValueError:
+        raise ValueError("Product IDs must be integers!")
+
+    product_ids = list(dict.fromkeys(product_ids))
+    if not product_ids:
+        raise ValueError("No products given to compare!")
+    if len(product_ids) > MAX_COMPARED_PRODUCTS:
+        raise ValueError(f"Cannot compare more than {MAX_COMPARED_PRODUCTS} products at once!")
+
+    return product_ids
+
+
+def get_deals_args(args: Mapping[str, str]) -> Tuple[int, Optional[int]]:
+    """
+    Gets the number of deals and the category to show from the `limit` and `category_id` query parameters.
+
+    Args:
+        args: the request query parameters
+
+    Returns:
+        The number of deals, and the category ID or None for every category
+
+    Raises:
+        ValueError: if any of the parameters are invalid.
+    """
+    try:
+        limit = int(args.get("limit") or DEFAULT_NUM_DEALS)
+        category_id = int(args["category_id"]) if args.get("category_id") else None
+    except ValueError:
+        raise ValueError("The limit and category ID must be integers!")
+
+    if not 1 <= limit <= MAX_NUM_DEALS:
+        raise ValueError(f"The limit must be between 1 and {MAX_NUM_DEALS}!")
+
+    return limit, category_id
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+
+    try:
+        return datetime.datetime.strptime(value, DATE_FORMAT_STRING)
+    except ValueError:
+        raise ValueError(f"Date {value!r} must be in the format YYYY-MM-DD!")
@@ -0,0 +1,121 @@
+import functools
+import logging
+import os
+import time
+from typing import Iterable, Iterator
+
+from flask import Flask, Response, before_render_template, g, request, template_rendered
+from flask_compress import Compress
+
+from application.constants.app_constants import SLOW_REQUEST_THRESHOLD_MS
+from application.data import tracing
+from application.data.tracing import Span
+
+LOG = logging.getLogger(__name__)
+
+# The category of the time a request spends outside of any traced step, such as in view functions
+APP_SPAN_NAME = "app"
+
+
+def init_request_tracing(app: Flask, compress: Compress):
+    """
+    Traces the cache calls, Mongo calls, template renders and compression of every request.
+    Each response gets a Server-Timing header with the time spent in each, and requests slower than the threshold set
+    by SLOW_REQUEST_MS have their full trace logged.
+    Compression is set up here, as timing it depends on the order the response hooks are registered in.
+
+    Args:
+        app: the flask app
+        compress: the compression extension to set up
+    """
+    slow_request_ms = int(os.environ.get("SLOW_REQUEST_MS", SLOW_REQUEST_THRESHOLD_MS))
+
+    @app.before_request
+    def start_request_trace():
+        g.trace_start_ns = time.perf_counter_ns()
+        g.render_spans = []
+        g.trace_root = tracing.start_trace(APP_SPAN_NAME)
+
+    # Response hooks run in the reverse of the order they were added, so this runs after compression
+    @app.after_request
+    def add_server_timing(response: Response) -> Response:
+        root = getattr(g, "trace_root", None)
+        if root is None:
+            return response
+
+        compress_span = getattr(g, "compress_span", None)
+        if compress_span is not None:
+            compress_span.duration_ns += time.perf_counter_ns() - g.compress_start_ns
+            compress_span.count += 1
+
+        if response.is_streamed:
+            # The body hasn't been produced yet, so time how long making and compressing each chunk takes
+            response.response = _traced_chunks(response.response, "compress.stream")
+
+        # The header is sent before a streamed body, so it only covers the time until the response was returned
+        root.duration_ns = time.perf_counter_ns() - g.trace_start_ns
+        response.headers["Server-Timing"] = f"{tracing.format_server_timing(root)}, total;dur={root.duration_ms:.1f}"
+
+        response.call_on_close(functools.partial(_finish_trace, root, g.trace_start_ns, request.path, slow_request_ms))
+        return response
+
+    compress.init_app(app)
+
+    @app.after_request
+    def start_compress_span(response: Response) -> Response:
+        if response.is_streamed:
+            # A streamed template is only rendered as its chunks are compressed and sent, so rather than timing it
+            # from when it was started, time making each chunk apart from compressing it
+            span_name = "render.stream"
+            if g.render_spans:
+                span, parent, _ = g.render_spans.pop()
+                parent.children.remove(span)
+                tracing.set_current_span(parent)
+                span_name = span.name
+            response.response = _traced_chunks(response.response, span_name)
+        else:
+            g.compress_span = tracing.open_span("compress.response")
+            g.compress_start_ns = time.perf_counter_ns()
+        return response
+
+    before_render_template.connect(_start_render_span, app)
+    template_rendered.connect(_end_render_span, app)
+
+
+def _start_render_span(sender: Flask, template, context, **extra):
+    parent = tracing.current_span()
+    span = tracing.open_span(f"render.{template.name}")
+    if span is not None:
+        tracing.set_current_span(span)
+        g.render_spans.append((span, parent, time.perf_counter_ns()))
+
+
+def _end_render_span(sender: Flask, template, context, **extra):
+    # Streamed templates have already had their span taken over to be timed chunk by chunk
+    if not getattr(g, "render_spans", None):
+        return
+
+    span, parent, start_ns = g.render_spans.pop()
+    span.duration_ns += time.perf_counter_ns() - start_ns
+    span.count += 1
+    tracing.set_current_span(parent)
+
+
+def _traced_chunks(chunks: Iterable, span_name: str) -> Iterator:
+    # Opened when the first chunk is requested, so the span is added to whichever span is current while streaming
+    span = tracing.open_span(span_name)
+    iterator = iter(chunks)
+    while True:
+        with tracing.resume(span):
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _finish_trace(root: Span, start_ns: int, path: str, slow_request_ms: int):
+    # Called once the whole response has been sent, including any streamed body
+    root.duration_ns = time.perf_counter_ns() - start_ns
+    tracing.end_trace()
+    if root.duration_ms >= slow_request_ms:
+        LOG.warning(f"Slow request {path} took {root.duration_ms:.0f} ms:\n{tracing.format_span_tree(root)}")
@@ -0,0 +1,71 @@
+"""
+Compares the time to encode and decode cached DAO objects, and their size, for each cache codec.
+
+Usage:
+    python -m benchmarks.codec_benchmark --products 10000
+"""
+
+import argparse
+import datetime
+import timeit
+
+from application.data.cache_codec import CACHE_CODECS
+from application.data.price_history import PriceHistory
+from application.data.products_search import Product
+
+
+def synthetic_products(num_products: int):
+    return [Product(id=1000000 + i, display_name=f"Synthetic Product Name Number {i}") for i in range(num_products)]
+
+
+def synthetic_price_history(num_prices: int) -> PriceHistory:
+    start_date = datetime.date(2015, 1, 1)
+    return PriceHistory(
+        dates=[(start_date + datetime.timedelta(days=7 * i)).isoformat() for i in range(num_prices)],
+        prices=[(100 + (i * 37) % 900) / 100.0 for i in range(num_prices)],
+        current_price=1.0,
+        minimum_price=1.0,
+        maximum_price=9.99,
+        minimum_price_date="2015-01-01",
+        maximum_price_date="2020-01-01",
+    )
+
+
+def time_ms(function, repeat: int) -> float:
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--prices", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    products = synthetic_products(args.products)
+    price_history = synthetic_price_history(args.prices)
+
+    print(f"{'object':<24}{'codec':<8}{'encode ms':>11}{'decode ms':>11}{'bytes':>11}{'bytes/entry':>13}")
+    for name, codec in CACHE_CODECS.items():
+        data = codec.encode_products(products)
+        assert codec.decode_products(data) == products
+        print(
+            f"{f'{args.products:,} products':<24}{name:<8}"
+            f"{time_ms(lambda: codec.encode_products(products), args.repeat):>11.2f}"
+            f"{time_ms(lambda: codec.decode_products(data), args.repeat):>11.2f}"
+            f"{len(data):>11,}{len(data) / args.products:>13.1f}"
+        )
+
+    for name, codec in CACHE_CODECS.items():
+        data = codec.encode_price_history(price_history)
+        assert codec.decode_price_history(data) == price_history
+        print(
+            f"{f'{args.prices:,} price history':<24}{name:<8}"
+            f"{time_ms(lambda: codec.encode_price_history(price_history), args.repeat):>11.2f}"
+            f"{time_ms(lambda: codec.decode_price_history(data), args.repeat):>11.2f}"
+            f"{len(data):>11,}{len(data) / args.prices:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures price export throughput in rows/s.
+
+With --mongo-uri, a synthetic `prices` collection is seeded in a scratch database (if it is not already the
+requested size) and read back through ApplicationDao.iter_price_documents for each batch size.
+Without it, synthetic documents are generated in-process so only the encoding and compression cost is measured.
+
+Usage:
+    python -m benchmarks.export_benchmark --rows 5000000 --mongo-uri mongodb://localhost:27017
+"""
+
+import argparse
+import datetime
+import time
+import zlib
+
+import fakeredis
+import pymongo
+
+from application.constants.app_constants import REDIS_VERSION
+from application.data.dao import ApplicationDao
+from application.data.price_export import EXPORT_FORMATS, iter_export_chunks
+
+PRICES_PER_PRODUCT = 50
+BENCHMARK_DATABASE_NAME = "price_history_benchmark"
+
+
+def synthetic_price_documents(num_rows: int):
+    start_date = datetime.datetime(2015, 1, 1)
+    for i in range(num_rows):
+        product_id, n = divmod(i, PRICES_PER_PRODUCT)
+        yield {
+            "product_id": product_id,
+            "start_date": start_date + datetime.timedelta(days=7 * n),
+            "price_cents": 100 + (product_id * 31 + n * 17) % 5000,
+        }
+
+
+def seed_database(mongo_uri: str, num_rows: int):
+    database = pymongo.MongoClient(mongo_uri)[BENCHMARK_DATABASE_NAME]
+    if database["prices"].estimated_document_count() != num_rows:
+        database["prices"].drop()
+        database["prices"].create_index([("product_id", pymongo.ASCENDING), ("start_date", pymongo.ASCENDING)])
+        batch = []
+        for document in synthetic_price_documents(num_rows):
+            batch.append(document)
+            if len(batch) == 50000:
+                database["prices"].insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            database["prices"].insert_many(batch, ordered=False)
+    return database
+
+
+def run_export(documents, export_format: str) -> tuple:
+    # Compress as we go, the same as a compressed HTTP response or gzipped file would
+    compressor = zlib.compressobj(wbits=31)
+    num_rows = 0
+    compressed_bytes = 0
+
+    def counted():
+        nonlocal num_rows
+        for document in documents:
+            num_rows += 1
+            yield document
+
+    start = time.perf_counter()
+    for chunk in iter_export_chunks(counted(), export_format):
+        compressed_bytes += len(compressor.compress(chunk.encode("utf8")))
+    compressed_bytes += len(compressor.flush())
+    return num_rows, time.perf_counter() - start, compressed_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        dao = ApplicationDao(
+            database=seed_database(args.mongo_uri, args.rows), cache=fakeredis.FakeStrictRedis(version=REDIS_VERSION)
+        )
+        batch_sizes = args.batch_sizes
+    else:
+        dao = None
+        batch_sizes = [None]
+
+    print(f"{'format':<8}{'batch size':>12}{'rows':>12}{'seconds':>10}{'rows/s':>12}{'bytes/row':>11}")
+    for export_format in EXPORT_FORMATS:
+        for batch_size in batch_sizes:
+            if dao is None:
+                documents = synthetic_price_documents(args.rows)
+            else:
+                documents = dao.iter_price_documents(batch_size=batch_size)
+            num_rows, duration, compressed_bytes = run_export(documents, export_format)
+            print(
+                f"{export_format:<8}{batch_size or '-':>12}{num_rows:>12,}{duration:>10.1f}"
+                f"{num_rows / duration:>12,.0f}{compressed_bytes / max(num_rows, 1):>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Compares the throughput of the gunicorn worker classes, with the same number of worker processes for each so they use
+about the same memory.
+
+Each worker class is started with config/gunicorn.conf.py and loaded by concurrent clients for a fixed time, then the
+requests per second, latencies and the memory used by the workers are reported, along with requests per second per GB
+so classes can be compared at equal memory.
+
+The app is the real one by default, which needs the same environment variables as running it. Without a database,
+--synthetic serves a stand-in app whose requests wait --synthetic-wait-ms as if on a query, which measures how well
+each worker class overlaps waiting requests.
+
+Usage:
+    python -m benchmarks.worker_benchmark --workers 2 --clients 64 --paths /categories /category/1
+    python -m benchmarks.worker_benchmark --synthetic --synthetic-wait-ms 50
+"""
+
+import argparse
+import http.client
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import List, Optional
+
+from flask import Flask
+
+WORKER_CLASSES = ["sync", "gthread", "gevent"]
+SYNTHETIC_APP = "benchmarks.worker_benchmark:create_synthetic_app()"
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "gunicorn.conf.py")
+
+
+def create_synthetic_app() -> Flask:
+    app = Flask(__name__)
+    wait_seconds = int(os.environ.get("SYNTHETIC_WAIT_MS", 50)) / 1000
+
+    @app.route("/", defaults={"path": ""})
+    @app.route("/<path:path>")
+    def wait(path: str):
+        # Sleeping stands in for waiting on the database, and is patched to yield under gevent the same as sockets
+        time.sleep(wait_seconds)
+        return f"<html><body>{path}</body></html>"
+
+    return app
+
+
+def start_server(app: str, worker_class: str, workers: int, threads: int, connections: int, port: int, env: dict):
+    env = dict(
+        env,
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        GUNICORN_WORKER_CLASS=worker_class,
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_THREADS=str(threads),
+        GUNICORN_WORKER_CONNECTIONS=str(connections),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", CONFIG_FILE, app],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode} starting {worker_class} workers")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"gunicorn didn't start listening with {worker_class} workers")
+
+
+def stop_server(process: subprocess.Popen):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def get_workers_rss_bytes(master_pid: int) -> int:
+    # Linux only: the workers are the children of the gunicorn master process
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as file:
+        worker_pids = [int(x) for x in file.read().split()]
+
+    rss_bytes = 0
+    for pid in worker_pids:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    rss_bytes += int(line.split()[1]) * 1024
+    return rss_bytes
+
+
+def run_load(port: int, paths: List[str], clients: int, duration_seconds: float) -> tuple:
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration_seconds
+
+    def client(index: int):
+        nonlocal errors
+        connection: Optional[http.client.HTTPConnection] = None
+        client_latencies = []
+        client_errors = 0
+        i = index
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    client_errors += 1
+                else:
+                    client_latencies.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                client_errors += 1
+                connection = None
+        with lock:
+            latencies.extend(client_latencies)
+            errors += client_errors
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-classes", nargs="+", choices=WORKER_CLASSES, default=WORKER_CLASSES)
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes, the same for every class.")
+    parser.add_argument("--threads", type=int, default=16, help="Threads per gthread worker.")
+    parser.add_argument("--worker-connections", type=int, default=200, help="Connections per gevent worker.")
+    parser.add_argument("--clients", type=int, default=64, help="Concurrent clients.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to load each worker class for.")
+    parser.add_argument("--paths", nargs="+", default=["/categories", "/category/1", "/price_history/1"])
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--app", default="application:create_flask_app()")
+    parser.add_argument("--synthetic", action="store_true", help="Serve a stand-in app instead of the real one.")
+    parser.add_argument("--synthetic-wait-ms", type=int, default=50)
+    args = parser.parse_args()
+
+    app = SYNTHETIC_APP if args.synthetic else args.app
+    env = dict(os.environ, SYNTHETIC_WAIT_MS=str(args.synthetic_wait_ms))
+
+    print(
+        f"{'class':<9}{'workers':>8}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'RSS MB':>9}{'req/s/GB':>10}"
+    )
+    for worker_class in args.worker_classes:
+        process = start_server(app, worker_class, args.workers, args.threads, args.worker_connections, args.port, env)
+        try:
+            # Warm up, so each worker has loaded the app and opened its connections before being measured
+            run_load(args.port, args.paths, args.clients, min(2.0, args.duration))
+            latencies, errors, duration = run_load(args.port, args.paths, args.clients, args.duration)
+            rss_bytes = get_workers_rss_bytes(process.pid)
+        finally:
+            stop_server(process)
+
+        latencies.sort()
+        requests_per_second = len(latencies) / duration
+        p50 = statistics.median(latencies) * 1000 if latencies else 0.0
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+        rss_gb = rss_bytes / 1024**3
+        print(
+            f"{worker_class:<9}{args.workers:>8}{len(latencies):>10,}{errors:>8,}{requests_per_second:>10,.0f}"
+            f"{p50:>9.1f}{p99:>9.1f}{rss_bytes / 1024**2:>9.0f}{requests_per_second / rss_gb:>10,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for serving the app, e.g. `gunicorn -c config/gunicorn.conf.py "application:create_flask_app()"`.
+
+Requests spend most of their time waiting on Mongo and Redis, so rather than one request per process, each worker
+serves several at once with threads (the default) or gevent, chosen with GUNICORN_WORKER_CLASS:
+* `gthread` - GUNICORN_THREADS requests at once per worker
+* `gevent` - GUNICORN_WORKER_CONNECTIONS requests at once per worker, needs the gevent package
+* `sync` - one request at a time per worker
+
+The number of requests each worker serves at once is passed to the app in WORKER_CONCURRENCY, which it sizes its
+Mongo and Redis connection pools from unless they are set with <client>_MAX_POOL_SIZE.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+# Gunicorn turns sync workers into gthread ones if they are given more than one thread
+threads = int(os.environ.get("GUNICORN_THREADS", 16)) if worker_class == "gthread" else 1
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 200))
+
+# Each worker loads the app and connects to the databases itself, as Mongo clients can't be shared across a fork
+preload_app = False
+
+# Queries have their own time budgets, so this only catches workers which have hung
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Restart workers now and then, staggered so they don't all restart at once, to bound any slow growth in memory
+max_requests = 10000
+max_requests_jitter = 1000
+
+if worker_class == "gthread":
+    worker_concurrency = threads
+elif worker_class == "gevent":
+    worker_concurrency = worker_connections
+else:
+    worker_concurrency = 1
+os.environ["WORKER_CONCURRENCY"] = str(worker_concurrency)
@@ -0,0 +1,63 @@
+import datetime
+
+import fakeredis
+import mongomock
+import pytest
+from flask import Flask
+
+import application
+from application.constants.app_constants import REDIS_VERSION
+from application.data.dao import ApplicationDao
+from application.data.users import Users
+from tests.date_trunc import DateTruncStandIn
+from tests.fault_injection import FaultInjectingCollection
+from tests.search_index import SearchIndexStandIn
+
+NUM_PRODUCTS = 30
+FIRST_PRICE_DATE = datetime.datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def database():
+    database = mongomock.MongoClient()["price_history"]
+    database["categories"].insert_many([{"id": 1, "display_name": "Fruit"}, {"id": 2, "display_name": "Empty"}])
+    database["products"].insert_many(
+        [{"id": i, "display_name": f"Product {i:03d}", "category": 1} for i in range(NUM_PRODUCTS)]
+    )
+    database["prices"].insert_many(
+        [
+            {"product_id": i, "start_date": FIRST_PRICE_DATE + datetime.timedelta(days=30 * j), "price_cents": 100 + j}
+            for i in range(NUM_PRODUCTS)
+            for j in range(3)
+        ]
+    )
+    return database
+
+
+@pytest.fixture
+def dao(database) -> ApplicationDao:
+    dao = ApplicationDao(database=database, cache=fakeredis.FakeStrictRedis(version=REDIS_VERSION))
+    # mongomock doesn't take every time budget argument, which the stand-in takes off before passing calls on
+    for guarded in (
+        dao.products_collection,
+        dao.categories_collection,
+        dao.prices_collection,
+        dao.price_stats_collection,
+        dao.data_changes_collection,
+    ):
+        guarded.collection = FaultInjectingCollection(guarded.collection)
+    dao.products_collection.collection = SearchIndexStandIn(dao.products_collection.collection)
+    dao.prices_collection.collection = DateTruncStandIn(dao.prices_collection.collection)
+    return dao
+
+
+@pytest.fixture
+def app(monkeypatch, dao) -> Flask:
+    """The app as created for serving, but with in-memory databases."""
+    for name in ("REDIS_DATA_URL", "METRICS_USER", "METRICS_PASSWORD", "METRICS_HOST", "TRUSTED_PROXIES"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("SECRET_KEY", "test")
+    users_database = mongomock.MongoClient()["users"]
+    monkeypatch.setattr(application, "ApplicationDao", lambda metrics, cache: dao)
+    monkeypatch.setattr(application, "Users", lambda dao: Users(dao=dao, database=users_database))
+    return application.create_flask_app()
@@ -0,0 +1,51 @@
+import datetime
+
+import mongomock
+
+
+class DateTruncStandIn:
+    """
+    Runs $group stages keyed by $dateTrunc, which mongomock lacks, in Python, leaving the other stages to mongomock.
+    Only the $last accumulator is supported, and weeks start on Sunday as they do in Mongo by default.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def aggregate(self, pipeline, **kwargs):
+        index = next((i for i, x in enumerate(pipeline) if _is_date_trunc_group(x)), None)
+        if index is None:
+            return self.collection.aggregate(pipeline, **kwargs)
+
+        group = pipeline[index]["$group"]
+        date_trunc = group["_id"]["$dateTrunc"]
+        groups = {}
+        for document in self.collection.aggregate(pipeline[:index]):
+            key = _truncate(document[date_trunc["date"].lstrip("$")], date_trunc["unit"])
+            groups[key] = {
+                field: document[accumulator["$last"].lstrip("$")]
+                for field, accumulator in group.items()
+                if field != "_id"
+            }
+
+        first_later_stage = index + 1
+        later_stages = pipeline[first_later_stage:]
+        scratch = mongomock.MongoClient()["scratch"]["groups"]
+        scratch.insert_many([dict(fields, _id=key) for key, fields in groups.items()] or [{"_id": None}])
+        return scratch.aggregate([{"$match": {"_id": {"$ne": None}}}, *later_stages])
+
+
+def _is_date_trunc_group(stage: dict) -> bool:
+    return isinstance(stage.get("$group", {}).get("_id"), dict) and "$dateTrunc" in stage["$group"]["_id"]
+
+
+def _truncate(date: datetime.datetime, unit: str) -> datetime.datetime:
+    date = datetime.datetime(date.year, date.month, date.day)
+    if unit == "week":
+        return date - datetime.timedelta(days=(date.weekday() + 1) % 7)
+    if unit == "month":
+        return date.replace(day=1)
+    return date
@@ -0,0 +1,90 @@
+import operator
+
+import mongomock
+
+
+class DocumentGroupStandIn:
+    """
+    Runs the $group stage of pipelines in Python, since mongomock can't compare documents in $min and $max, which
+    Mongo does field by field, leaving the stages around it to mongomock.
+    Only $sum, $min and $max are supported, over field paths, literals, documents and $cond of comparisons.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def aggregate(self, pipeline, **kwargs):
+        index = next((i for i, x in enumerate(pipeline) if "$group" in x), None)
+        if index is None:
+            return self.collection.aggregate(pipeline, **kwargs)
+
+        group = pipeline[index]["$group"]
+        groups = {}
+        for document in self.collection.aggregate(pipeline[:index], **kwargs):
+            key = _evaluate(group["_id"], document)
+            values = groups.setdefault(key, {field: [] for field in group if field != "_id"})
+            for field, accumulator in group.items():
+                if field != "_id":
+                    values[field].append(_evaluate(next(iter(accumulator.values())), document))
+
+        results = []
+        for key, values in groups.items():
+            result = {"_id": key}
+            for field, accumulator in group.items():
+                if field != "_id":
+                    result[field] = _accumulate(next(iter(accumulator)), values[field])
+            results.append(result)
+
+        first_later_stage = index + 1
+        later_stages = pipeline[first_later_stage:]
+        if not later_stages:
+            return iter(results)
+        scratch = mongomock.MongoClient()["scratch"]["groups"]
+        scratch.insert_many(results or [{"_id": None}])
+        return scratch.aggregate([{"$match": {"_id": {"$ne": None}}}, *later_stages])
+
+
+class ReplaceOneStandIn:
+    """Applies bulk writes of ReplaceOne one at a time, as mongomock's bulk_write doesn't match this pymongo."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        for request in requests:
+            self.collection.replace_one(request._filter, request._doc, upsert=request._upsert)
+
+
+_COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+def _evaluate(expression, document):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return document.get(expression.lstrip("$"))
+    if isinstance(expression, dict) and "$cond" in expression:
+        condition, if_true, if_false = expression["$cond"]
+        return _evaluate(if_true if _evaluate(condition, document) else if_false, document)
+    if isinstance(expression, dict) and next(iter(expression), None) in _COMPARISONS:
+        name, arguments = next(iter(expression.items()))
+        left, right = (_evaluate(x, document) for x in arguments)
+        return _COMPARISONS[name](left, right)
+    if isinstance(expression, dict):
+        return {field: _evaluate(x, document) for field, x in expression.items()}
+    return expression
+
+
+def _accumulate(name, values):
+    if name == "$sum":
+        return sum(values)
+    # Nulls are ignored, and documents are compared field by field
+    values = [x for x in values if x is not None]
+    if not values:
+        return None
+    key = (lambda x: tuple(x.values())) if isinstance(values[0], dict) else None
+    return (min if name == "$min" else max)(values, key=key)
@@ -0,0 +1,51 @@
+from pymongo.errors import ExecutionTimeout
+
+from application.data.circuit_breaker import TIME_BUDGET_ARGUMENTS
+
+
+class FaultInjectingCollection:
+    """
+    Stands in for a Mongo collection, passing calls through to another collection, such as a mongomock one, until it is
+    told to fail or to be slow.
+    A slow collection behaves like Mongo given maxTimeMS: calls whose time budget is shorter than the latency fail with
+    ExecutionTimeout, without actually waiting.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.error = None
+        self.latency_ms = 0
+        self.num_calls = 0
+        # The time budget given to each call, or None if it was given none
+        self.time_budgets = []
+
+    @property
+    def name(self) -> str:
+        return self.collection.name
+
+    def fail_with(self, error: Exception):
+        self.error = error
+
+    def slow_down(self, latency_ms: int):
+        self.latency_ms = latency_ms
+
+    def recover(self):
+        self.error = None
+        self.latency_ms = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self.collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self.num_calls += 1
+            time_budget_ms = kwargs.pop(TIME_BUDGET_ARGUMENTS[name], None) if name in TIME_BUDGET_ARGUMENTS else None
+            self.time_budgets.append(time_budget_ms)
+            if self.error is not None:
+                raise self.error
+            if self.latency_ms and ((time_budget_ms is None) or (self.latency_ms > time_budget_ms)):
+                raise ExecutionTimeout("operation exceeded time limit")
+            return attribute(*args, **kwargs)
+
+        return call
@@ -0,0 +1,31 @@
+class SearchIndexStandIn:
+    """
+    Runs Atlas Search stages, which mongomock lacks, as regular expression matches on the display name, giving each
+    result the search metadata like $$SEARCH_META does.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.stages = []
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def aggregate(self, pipeline, **kwargs):
+        stage, options = next(iter(pipeline[0].items()))
+        if stage not in ("$search", "$searchMeta"):
+            return self.collection.aggregate(pipeline, **kwargs)
+
+        self.stages.append(stage)
+        words = [x["autocomplete"]["query"] for x in options["compound"]["must"]]
+        match = {"$and": [{"display_name": {"$regex": x, "$options": "i"}} for x in words]}
+        meta = {"count": {"total": self.collection.count_documents(match)}}
+        if stage == "$searchMeta":
+            return iter([meta])
+
+        stages = [{"$match": match}]
+        for stage in pipeline[1:]:
+            if "$project" in stage:
+                stage = {"$project": {k: v for k, v in stage["$project"].items() if v != "$$SEARCH_META"}}
+            stages.append(stage)
+        return iter([dict(x, meta=meta) for x in self.collection.aggregate(stages)])
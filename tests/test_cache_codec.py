@@ -0,0 +1,82 @@
+import pytest
+
+from application.data.cache_codec import CACHE_CODECS, CacheCodec
+from application.data.category import Category
+from application.data.price_history import PriceHistory
+from application.data.price_stats import PriceStats
+from application.data.products_search import Product
+
+
+@pytest.fixture(params=sorted(CACHE_CODECS))
+def codec(request) -> CacheCodec:
+    return CACHE_CODECS[request.param]
+
+
+def test_products_round_trip(codec):
+    products = [Product(id=1, display_name="Apples"), Product(id=2**40, display_name="Pâté, 200g")]
+    assert codec.decode_products(codec.encode_products(products)) == products
+    assert codec.decode_products(codec.encode_products([])) == []
+
+
+def test_categories_round_trip(codec):
+    categories = [Category(id=1, display_name="Fruit & Veg"), Category(id=2, display_name="")]
+    assert codec.decode_categories(codec.encode_categories(categories)) == categories
+
+
+def test_price_history_round_trip(codec):
+    price_history = PriceHistory(
+        dates=["2024-01-01", "2024-02-01", "2024-03-01"],
+        prices=[1.5, 1.25, 1.75],
+        current_price=1.75,
+        minimum_price=1.25,
+        maximum_price=1.75,
+        minimum_price_date="2024-02-01",
+        maximum_price_date="2024-03-01",
+    )
+    assert codec.decode_price_history(codec.encode_price_history(price_history)) == price_history
+
+    empty = PriceHistory(
+        dates=[],
+        prices=[],
+        current_price=None,
+        minimum_price=None,
+        maximum_price=None,
+        minimum_price_date=None,
+        maximum_price_date=None,
+    )
+    assert codec.decode_price_history(codec.encode_price_history(empty)) == empty
+
+
+def test_price_stats_round_trip(codec):
+    price_stats = PriceStats(
+        product_id=7,
+        current_price=2.5,
+        current_price_date="2024-03-01",
+        minimum_price=2.0,
+        maximum_price=3.0,
+        low_30_days=2.5,
+        low_90_days=2.0,
+        low_365_days=2.0,
+        num_price_changes=4,
+        percent_off_high=16.5,
+    )
+    assert codec.decode_price_stats(codec.encode_price_stats(price_stats)) == price_stats
+
+
+def test_names_containing_null_characters_round_trip(codec):
+    products = [Product(id=1, display_name="Bad\x00Name"), Product(id=2, display_name="Good")]
+    assert codec.decode_products(codec.encode_products(products)) == products
+
+    categories = [Category(id=1, display_name="\x00"), Category(id=2, display_name="Pâté\x00")]
+    assert codec.decode_categories(codec.encode_categories(categories)) == categories
+
+
+def test_codecs_must_implement_every_method():
+    class PartialCacheCodec(CacheCodec):
+        name = "partial"
+
+        def encode_products(self, products):
+            return b""
+
+    with pytest.raises(TypeError):
+        PartialCacheCodec()
@@ -0,0 +1,236 @@
+import fakeredis
+import mongomock
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure, WaitQueueTimeoutError
+
+from application.constants.app_constants import QUERY_TIME_BUDGET_MS, REDIS_VERSION
+from application.data import circuit_breaker
+from application.data.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DatabaseUnavailableError,
+    GuardedCollection,
+)
+from application.data.dao import ApplicationDao
+from tests.fault_injection import FaultInjectingCollection
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock.monotonic)
+    return clock
+
+
+@pytest.fixture
+def collection() -> FaultInjectingCollection:
+    collection = mongomock.MongoClient()["test"]["products"]
+    collection.insert_many([{"id": i, "display_name": f"Product {i}"} for i in range(3)])
+    return FaultInjectingCollection(collection)
+
+
+def fail():
+    raise AutoReconnect("connection refused")
+
+
+def open_circuit(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(DatabaseUnavailableError):
+            breaker.call(fail)
+
+
+def test_closed_circuit_stays_closed_below_threshold(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    for _ in range(2):
+        with pytest.raises(DatabaseUnavailableError):
+            breaker.call(fail)
+
+    assert not breaker.is_open
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.consecutive_failures == 0
+
+
+def test_circuit_opens_after_threshold_and_fails_fast(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    open_circuit(breaker)
+    assert breaker.is_open
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(calls.append, 1)
+    assert calls == []
+
+
+def test_half_open_trial_success_closes_circuit(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    open_circuit(breaker)
+
+    clock.now += 30
+    assert not breaker.is_open
+    assert breaker.call(lambda: "ok") == "ok"
+
+    assert breaker.opened_at is None
+    assert not breaker.trial_in_progress
+    assert breaker.call(lambda: "ok") == "ok"
+
+
+def test_half_open_allows_only_one_trial(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    open_circuit(breaker)
+    clock.now += 30
+
+    def trial():
+        # Another call while the trial is running is refused
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: "second")
+        return "first"
+
+    assert breaker.call(trial) == "first"
+
+
+def test_half_open_trial_failure_reopens_circuit(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    open_circuit(breaker)
+
+    clock.now += 30
+    with pytest.raises(DatabaseUnavailableError):
+        breaker.call(fail)
+
+    # Open for another full reset period from the failed trial
+    assert breaker.is_open
+    assert not breaker.trial_in_progress
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+    clock.now += 1
+    assert breaker.call(lambda: "ok") == "ok"
+
+
+def test_interrupted_trial_lets_next_call_try(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    open_circuit(breaker)
+    clock.now += 30
+
+    def interrupted():
+        raise GeneratorExit()
+
+    with pytest.raises(GeneratorExit):
+        breaker.call(interrupted)
+
+    assert not breaker.trial_in_progress
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.opened_at is None
+
+
+def test_other_errors_count_as_available(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+    with pytest.raises(DatabaseUnavailableError):
+        breaker.call(fail)
+
+    def bad_query():
+        raise OperationFailure("bad query")
+
+    with pytest.raises(OperationFailure):
+        breaker.call(bad_query)
+    assert breaker.consecutive_failures == 0
+
+
+def test_busy_connection_pool_does_not_open_circuit(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+
+    def busy():
+        raise WaitQueueTimeoutError("timed out waiting for a connection")
+
+    for _ in range(5):
+        with pytest.raises(DatabaseUnavailableError):
+            breaker.call(busy)
+    assert not breaker.is_open
+    assert breaker.consecutive_failures == 0
+
+
+def test_guarded_collection_passes_time_budget(collection):
+    guarded = GuardedCollection(collection, CircuitBreaker("test"), time_budget_ms=250)
+    assert len(list(guarded.find({}))) == 3
+    assert guarded.count_documents({}) == 3
+    assert guarded.find({}, max_time_ms=50) is not None
+
+    assert collection.time_budgets == [250, 250, 50]
+
+
+def test_guarded_collection_opens_circuit_on_slow_database(clock, collection):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+    guarded = GuardedCollection(collection, breaker, time_budget_ms=100)
+
+    collection.slow_down(500)
+    for _ in range(2):
+        with pytest.raises(DatabaseUnavailableError):
+            guarded.find_one({"id": 1})
+    assert breaker.is_open
+
+    num_calls = collection.num_calls
+    with pytest.raises(CircuitOpenError):
+        guarded.find_one({"id": 1})
+    assert collection.num_calls == num_calls
+
+    collection.recover()
+    clock.now += 30
+    assert guarded.find_one({"id": 1})["display_name"] == "Product 1"
+    assert not breaker.is_open
+
+
+def test_guarded_cursor_failure_counts(clock, collection):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    guarded = GuardedCollection(collection, breaker, time_budget_ms=100)
+
+    class FailingCursor:
+        def __next__(self):
+            raise AutoReconnect("connection reset")
+
+    class FailingCollection:
+        name = "products"
+
+        def find(self, *args, **kwargs):
+            return FailingCursor()
+
+    collection.collection = FailingCollection()
+    cursor = guarded.find({})
+    with pytest.raises(DatabaseUnavailableError):
+        next(cursor)
+    assert breaker.is_open
+
+
+def test_dao_serves_cached_data_while_database_is_down(clock):
+    database = mongomock.MongoClient()["price_history"]
+    database["categories"].insert_many([{"id": 1, "display_name": "Fruit"}])
+    database["products"].insert_many([{"id": i, "display_name": f"Product {i}", "category": 1} for i in range(3)])
+    dao = ApplicationDao(database=database, cache=fakeredis.FakeStrictRedis(version=REDIS_VERSION))
+    stand_ins = {}
+    for name in ("products_collection", "categories_collection", "prices_collection"):
+        guarded = getattr(dao, name)
+        stand_ins[name] = FaultInjectingCollection(guarded.collection)
+        guarded.collection = stand_ins[name]
+
+    assert dao.get_category_display_name(1) == "Fruit"
+    assert dao.get_product_display_name(2) == "Product 2"
+    assert set(stand_ins["categories_collection"].time_budgets) == {QUERY_TIME_BUDGET_MS}
+
+    for stand_in in stand_ins.values():
+        stand_in.fail_with(AutoReconnect("connection refused"))
+
+    # Cached data is still served, and uncached data fails fast once the circuit opens
+    assert dao.get_category_display_name(1) == "Fruit"
+    for _ in range(dao.products_breaker.failure_threshold):
+        with pytest.raises(DatabaseUnavailableError):
+            dao.get_product_display_name(1)
+    assert dao.products_breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        dao.get_product_display_name(1)
+    assert dao.get_product_display_name(2) == "Product 2"
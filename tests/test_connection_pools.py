@@ -0,0 +1,18 @@
+from application.constants.app_constants import PRICE_HISTORY_MAX_WORKERS
+from application.data.connection_pools import get_pool_size
+
+
+def test_pool_size_follows_worker_concurrency(monkeypatch):
+    monkeypatch.setenv("WORKER_CONCURRENCY", "200")
+    monkeypatch.delenv("MONGO_MAX_POOL_SIZE", raising=False)
+
+    assert get_pool_size("MONGO") == 200 + PRICE_HISTORY_MAX_WORKERS
+
+
+def test_pool_size_can_be_set_per_client(monkeypatch):
+    monkeypatch.setenv("WORKER_CONCURRENCY", "200")
+    monkeypatch.setenv("USERS_MAX_POOL_SIZE", "50")
+    monkeypatch.delenv("MONGO_MAX_POOL_SIZE", raising=False)
+
+    assert get_pool_size("USERS") == 50
+    assert get_pool_size("MONGO") == 200 + PRICE_HISTORY_MAX_WORKERS
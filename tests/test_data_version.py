@@ -0,0 +1,37 @@
+import fakeredis
+import mongomock
+import pytest
+
+from application.constants.app_constants import REDIS_VERSION
+from application.data.dao import ApplicationDao
+
+
+@pytest.fixture
+def dao() -> ApplicationDao:
+    database = mongomock.MongoClient()["price_history"]
+    database["categories"].insert_many([{"id": 1, "display_name": "Fruit"}])
+    database["products"].insert_many([{"id": 1, "display_name": "Apples", "category": 1}])
+    return ApplicationDao(database=database, cache=fakeredis.FakeStrictRedis(version=REDIS_VERSION))
+
+
+def test_data_version_is_cached_between_polls(dao):
+    data_version = dao.get_data_version()
+    dao.database["products"].insert_one({"id": 2, "display_name": "Pears", "category": 1})
+
+    assert dao.get_data_version() == data_version
+
+
+def test_edit_in_place_is_served_once_marked(dao):
+    assert dao.get_product_display_name(1) == "Apples"
+    data_version = dao.get_data_version()
+
+    dao.database["products"].update_one({"id": 1}, {"$set": {"display_name": "Green Apples"}})
+    assert dao.get_product_display_name(1) == "Apples"
+
+    assert dao.mark_data_changed() != data_version
+    assert dao.get_product_display_name(1) == "Green Apples"
+
+
+def test_marking_changes_version_every_time(dao):
+    versions = {dao.get_data_version(), dao.mark_data_changed(), dao.mark_data_changed()}
+    assert len(versions) == 3
@@ -0,0 +1,88 @@
+import datetime
+
+import fakeredis
+import mongomock
+import pytest
+
+from application.constants.app_constants import DATE_FORMAT_STRING, FAVORITES_DIGEST_DEFAULT_DAYS, REDIS_VERSION
+from application.data.dao import ApplicationDao
+from application.data.price_change import PriceChange
+from application.data.users import Users
+from tests.document_group import DocumentGroupStandIn, ReplaceOneStandIn
+from tests.fault_injection import FaultInjectingCollection
+
+TODAY = datetime.datetime.today()
+SINCE = TODAY - datetime.timedelta(days=FAVORITES_DIGEST_DEFAULT_DAYS)
+
+
+def _days_ago(days: int) -> datetime.datetime:
+    return TODAY - datetime.timedelta(days=days)
+
+
+@pytest.fixture
+def users() -> Users:
+    database = mongomock.MongoClient()["price_history"]
+    database["categories"].insert_many([{"id": 1, "display_name": "Fruit"}])
+    database["products"].insert_many(
+        [
+            {"id": 1, "display_name": "Apples", "category": 1},
+            {"id": 2, "display_name": "Pears", "category": 1},
+            {"id": 3, "display_name": "Plums", "category": 1},
+        ]
+    )
+    database["prices"].insert_many(
+        [
+            # Changed price within the digest period
+            {"product_id": 1, "start_date": _days_ago(20), "price_cents": 200},
+            {"product_id": 1, "start_date": _days_ago(3), "price_cents": 150},
+            # Last changed price before the digest period
+            {"product_id": 2, "start_date": _days_ago(30), "price_cents": 300},
+            {"product_id": 2, "start_date": _days_ago(20), "price_cents": 250},
+            # First priced within the digest period
+            {"product_id": 3, "start_date": _days_ago(2), "price_cents": 99},
+        ]
+    )
+    dao = ApplicationDao(database=database, cache=fakeredis.FakeStrictRedis(version=REDIS_VERSION))
+    dao.products_collection.collection = FaultInjectingCollection(dao.products_collection.collection)
+    dao.prices_collection.collection = DocumentGroupStandIn(FaultInjectingCollection(dao.prices_collection.collection))
+
+    users_database = mongomock.MongoClient()["users"]
+    users_database["favorites"].insert_many(
+        [
+            {"user_id": "changed", "product_id": 1},
+            {"user_id": "changed", "product_id": 2},
+            {"user_id": "unchanged", "product_id": 2},
+            {"user_id": "new", "product_id": 3},
+            {"user_id": "new", "product_id": 1},
+        ]
+    )
+    # A digest from an earlier run, which is out of date once nothing the user favorited has changed
+    users_database["favorites_digests"].insert_one(
+        {"_id": "unchanged", "since": _days_ago(14), "computed": _days_ago(7), "changes": []}
+    )
+    users = Users(dao=dao, database=users_database)
+    for guarded in (users.favorites_collection, users.favorites_digests_collection):
+        guarded.collection = ReplaceOneStandIn(FaultInjectingCollection(guarded.collection))
+    return users
+
+
+def test_digest_holds_favorites_changed_within_period(users):
+    assert users.compute_favorites_digests(SINCE, batch_size=2) == (3, 2)
+
+    assert users.get_favorites_digest("changed") == (
+        SINCE.strftime(DATE_FORMAT_STRING),
+        [PriceChange(1, "Apples", 2.0, 1.5, 1, _days_ago(3).strftime(DATE_FORMAT_STRING))],
+    )
+
+
+def test_digest_includes_products_first_priced_within_period(users):
+    users.compute_favorites_digests(SINCE)
+
+    _, changes = users.get_favorites_digest("new")
+    assert [(x.product_id, x.previous_price, x.price) for x in changes] == [(1, 2.0, 1.5), (3, None, 0.99)]
+
+
+def test_no_digest_without_changed_favorites(users):
+    users.compute_favorites_digests(SINCE)
+
+    assert users.get_favorites_digest("unchanged") is None
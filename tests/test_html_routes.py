@@ -0,0 +1,68 @@
+import gzip
+
+import pytest
+
+from application.constants.app_constants import (
+    CONCURRENCY_CACHE_PREFIX,
+    MAX_COMPARED_PRODUCTS,
+    MAX_CONCURRENT_SEARCHES,
+    SESSION_USER_ID_KEY,
+    USERS_CONFIG_KEY,
+)
+from tests.conftest import NUM_PRODUCTS
+
+
+@pytest.mark.parametrize("path", ["/category/1", "/products/Product 01"])
+def test_listing_pages_are_compressed_as_they_stream(app, path):
+    response = app.test_client().get(path, headers={"Accept-Encoding": "gzip, deflate"})
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert "</html>" in gzip.decompress(response.get_data()).decode()
+
+
+def test_category_page_lists_products(app):
+    body = app.test_client().get("/category/1").get_data(as_text=True)
+    assert f"({NUM_PRODUCTS} Products)" in body
+    assert body.count("/price_history/") == NUM_PRODUCTS
+
+
+def test_favorites_comparison_is_limited_to_max_compared_products(app):
+    app.config[USERS_CONFIG_KEY].database["favorites"].insert_many(
+        [{"user_id": "user", "product_id": i} for i in range(NUM_PRODUCTS)]
+    )
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session[SESSION_USER_ID_KEY] = "user"
+
+    body = client.get("/categories").get_data(as_text=True)
+    compared_product_ids = body.split("/compare?product_ids=")[1].split('"')[0].split(",")
+    assert len(compared_product_ids) == MAX_COMPARED_PRODUCTS
+
+
+def test_search_page_runs_search_once(app, dao):
+    client = app.test_client()
+    for _ in range(2):
+        body = client.get("/products/Product 01").get_data(as_text=True)
+        # Each word is matched separately, so Product 001 is found along with Product 010 to Product 019
+        assert "11 Results For" in body
+        assert body.count("/price_history/") == 11
+
+    assert dao.products_collection.collection.stages == ["$search"]
+
+
+def test_search_slot_is_released_when_response_is_closed_unread(app, dao):
+    client = app.test_client()
+    responses = [
+        client.get(f"/products/Product {i:03d}", environ_base={"REMOTE_ADDR": f"10.0.0.{i}"})
+        for i in range(MAX_CONCURRENT_SEARCHES + 1)
+    ]
+    assert [x.status_code for x in responses] == [200] * MAX_CONCURRENT_SEARCHES + [429]
+
+    # Streamed responses each hold a request context open, so they're closed in the reverse of the order they were made
+    for response in reversed(responses):
+        response.close()
+    assert dao.cache.client.zcard(f"{CONCURRENCY_CACHE_PREFIX}search") == 0
+    assert client.get("/products/Product 029").status_code == 200
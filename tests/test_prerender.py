@@ -0,0 +1,70 @@
+import datetime
+import json
+import os
+
+import pytest
+
+from application.routes.prerender import MANIFEST_FILE_NAME, PAGE_FILE_NAME, prerender
+from tests.conftest import NUM_PRODUCTS
+
+NUM_PAGES = 2 + NUM_PRODUCTS
+
+
+def read_page(output_folder, path: str) -> str:
+    with open(os.path.join(output_folder, path, PAGE_FILE_NAME), encoding="utf8") as file:
+        return file.read()
+
+
+@pytest.fixture
+def output_folder(tmp_path) -> str:
+    return str(tmp_path / "pages")
+
+
+def test_renders_every_page(dao, output_folder):
+    assert prerender(dao, output_folder, processes=1) == (NUM_PAGES, NUM_PAGES)
+
+    assert "Product 007" in read_page(output_folder, "category/1")
+    page = read_page(output_folder, "price_history/7")
+    assert "Product 007" in page
+    # The page doesn't depend on the day it was rendered, today's point is added in the browser
+    assert "'2024-01-01', '2024-01-31', '2024-03-01']" in page
+    assert datetime.date.today().isoformat() not in page
+    assert 'data-range-days="90"' in page
+    with open(os.path.join(output_folder, MANIFEST_FILE_NAME), encoding="utf8") as file:
+        assert len(json.load(file)) == NUM_PAGES
+
+
+def test_unchanged_pages_are_skipped(dao, output_folder):
+    prerender(dao, output_folder, processes=1)
+    modified_time = os.path.getmtime(os.path.join(output_folder, "price_history/7", PAGE_FILE_NAME))
+
+    assert prerender(dao, output_folder, processes=1) == (NUM_PAGES, 0)
+    assert os.path.getmtime(os.path.join(output_folder, "price_history/7", PAGE_FILE_NAME)) == modified_time
+
+
+def test_changed_pages_are_rendered_again(dao, database, output_folder):
+    prerender(dao, output_folder, processes=1)
+
+    database["prices"].insert_one({"product_id": 7, "start_date": datetime.datetime(2024, 4, 1), "price_cents": 99})
+    assert prerender(dao, output_folder, processes=1) == (NUM_PAGES, 1)
+    assert "'2024-03-01', '2024-04-01']" in read_page(output_folder, "price_history/7")
+
+    # Renaming a product changes its price history page and the page of its category
+    database["products"].update_one({"id": 8}, {"$set": {"display_name": "Renamed Product"}})
+    assert prerender(dao, output_folder, processes=1) == (NUM_PAGES, 2)
+    assert "Renamed Product" in read_page(output_folder, "category/1")
+
+
+def test_deleted_page_is_rendered_again(dao, output_folder):
+    prerender(dao, output_folder, processes=1)
+    os.remove(os.path.join(output_folder, "price_history/7", PAGE_FILE_NAME))
+
+    assert prerender(dao, output_folder, processes=1) == (NUM_PAGES, 1)
+
+
+def test_pages_of_products_without_prices_are_removed(dao, database, output_folder):
+    prerender(dao, output_folder, processes=1)
+
+    database["prices"].delete_many({"product_id": 7})
+    assert prerender(dao, output_folder, processes=1) == (NUM_PAGES - 1, 0)
+    assert not os.path.exists(os.path.join(output_folder, "price_history/7"))
@@ -0,0 +1,46 @@
+import datetime
+
+from application.data.price_comparison import compare_price_histories
+from application.data.price_history import build_price_history
+
+
+def _price_history(*prices):
+    return build_price_history(
+        [datetime.datetime.fromisoformat(date) for date, _ in prices], [x for _, x in prices], extend_to_end=False
+    )
+
+
+def test_histories_share_every_date():
+    comparison = compare_price_histories(
+        {
+            1: _price_history(("2024-01-01", 1.0), ("2024-01-10", 2.0)),
+            2: _price_history(("2024-01-05", 5.0), ("2024-01-10", 6.0)),
+        },
+        {1: "Apples", 2: "Pears"},
+    )
+
+    assert comparison.dates == ["2024-01-01", "2024-01-05", "2024-01-10"]
+    assert [(x.id, x.display_name) for x in comparison.products] == [(1, "Apples"), (2, "Pears")]
+
+
+def test_price_carries_forward_until_it_changes():
+    comparison = compare_price_histories(
+        {
+            1: _price_history(("2024-01-01", 1.0), ("2024-01-20", 3.0)),
+            2: _price_history(("2024-01-05", 5.0), ("2024-01-10", 6.0), ("2024-01-15", 7.0)),
+        },
+        {1: "Apples", 2: "Pears"},
+    )
+
+    assert comparison.products[0].prices == [1.0, 1.0, 1.0, 1.0, 3.0]
+    assert comparison.products[1].prices == [None, 5.0, 6.0, 7.0, 7.0]
+
+
+def test_product_without_prices_has_none_on_every_date():
+    comparison = compare_price_histories(
+        {1: _price_history(("2024-01-01", 1.0), ("2024-01-10", 2.0)), 2: _price_history()},
+        {1: "Apples", 2: "Pears"},
+    )
+
+    assert comparison.dates == ["2024-01-01", "2024-01-10"]
+    assert comparison.products[1].prices == [None, None]
@@ -0,0 +1,89 @@
+import datetime
+
+import fakeredis
+import mongomock
+import pytest
+from bson import ObjectId
+
+from application.constants.app_constants import REDIS_VERSION
+from application.data import price_drops
+from application.data.dao import ApplicationDao
+from application.data.price_drops import WATERMARK_KEY, PriceDrops
+from tests.fault_injection import FaultInjectingCollection
+
+TODAY = datetime.datetime.today()
+
+
+def _days_ago(days: int) -> datetime.datetime:
+    return TODAY - datetime.timedelta(days=days)
+
+
+@pytest.fixture
+def dao() -> ApplicationDao:
+    database = mongomock.MongoClient()["price_history"]
+    database["categories"].insert_many([{"id": 1, "display_name": "Fruit"}])
+    database["products"].insert_many(
+        [{"id": 1, "display_name": "Apples", "category": 1}, {"id": 2, "display_name": "Pears", "category": 1}]
+    )
+    dao = ApplicationDao(database=database, cache=fakeredis.FakeStrictRedis(version=REDIS_VERSION))
+    for guarded in (dao.products_collection, dao.prices_collection):
+        guarded.collection = FaultInjectingCollection(guarded.collection)
+    return dao
+
+
+def _add_prices(dao, *prices):
+    dao.database["prices"].insert_many(
+        [{"_id": ObjectId(), "product_id": x, "start_date": date, "price_cents": y} for x, date, y in prices]
+    )
+
+
+def _top_drops(drops, category_id=None):
+    return [(x.product_id, x.percent_drop) for x in drops.get_top_drops(10, category_id=category_id)]
+
+
+def test_watermark_advances_past_processed_prices(dao):
+    _add_prices(dao, (1, _days_ago(10), 200), (1, _days_ago(5), 150))
+    drops = PriceDrops(dao=dao)
+
+    assert drops.update(batch_size=1) == 2
+    assert _top_drops(drops) == [(1, 25.0)]
+    assert drops.update() == 0
+
+    _add_prices(dao, (1, _days_ago(1), 100))
+    assert drops.update() == 1
+    assert _top_drops(drops) == [(1, 33.3)]
+    latest = dao.database["prices"].find_one(sort=[("start_date", -1)])
+    assert dao.cache.client.get(WATERMARK_KEY).decode() == f"{latest['start_date'].isoformat()}|{latest['_id']}"
+
+
+def test_watermark_within_a_date_resumes_after_its_id(dao):
+    date = _days_ago(3)
+    _add_prices(dao, (1, _days_ago(10), 200), (2, _days_ago(10), 200), (1, date, 100), (2, date, 100))
+    # As if an update stopped after the first of the prices starting on the same date
+    first_id = min(x["_id"] for x in dao.database["prices"].find({"start_date": date}))
+    dao.cache.client.set(WATERMARK_KEY, f"{date.isoformat()}|{first_id}")
+    drops = PriceDrops(dao=dao)
+
+    assert drops.update() == 1
+    # The second price is compared to the price its product had before it, not skipped or compared to itself
+    assert _top_drops(drops) == [(2, 50.0)]
+
+
+def test_drops_older_than_max_age_are_trimmed(dao, monkeypatch):
+    _add_prices(
+        dao,
+        (1, _days_ago(price_drops.PRICE_DROP_MAX_AGE_DAYS + 5), 200),
+        (1, _days_ago(price_drops.PRICE_DROP_MAX_AGE_DAYS + 3), 100),
+        (2, _days_ago(10), 200),
+        (2, _days_ago(8), 100),
+    )
+    drops = PriceDrops(dao=dao)
+
+    # The first update only processes prices within the max age
+    assert drops.update() == 2
+    assert _top_drops(drops) == [(2, 50.0)]
+
+    monkeypatch.setattr(price_drops, "PRICE_DROP_MAX_AGE_DAYS", 7)
+    drops.update()
+    assert _top_drops(drops) == []
+    assert _top_drops(drops, category_id=1) == []
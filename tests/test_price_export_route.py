@@ -0,0 +1,41 @@
+import gzip
+import json
+
+from application.constants.app_constants import CONCURRENCY_CACHE_PREFIX, MAX_CONCURRENT_EXPORTS
+from tests.conftest import NUM_PRODUCTS
+
+
+def test_export_is_compressed_as_it_streams(app):
+    response = app.test_client().get("/api/v1/export/prices", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    rows = [json.loads(x) for x in gzip.decompress(response.get_data()).decode().splitlines()]
+    assert len(rows) == NUM_PRODUCTS * 3
+    assert rows[0] == {"product_id": 0, "start_date": "2024-01-01T00:00:00", "price_cents": 100}
+
+
+def test_export_rejects_non_integer_category(app):
+    response = app.test_client().get("/api/v1/export/prices?category_id=abc")
+    assert response.status_code == 400
+
+
+def test_exports_running_at_once_are_limited(app, dao):
+    client = app.test_client()
+    responses = [client.get("/api/v1/export/prices", environ_base={"REMOTE_ADDR": f"10.0.0.{i}"}) for i in range(3)]
+    assert [x.status_code for x in responses[:MAX_CONCURRENT_EXPORTS]] == [200] * MAX_CONCURRENT_EXPORTS
+    assert responses[MAX_CONCURRENT_EXPORTS].status_code == 429
+
+    # Closing a response releases its slot, even if its body was never read.
+    # Streamed responses each hold a request context open, so they're closed in the reverse of the order they were made
+    responses[2].close()
+    responses[1].close()
+    assert dao.cache.client.zcard(f"{CONCURRENCY_CACHE_PREFIX}export") == MAX_CONCURRENT_EXPORTS - 1
+    response = client.get("/api/v1/export/prices", environ_base={"REMOTE_ADDR": "10.0.0.9"})
+    assert response.status_code == 200
+
+    response.close()
+    responses[0].close()
+    assert dao.cache.client.zcard(f"{CONCURRENCY_CACHE_PREFIX}export") == 0
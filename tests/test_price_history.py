@@ -0,0 +1,110 @@
+import datetime
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from application.routes.request_args import get_price_history_args
+
+TODAY = datetime.date.today().isoformat()
+
+
+@pytest.fixture
+def product_id(database) -> int:
+    # Several changes within January and within one week, then one in March
+    product_id = 100
+    database["prices"].insert_many(
+        [
+            {"product_id": product_id, "start_date": datetime.datetime(2024, 1, 1), "price_cents": 500},
+            {"product_id": product_id, "start_date": datetime.datetime(2024, 1, 2), "price_cents": 450},
+            {"product_id": product_id, "start_date": datetime.datetime(2024, 1, 10), "price_cents": 600},
+            {"product_id": product_id, "start_date": datetime.datetime(2024, 3, 5), "price_cents": 550},
+        ]
+    )
+    return product_id
+
+
+def test_full_history_runs_to_today(dao, product_id):
+    price_history = dao.get_product_price_history(product_id)
+
+    assert price_history.dates == ["2024-01-01", "2024-01-02", "2024-01-10", "2024-03-05", TODAY]
+    assert price_history.prices == [5.0, 4.5, 6.0, 5.5, 5.5]
+    assert price_history.current_price == 5.5
+    assert (price_history.minimum_price, price_history.minimum_price_date) == (4.5, "2024-01-09")
+    assert (price_history.maximum_price, price_history.maximum_price_date) == (6.0, "2024-03-04")
+
+
+def test_range_starts_with_price_in_effect(dao, product_id):
+    start_date, end_date, _ = get_price_history_args(MultiDict({"from": "2024-01-05", "to": "2024-02-01"}))
+    price_history = dao.get_product_price_history(product_id, start_date=start_date, end_date=end_date)
+
+    assert price_history.dates == ["2024-01-05", "2024-01-10", "2024-02-01"]
+    assert price_history.prices == [4.5, 6.0, 6.0]
+    assert price_history.current_price == 6.0
+
+
+def test_range_ending_before_first_price_is_empty(dao, product_id):
+    _, end_date, _ = get_price_history_args(MultiDict({"to": "2023-06-01"}))
+    price_history = dao.get_product_price_history(product_id, end_date=end_date)
+
+    assert price_history.dates == []
+    assert price_history.current_price is None
+    assert price_history.minimum_price is None
+
+
+@pytest.mark.parametrize(
+    "resolution, dates, prices",
+    [
+        ("day", ["2024-01-01", "2024-01-02", "2024-01-10", "2024-03-05"], [5.0, 4.5, 6.0, 5.5]),
+        # 2023-12-31 and 2024-01-07 are Sundays
+        ("week", ["2023-12-31", "2024-01-07", "2024-03-03"], [4.5, 6.0, 5.5]),
+        ("month", ["2024-01-01", "2024-03-01"], [6.0, 5.5]),
+    ],
+)
+def test_resampling_keeps_last_price_of_each_period(dao, product_id, resolution, dates, prices):
+    price_history = dao.get_product_price_history(product_id, resolution=resolution)
+
+    assert price_history.dates == [*dates, TODAY]
+    assert price_history.prices == [*prices, prices[-1]]
+
+
+def test_resampled_range_starts_at_start_of_range(dao, product_id):
+    start_date, _, _ = get_price_history_args(MultiDict({"from": "2024-01-05"}))
+    price_history = dao.get_product_price_history(product_id, start_date=start_date, resolution="month")
+
+    # The January period began before the range, so it's shown from the start of the range with its last price
+    assert price_history.dates == ["2024-01-05", "2024-03-01", TODAY]
+    assert price_history.prices == [6.0, 5.5, 5.5]
+
+
+def test_end_date_includes_its_whole_day():
+    _, end_date, _ = get_price_history_args(MultiDict({"to": "2024-01-10"}))
+    assert end_date == datetime.datetime(2024, 1, 10, 23, 59, 59, 999999)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        {"from": "2024-02-01", "to": "2024-01-01"},
+        {"from": (datetime.date.today() + datetime.timedelta(days=1)).isoformat()},
+        {"from": "01/02/2024"},
+        {"resolution": "hour"},
+    ],
+)
+def test_invalid_args_are_rejected(args):
+    with pytest.raises(ValueError):
+        get_price_history_args(MultiDict(args))
+
+
+def test_page_for_range_without_prices(app, product_id):
+    response = app.test_client().get(f"/price_history/{product_id}?to=2023-06-01")
+
+    assert response.status_code == 200
+    assert "No prices in this range." in response.get_data(as_text=True)
+
+
+def test_page_for_future_range_is_refused(app, product_id):
+    next_year = (datetime.date.today() + datetime.timedelta(days=365)).isoformat()
+    response = app.test_client().get(f"/price_history/{product_id}?from={next_year}")
+
+    assert response.status_code == 302
+    assert response.headers["Location"] == f"/price_history/{product_id}"
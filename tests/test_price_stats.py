@@ -0,0 +1,97 @@
+import datetime
+
+import fakeredis
+import mongomock
+import pytest
+
+from application.constants.app_constants import DATE_FORMAT_STRING, REDIS_VERSION
+from application.data.dao import ApplicationDao
+from tests.document_group import DocumentGroupStandIn, ReplaceOneStandIn
+from tests.fault_injection import FaultInjectingCollection
+
+TODAY = datetime.datetime.today()
+
+# Prices of each product, as (days ago, price in cents)
+PRICES = {
+    # Changed price within each window, and was at its high before all of them
+    1: [(400, 500), (200, 100), (60, 300), (10, 400)],
+    # Had a single price, which started before every window
+    2: [(500, 250)],
+    # Had a single price, which started within every window
+    3: [(5, 199)],
+    # Off its high by a third
+    4: [(50, 300), (1, 200)],
+}
+
+
+def _days_ago(days: int) -> datetime.datetime:
+    return TODAY - datetime.timedelta(days=days)
+
+
+@pytest.fixture
+def dao() -> ApplicationDao:
+    database = mongomock.MongoClient()["price_history"]
+    database["prices"].insert_many(
+        [
+            {"product_id": product_id, "start_date": _days_ago(days), "price_cents": price_cents}
+            for product_id, prices in PRICES.items()
+            for days, price_cents in prices
+        ]
+    )
+    # Stats left from an earlier run, for a product which no longer has prices
+    database["price_stats"].insert_one({"_id": 5, "current_price_cents": 100, "computed": _days_ago(1)})
+
+    dao = ApplicationDao(database=database, cache=fakeredis.FakeStrictRedis(version=REDIS_VERSION))
+    dao.prices_collection.collection = DocumentGroupStandIn(FaultInjectingCollection(dao.prices_collection.collection))
+    dao.price_stats_collection.collection = ReplaceOneStandIn(
+        FaultInjectingCollection(dao.price_stats_collection.collection)
+    )
+    return dao
+
+
+def test_counts_products_with_prices(dao):
+    assert dao.materialize_price_stats(batch_size=3) == len(PRICES)
+
+
+def test_lows_include_price_in_effect_at_window_start(dao):
+    dao.materialize_price_stats()
+    price_stats = dao.get_product_price_stats(1)
+
+    assert price_stats.current_price == 4.0
+    assert price_stats.current_price_date == _days_ago(10).strftime(DATE_FORMAT_STRING)
+    assert price_stats.minimum_price == 1.0
+    assert price_stats.maximum_price == 5.0
+    assert price_stats.low_30_days == 3.0
+    assert price_stats.low_90_days == 1.0
+    assert price_stats.low_365_days == 1.0
+    assert price_stats.num_price_changes == 3
+    assert price_stats.percent_off_high == 20.0
+
+
+@pytest.mark.parametrize("product_id, price", [(2, 2.5), (3, 1.99)])
+def test_single_price_is_every_low(dao, product_id, price):
+    dao.materialize_price_stats()
+    price_stats = dao.get_product_price_stats(product_id)
+
+    assert price_stats.current_price == price
+    assert price_stats.minimum_price == price
+    assert price_stats.maximum_price == price
+    assert (price_stats.low_30_days, price_stats.low_90_days, price_stats.low_365_days) == (price, price, price)
+    assert price_stats.num_price_changes == 0
+    assert price_stats.percent_off_high == 0.0
+
+
+def test_percent_off_high_is_rounded(dao):
+    dao.materialize_price_stats()
+    price_stats = dao.get_product_price_stats(4)
+
+    assert price_stats.percent_off_high == 33.3
+    assert price_stats.low_30_days == 2.0
+    assert price_stats.low_90_days == 2.0
+
+
+def test_stats_of_products_without_prices_are_removed(dao):
+    dao.materialize_price_stats()
+
+    assert dao.get_product_price_stats(5) is None
+    assert dao.database["price_stats"].count_documents({}) == len(PRICES)
@@ -0,0 +1,70 @@
+import fakeredis
+import mongomock
+import pytest
+
+from application.constants.app_constants import CACHED_BATCHES_PER_READ, REDIS_VERSION
+from application.data.dao import ApplicationDao
+from tests.search_index import SearchIndexStandIn
+
+
+@pytest.fixture
+def dao() -> ApplicationDao:
+    database = mongomock.MongoClient()["price_history"]
+    database["products"].insert_many(
+        [{"id": i, "display_name": f"{'Apple' if i % 2 else 'Pear'} {i:03d}", "category": 1} for i in range(100)]
+    )
+    dao = ApplicationDao(database=database, cache=fakeredis.FakeStrictRedis(version=REDIS_VERSION))
+    dao.products_collection.collection = SearchIndexStandIn(dao.products_collection.collection)
+    return dao
+
+
+def test_search_gives_number_found_from_same_query(dao):
+    num_results, batches = dao.search_products("apple", batch_size=10)
+    assert num_results == 50
+    assert not dao.is_product_search_cached("apple")
+
+    products = [x for batch in batches for x in batch]
+    assert len(products) == 50
+    assert products == sorted(products, key=lambda x: x.display_name)
+    assert dao.products_collection.collection.stages == ["$search"]
+    assert dao.is_product_search_cached("apple")
+
+    # Both the number and the products then come from the cache
+    num_results, batches = dao.search_products("apple", batch_size=10)
+    assert num_results == 50
+    assert [x for batch in batches for x in batch] == products
+    assert dao.products_collection.collection.stages == ["$search"]
+
+
+def test_search_finding_nothing(dao):
+    num_results, batches = dao.search_products("banana")
+    assert num_results == 0
+    assert list(batches) == [[]]
+    assert dao.search_products("banana")[0] == 0
+    assert dao.products_collection.collection.stages == ["$search"]
+
+
+def test_cached_listing_is_read_in_slices(dao, monkeypatch):
+    # 50 products in batches of 5, with the empty final batch, is 11 batches
+    expected = list(dao.iter_products("pear", batch_size=5))
+    assert len(expected) == 11
+
+    reads = []
+    lrange = dao.cache.client.lrange
+    monkeypatch.setattr(dao.cache.client, "lrange", lambda *args: reads.append(args) or lrange(*args))
+
+    assert list(dao.iter_products("pear", batch_size=5)) == expected
+    assert dao.products_collection.collection.stages == ["$search"]
+    assert len(reads) == -(-11 // CACHED_BATCHES_PER_READ)
+
+
+def test_cached_listing_which_expires_part_way_ends(dao):
+    list(dao.iter_products("pear", batch_size=1))
+    cache_key = next(x.decode() for x in dao.cache.client.keys("psb_*"))
+
+    batches = dao.iter_products("pear", batch_size=1)
+    first = [next(batches) for _ in range(CACHED_BATCHES_PER_READ)]
+    dao.cache.client.delete(cache_key)
+
+    assert len(first) == CACHED_BATCHES_PER_READ
+    assert list(batches) == []
@@ -0,0 +1,113 @@
+import fakeredis
+import pytest
+
+from application.constants.app_constants import CONCURRENCY_CACHE_PREFIX, RATE_LIMIT_CACHE_PREFIX, REDIS_VERSION
+from application.data import rate_limiter
+from application.data.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "time", clock.time)
+    return clock
+
+
+@pytest.fixture
+def cache() -> fakeredis.FakeStrictRedis:
+    return fakeredis.FakeStrictRedis(version=REDIS_VERSION)
+
+
+@pytest.fixture
+def limiter(cache) -> RateLimiter:
+    return RateLimiter(cache)
+
+
+def test_burst_is_allowed_then_exhausted(clock, limiter):
+    assert [limiter.allow("export", "1.2.3.4", per_minute=6, burst=3) for _ in range(4)] == [True, True, True, False]
+    assert not limiter.allow("export", "1.2.3.4", per_minute=6, burst=3)
+
+
+def test_buckets_are_per_client_and_endpoint(clock, limiter):
+    assert limiter.allow("export", "1.2.3.4", per_minute=6, burst=1)
+    assert not limiter.allow("export", "1.2.3.4", per_minute=6, burst=1)
+
+    assert limiter.allow("export", "5.6.7.8", per_minute=6, burst=1)
+    assert limiter.allow("login", "1.2.3.4", per_minute=6, burst=1)
+
+
+def test_bucket_refills_at_rate(clock, limiter):
+    for _ in range(3):
+        assert limiter.allow("export", "1.2.3.4", per_minute=6, burst=3)
+    assert not limiter.allow("export", "1.2.3.4", per_minute=6, burst=3)
+
+    # 6 a minute is one token every 10 seconds
+    clock.now += 9
+    assert not limiter.allow("export", "1.2.3.4", per_minute=6, burst=3)
+    clock.now += 1
+    assert limiter.allow("export", "1.2.3.4", per_minute=6, burst=3)
+    assert not limiter.allow("export", "1.2.3.4", per_minute=6, burst=3)
+
+
+def test_bucket_refills_no_further_than_burst(clock, limiter):
+    assert limiter.allow("export", "1.2.3.4", per_minute=6, burst=2)
+
+    clock.now += 3600
+    assert [limiter.allow("export", "1.2.3.4", per_minute=6, burst=2) for _ in range(3)] == [True, True, False]
+
+
+def test_idle_bucket_expires(clock, cache, limiter):
+    limiter.allow("export", "1.2.3.4", per_minute=6, burst=3)
+
+    # Long enough to refill the bucket from empty
+    assert 0 < cache.ttl(f"{RATE_LIMIT_CACHE_PREFIX}export_1.2.3.4") <= 31
+
+
+def test_retry_after_seconds():
+    assert RateLimiter.retry_after_seconds(6) == 10
+    assert RateLimiter.retry_after_seconds(7) == 9
+
+
+def test_concurrency_slots_are_limited_and_released(clock, cache, limiter):
+    with limiter.concurrency_slot("export", max_concurrent=2, timeout_seconds=60) as first:
+        with limiter.concurrency_slot("export", max_concurrent=2, timeout_seconds=60) as second:
+            with limiter.concurrency_slot("export", max_concurrent=2, timeout_seconds=60) as third:
+                assert (first, second, third) == (True, True, False)
+            # A refused request doesn't hold a slot
+            assert cache.zcard(f"{CONCURRENCY_CACHE_PREFIX}export") == 2
+
+        with limiter.concurrency_slot("export", max_concurrent=2, timeout_seconds=60) as fourth:
+            assert fourth
+
+    assert cache.zcard(f"{CONCURRENCY_CACHE_PREFIX}export") == 0
+
+
+def test_concurrency_slot_is_released_on_error(clock, cache, limiter):
+    with pytest.raises(RuntimeError):
+        with limiter.concurrency_slot("export", max_concurrent=1, timeout_seconds=60) as acquired:
+            assert acquired
+            raise RuntimeError("export failed")
+
+    with limiter.concurrency_slot("export", max_concurrent=1, timeout_seconds=60) as acquired:
+        assert acquired
+
+
+def test_abandoned_concurrency_slot_expires(clock, cache, limiter):
+    # A process which dies holding a slot never releases it
+    abandoned = limiter.concurrency_slot("export", max_concurrent=1, timeout_seconds=60)
+    assert abandoned.__enter__()
+
+    with limiter.concurrency_slot("export", max_concurrent=1, timeout_seconds=60) as acquired:
+        assert not acquired
+
+    clock.now += 61
+    with limiter.concurrency_slot("export", max_concurrent=1, timeout_seconds=60) as acquired:
+        assert acquired